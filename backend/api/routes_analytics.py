@@ -0,0 +1,59 @@
+from datetime import date
+from typing import Literal
+from fastapi import APIRouter, HTTPException, Query
+from lib.models import (
+    AnalyticsTotalsResponse,
+    AnalyticsTimeSeriesResponse,
+    LeaderboardResponse,
+    BusiestRoutesResponse,
+)
+from lib.analytics_service import get_totals, get_time_series, get_leaderboard, get_busiest_routes
+
+router = APIRouter()
+
+# All figures come from the rollup tables, bucketed by ride departure (UTC).
+# start/end are inclusive days.
+
+@router.get("/totals", response_model=AnalyticsTotalsResponse)
+def totals(start: date | None = None, end: date | None = None):
+    try:
+        return get_totals(start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/timeseries", response_model=AnalyticsTimeSeriesResponse)
+def timeseries(
+    granularity: Literal["day", "hour"] = "day",
+    start: date | None = None,
+    end: date | None = None,
+    limit: int = Query(default=365, ge=1, le=1000),
+):
+    try:
+        points = get_time_series(granularity, start, end, limit)
+        return AnalyticsTimeSeriesResponse(granularity=granularity, points=points)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/leaderboard", response_model=LeaderboardResponse)
+def leaderboard(
+    metric: str = Query(default="co2_saved_kg"),
+    start: date | None = None,
+    end: date | None = None,
+    limit: int = Query(default=10, ge=1, le=100),
+):
+    try:
+        return LeaderboardResponse(metric=metric, entries=get_leaderboard(metric, start, end, limit))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/routes", response_model=BusiestRoutesResponse)
+def busiest_routes(
+    metric: str = Query(default="bookings"),
+    start: date | None = None,
+    end: date | None = None,
+    limit: int = Query(default=10, ge=1, le=100),
+):
+    try:
+        return BusiestRoutesResponse(metric=metric, routes=get_busiest_routes(metric, start, end, limit))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -1,6 +1,6 @@
 from fastapi import APIRouter, HTTPException, Header
 from pydantic import BaseModel
-from lib.auth_service import login_or_create_user, logout_token
+from lib.auth_service import login_or_create_user, logout_token, rotate_token
 
 router = APIRouter()
 
@@ -20,6 +20,13 @@ def login(req: LoginRequest):
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.post("/refresh")
+def refresh(authorization: str | None = Header(default=None)):
+    try:
+        return rotate_token(authorization)
+    except ValueError as e:
+        raise HTTPException(status_code=401, detail=str(e))
+
 @router.post("/logout")
 def logout(authorization: str | None = Header(default=None)):
     try:
@@ -1,42 +1,56 @@
 from fastapi import APIRouter, HTTPException, Header
 from lib.models import BookingCreateRequest, BookingResponse, BookingListResponse, MessageResponse
-from lib.booking_service import create_booking, cancel_booking, get_user_bookings
-from lib.auth_service import require_user_id
+from lib.booking_service import (
+    create_booking_async,
+    cancel_booking_async,
+    get_user_bookings_async,
+    BookingOwnershipError,
+    SeatConflictError,
+)
+from lib.limits_service import LimitExceededError
+from lib.auth_service import require_user_id_async
 
 router = APIRouter()
 
 @router.post("/", response_model=BookingResponse)
-def book_ride(payload: BookingCreateRequest, authorization: str | None = Header(default=None)):
+async def book_ride(payload: BookingCreateRequest, authorization: str | None = Header(default=None)):
     try:
-        user_id = require_user_id(authorization)
+        user_id = await require_user_id_async(authorization)
         payload.rider_id = user_id
-        return create_booking(payload)
+        return await create_booking_async(payload)
+    except LimitExceededError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except SeatConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.delete("/{booking_id}", response_model=MessageResponse)
-def cancel(booking_id: int, authorization: str | None = Header(default=None)):
+async def cancel(booking_id: int, authorization: str | None = Header(default=None)):
     try:
-        # (Optional) You can enforce “only owner can cancel” later
-        require_user_id(authorization)
-        cancel_booking(booking_id)
+        user_id = await require_user_id_async(authorization)
+        await cancel_booking_async(booking_id, user_id)
         return MessageResponse(message="Booking cancelled successfully")
+    except LimitExceededError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except BookingOwnershipError as e:
+        raise HTTPException(status_code=403, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/me", response_model=BookingListResponse)
-def my_bookings(authorization: str | None = Header(default=None)):
+async def my_bookings(authorization: str | None = Header(default=None)):
     try:
-        user_id = require_user_id(authorization)
-        bookings = get_user_bookings(user_id)
+        user_id = await require_user_id_async(authorization)
+        bookings = await get_user_bookings_async(user_id)
         return BookingListResponse(bookings=bookings)
     except ValueError as e:
         raise HTTPException(status_code=401, detail=str(e))
 
 @router.get("/user/{user_id}", response_model=BookingListResponse)
-def user_bookings(user_id: int):
+async def user_bookings(user_id: int):
     try:
-        bookings = get_user_bookings(user_id)
+        bookings = await get_user_bookings_async(user_id)
         return BookingListResponse(bookings=bookings)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
@@ -1,32 +1,169 @@
-from fastapi import APIRouter, HTTPException, Header
-from lib.models import NotificationListResponse, MessageResponse
-from lib.notification_service import get_user_notifications, mark_notification_read
-from lib.auth_service import require_user_id
+import asyncio
+import json
+from fastapi import APIRouter, HTTPException, Header, Query, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from lib.models import NotificationListResponse, MessageResponse, UnreadCountResponse
+from lib.notification_service import (
+    attach_hub_feed_async,
+    get_user_notifications_async,
+    get_notifications_since_async,
+    get_unread_count_async,
+    mark_notification_read_async,
+    mark_all_notifications_read_async,
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+)
+from lib.auth_service import require_user_id_async
+from lib.pubsub import get_broker, user_channel
 
 router = APIRouter()
 
+SSE_HEARTBEAT_SECONDS = 15.0
+LONG_POLL_MAX_SECONDS = 30.0
+
+
+async def _require_user_id_async(authorization: str | None) -> int:
+    try:
+        return await require_user_id_async(authorization)
+    except ValueError as e:
+        raise HTTPException(status_code=401, detail=str(e))
+
+
+def _sse_event(n: dict) -> str:
+    return f"id: {n['id']}\nevent: notification\ndata: {json.dumps(jsonable_encoder(n))}\n\n"
+
 @router.get("/me", response_model=NotificationListResponse)
-def my_notifications(authorization: str | None = Header(default=None)):
+async def my_notifications(
+    authorization: str | None = Header(default=None),
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = Query(default=None),
+    unread_only: bool = Query(default=False),
+):
+    user_id = await _require_user_id_async(authorization)
     try:
-        user_id = require_user_id(authorization)
-        notifications = get_user_notifications(user_id)
-        return NotificationListResponse(notifications=notifications)
+        notifications, next_cursor = await get_user_notifications_async(user_id, limit, cursor, unread_only)
+        return NotificationListResponse(notifications=notifications, next_cursor=next_cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/me/unread_count", response_model=UnreadCountResponse)
+async def my_unread_count(authorization: str | None = Header(default=None)):
+    try:
+        user_id = await require_user_id_async(authorization)
+        return UnreadCountResponse(unread_count=await get_unread_count_async(user_id))
+    except ValueError as e:
+        raise HTTPException(status_code=401, detail=str(e))
+
+@router.post("/me/read_all", response_model=MessageResponse)
+async def mark_all_read(
+    authorization: str | None = Header(default=None),
+    up_to_id: int | None = Query(default=None, description="Only mark notifications with id <= up_to_id"),
+):
+    try:
+        user_id = await require_user_id_async(authorization)
+        count = await mark_all_notifications_read_async(user_id, up_to_id)
+        return MessageResponse(message=f"{count} notifications marked as read")
     except ValueError as e:
         raise HTTPException(status_code=401, detail=str(e))
 
+@router.get("/me/stream")
+async def stream_notifications(
+    request: Request,
+    authorization: str | None = Header(default=None),
+    since_id: int | None = Query(default=None, description="Replay notifications after this id first"),
+    last_event_id: str | None = Header(default=None),
+):
+    """
+    Server-Sent Events: pushes new notifications as they are delivered.
+    Reconnecting clients resume from Last-Event-ID (or since_id).
+    """
+    user_id = await _require_user_id_async(authorization)
+    if last_event_id and last_event_id.isdigit():
+        since_id = int(last_event_id)
+
+    async def events():
+        # subscribe before catching up so nothing slips between the two
+        sub = get_broker().subscribe(user_channel(user_id))
+        try:
+            newest = await attach_hub_feed_async()
+            # the id this stream is current to: replay from since_id, else
+            # start at the newest notification (a lagged queue resyncs from it)
+            last_id = newest if since_id is None else since_id
+            replay = since_id is not None
+            while not await request.is_disconnected():
+                while replay or sub.lagged:
+                    sub.lagged = False
+                    missed = await get_notifications_since_async(user_id, last_id)
+                    for n in missed:
+                        yield _sse_event(n)
+                        last_id = n["id"]
+                    # a full page: there may be more
+                    replay = len(missed) == MAX_PAGE_SIZE
+                try:
+                    n = await sub.get(timeout=SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if n["id"] <= last_id:
+                    continue
+                yield _sse_event(n)
+                last_id = n["id"]
+        finally:
+            sub.close()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/me/poll", response_model=NotificationListResponse)
+async def poll_notifications(
+    since_id: int = Query(..., ge=0),
+    timeout: float = Query(default=25.0, gt=0, le=LONG_POLL_MAX_SECONDS),
+    authorization: str | None = Header(default=None),
+):
+    """
+    Long-poll fallback: returns notifications newer than since_id right away,
+    otherwise waits up to `timeout` seconds for the next one.
+    """
+    user_id = await _require_user_id_async(authorization)
+    sub = get_broker().subscribe(user_channel(user_id))
+    try:
+        await attach_hub_feed_async()
+        pending = await get_notifications_since_async(user_id, since_id)
+        if pending:
+            return NotificationListResponse(notifications=pending)
+        try:
+            await sub.get(timeout=timeout)
+        except asyncio.TimeoutError:
+            return NotificationListResponse(notifications=[])
+        # pick up anything else delivered in the same burst
+        return NotificationListResponse(
+            notifications=await get_notifications_since_async(user_id, since_id)
+        )
+    finally:
+        sub.close()
+
 @router.get("/user/{user_id}", response_model=NotificationListResponse)
-def list_notifications(user_id: int):
+async def list_notifications(
+    user_id: int,
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = Query(default=None),
+    unread_only: bool = Query(default=False),
+):
     try:
-        notifications = get_user_notifications(user_id)
-        return NotificationListResponse(notifications=notifications)
+        notifications, next_cursor = await get_user_notifications_async(user_id, limit, cursor, unread_only)
+        return NotificationListResponse(notifications=notifications, next_cursor=next_cursor)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
 
 @router.post("/{notification_id}/read", response_model=MessageResponse)
-def mark_read(notification_id: int, authorization: str | None = Header(default=None)):
+async def mark_read(notification_id: int, authorization: str | None = Header(default=None)):
     try:
-        require_user_id(authorization)
-        mark_notification_read(notification_id)
+        await require_user_id_async(authorization)
+        await mark_notification_read_async(notification_id)
         return MessageResponse(message="Notification marked as read")
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
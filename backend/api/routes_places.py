@@ -0,0 +1,13 @@
+from fastapi import APIRouter, Query
+from lib.models import PlaceListResponse
+from lib.place_service import autocomplete_places, DEFAULT_AUTOCOMPLETE_LIMIT, MAX_AUTOCOMPLETE_LIMIT
+
+router = APIRouter()
+
+@router.get("/autocomplete", response_model=PlaceListResponse)
+async def autocomplete(
+    q: str = Query(..., min_length=1, max_length=120),
+    limit: int = Query(default=DEFAULT_AUTOCOMPLETE_LIMIT, ge=1, le=MAX_AUTOCOMPLETE_LIMIT),
+):
+    # served from the in-memory gazetteer, no DB round trip
+    return PlaceListResponse(places=autocomplete_places(q, limit))
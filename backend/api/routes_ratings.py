@@ -1,28 +1,35 @@
-from fastapi import APIRouter, HTTPException, Header
-from lib.models import RatingCreateRequest, RatingSummaryResponse, MessageResponse
-from lib.rating_service import submit_rating, get_driver_rating_summary
-from lib.auth_service import require_user_id
-from lib.ride_service import get_ride_by_id
+from fastapi import APIRouter, HTTPException, Header, Query
+from lib.models import RatingCreateRequest, RatingSummaryResponse, TopDriversResponse, MessageResponse
+from lib.rating_service import submit_rating_async, get_driver_rating_summary_async, get_top_drivers_async
+from lib.auth_service import require_user_id_async
+from lib.ride_service import get_ride_by_id_async
 
 router = APIRouter()
 
 @router.post("/", response_model=MessageResponse)
-def rate_driver(payload: RatingCreateRequest, authorization: str | None = Header(default=None)):
+async def rate_driver(payload: RatingCreateRequest, authorization: str | None = Header(default=None)):
     try:
-        user_id = require_user_id(authorization)
+        user_id = await require_user_id_async(authorization)
         payload.rater_id = user_id
 
-        ride = get_ride_by_id(int(payload.ride_id))
+        ride = await get_ride_by_id_async(int(payload.ride_id))
         payload.driver_id = int(ride["driver_id"])
 
-        submit_rating(payload)
+        await submit_rating_async(payload)
         return MessageResponse(message="Rating submitted successfully")
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@router.get("/driver/{driver_id}", response_model=RatingSummaryResponse)
-def driver_rating(driver_id: int):
+@router.get("/driver/{driver_id}", response_model=RatingSummaryResponse, response_model_exclude_none=True)
+async def driver_rating(driver_id: int, smoothed: bool = False):
     try:
-        return get_driver_rating_summary(driver_id)
+        return await get_driver_rating_summary_async(driver_id, smoothed=smoothed)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
+
+@router.get("/top", response_model=TopDriversResponse)
+async def top_drivers(
+    limit: int = Query(default=10, ge=1, le=100),
+    min_ratings: int = Query(default=1, ge=1),
+):
+    return TopDriversResponse(drivers=await get_top_drivers_async(limit=limit, min_ratings=min_ratings))
@@ -1,30 +1,69 @@
+from datetime import datetime
 from fastapi import APIRouter, HTTPException, Query, Header
-from lib.models import RideCreateRequest, RideResponse, RideListResponse
-from lib.ride_service import create_ride, search_rides, get_ride_by_id
-from lib.auth_service import require_user_id
+from lib.models import RideCreateRequest, RideResponse, RideListResponse, NearbyRideListResponse
+from lib.ride_service import (
+    create_ride_async,
+    search_rides_async,
+    search_rides_nearby_async,
+    get_ride_by_id_async,
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    DEFAULT_NEARBY_RADIUS_KM,
+    MAX_NEARBY_RADIUS_KM,
+)
+from lib.auth_service import require_user_id_async
 
 router = APIRouter()
 
 @router.post("/", response_model=RideResponse)
-def post_ride(payload: RideCreateRequest, authorization: str | None = Header(default=None)):
+async def post_ride(payload: RideCreateRequest, authorization: str | None = Header(default=None)):
     try:
-        user_id = require_user_id(authorization)
+        user_id = await require_user_id_async(authorization)
         payload.driver_id = user_id  # override, prevents spoofing
-        return create_ride(payload)
+        return await create_ride_async(payload)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/search", response_model=RideListResponse)
-def search(from_q: str = Query(..., min_length=1), to_q: str = Query(..., min_length=1)):
+async def search(
+    from_q: str = Query(..., min_length=1),
+    to_q: str = Query(..., min_length=1),
+    depart_after: datetime | None = Query(default=None, description="Defaults to now"),
+    depart_before: datetime | None = Query(default=None),
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = Query(default=None),
+):
     try:
-        rides = search_rides(from_q, to_q)
-        return RideListResponse(rides=rides)
+        rides, next_cursor = await search_rides_async(from_q, to_q, depart_after, depart_before, limit, cursor)
+        return RideListResponse(rides=rides, next_cursor=next_cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/nearby", response_model=NearbyRideListResponse)
+async def nearby(
+    from_lat: float = Query(..., ge=-90, le=90),
+    from_lon: float = Query(..., ge=-180, le=180),
+    to_lat: float = Query(..., ge=-90, le=90),
+    to_lon: float = Query(..., ge=-180, le=180),
+    radius_km: float = Query(default=DEFAULT_NEARBY_RADIUS_KM, gt=0, le=MAX_NEARBY_RADIUS_KM),
+    depart_after: datetime | None = Query(default=None, description="Defaults to now"),
+    depart_before: datetime | None = Query(default=None),
+    depart_at: datetime | None = Query(default=None, description="Preferred departure; defaults to depart_after"),
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = Query(default=None),
+):
+    try:
+        rides, next_cursor = await search_rides_nearby_async(
+            from_lat, from_lon, to_lat, to_lon, radius_km,
+            depart_after, depart_before, depart_at, limit, cursor,
+        )
+        return NearbyRideListResponse(rides=rides, next_cursor=next_cursor)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/{ride_id}", response_model=RideResponse)
-def ride_detail(ride_id: int):
+async def ride_detail(ride_id: int):
     try:
-        return get_ride_by_id(ride_id)
+        return await get_ride_by_id_async(ride_id)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
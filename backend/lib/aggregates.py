@@ -0,0 +1,526 @@
+from __future__ import annotations
+
+import sqlite3
+from collections import Counter, defaultdict
+from datetime import timezone
+from typing import Any, Dict, List, Tuple
+
+from .co2_service import (
+    EMISSION_FACTORS_JOIN,
+    create_emission_factors,
+    estimate_co2_saved_g,
+    estimate_co2_saved_g_batch,
+    ride_co2_saved_g_sql,
+    ride_passengers,
+)
+from .search_service import normalize_place
+from .utils import parse_iso_datetime, utc_iso
+
+STAR_LEVELS = (1, 2, 3, 4, 5)
+
+_STAR_COLUMNS = ", ".join(f"stars_{s}" for s in STAR_LEVELS)
+
+# driver stats recomputed from scratch, in _STAR_COLUMNS order
+_DRIVER_RATING_STATS_SOURCE = (
+    "SELECT driver_id, COUNT(*), SUM(stars), "
+    + ", ".join(f"SUM(CASE WHEN stars = {s} THEN 1 ELSE 0 END)" for s in STAR_LEVELS)
+    + " FROM ratings GROUP BY driver_id"
+)
+
+
+# -------------------------------------------------
+# Driver rating stats
+# -------------------------------------------------
+def create_driver_rating_stats(con: sqlite3.Connection) -> None:
+    """
+    Migration step: one row per rated driver, kept current by submit_rating
+    in the same transaction as the rating insert.
+    """
+    star_cols = ",\n".join(f"            stars_{s} INTEGER NOT NULL DEFAULT 0" for s in STAR_LEVELS)
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS driver_rating_stats (
+            driver_id INTEGER PRIMARY KEY,
+            ratings_count INTEGER NOT NULL DEFAULT 0,
+            stars_sum INTEGER NOT NULL DEFAULT 0,
+{star_cols},
+            updated_at TEXT NOT NULL,
+            FOREIGN KEY(driver_id) REFERENCES users(id)
+        )
+    """)
+    rebuild_driver_rating_stats(con)
+
+
+def apply_rating(con: sqlite3.Connection, driver_id: int, stars: int) -> None:
+    """
+    Fold one new rating into the driver's stats row (caller owns the transaction).
+    """
+    flags = [1 if stars == s else 0 for s in STAR_LEVELS]
+    con.execute(
+        f"""
+        INSERT INTO driver_rating_stats (driver_id, ratings_count, stars_sum, {_STAR_COLUMNS}, updated_at)
+        VALUES (?, 1, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(driver_id) DO UPDATE SET
+            ratings_count = driver_rating_stats.ratings_count + 1,
+            stars_sum = driver_rating_stats.stars_sum + excluded.stars_sum,
+            {", ".join(f"stars_{s} = driver_rating_stats.stars_{s} + excluded.stars_{s}" for s in STAR_LEVELS)},
+            updated_at = excluded.updated_at
+        """,
+        (int(driver_id), int(stars), *flags, utc_iso()),
+    )
+
+
+def rebuild_driver_rating_stats(con: sqlite3.Connection) -> int:
+    """
+    Recompute every row from the ratings table. Returns the number of drivers.
+    """
+    con.execute("DELETE FROM driver_rating_stats")
+    cur = con.execute(
+        f"""
+        INSERT INTO driver_rating_stats (driver_id, ratings_count, stars_sum, {_STAR_COLUMNS}, updated_at)
+        SELECT src.*, ? FROM ({_DRIVER_RATING_STATS_SOURCE}) AS src
+        """,
+        (utc_iso(),),
+    )
+    return cur.rowcount
+
+
+def diff_driver_rating_stats(con: sqlite3.Connection) -> List[Dict[str, Any]]:
+    """
+    Drivers whose stored stats disagree with the ratings table.
+    Each entry has the driver id plus the stored and expected tuples
+    (count, sum, stars_1..stars_5); a missing side is None.
+    """
+    expected = {
+        int(r[0]): tuple(int(v) for v in r[1:])
+        for r in con.execute(_DRIVER_RATING_STATS_SOURCE).fetchall()
+    }
+    stored = {
+        int(r[0]): tuple(int(v) for v in r[1:])
+        for r in con.execute(
+            f"SELECT driver_id, ratings_count, stars_sum, {_STAR_COLUMNS} FROM driver_rating_stats"
+        ).fetchall()
+    }
+    mismatches = []
+    for driver_id in sorted(expected.keys() | stored.keys()):
+        want = expected.get(driver_id)
+        have = stored.get(driver_id)
+        if want != have:
+            mismatches.append({"driver_id": driver_id, "stored": have, "expected": want})
+    return mismatches
+
+
+# -------------------------------------------------
+# User profile stats
+# -------------------------------------------------
+# CO2 is kept in whole grams (estimate_co2_saved_g rounds half-up) so
+# the running total never drifts from the from-scratch sum.
+# A confirmed booking is worth the saving at its ride's *current* passenger
+# count, so a booking or cancellation re-prices the other bookings on that
+# ride. Changing the emission factors in config needs a rebuild.
+
+def create_user_stats(con: sqlite3.Connection) -> None:
+    """
+    Migration step: one row per user with activity, backfilled from history.
+    """
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS user_stats (
+            user_id INTEGER PRIMARY KEY,
+            rides_posted INTEGER NOT NULL DEFAULT 0,
+            rides_taken INTEGER NOT NULL DEFAULT 0,
+            co2_saved_g INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT NOT NULL,
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        )
+    """)
+    # the backfill estimates CO2 in SQL (the table's own migration is later)
+    create_emission_factors(con)
+    rebuild_user_stats(con)
+
+
+def bump_user_stats(
+    con: sqlite3.Connection,
+    user_id: int,
+    rides_posted: int = 0,
+    rides_taken: int = 0,
+    co2_saved_g: int = 0,
+) -> None:
+    con.execute(
+        """
+        INSERT INTO user_stats (user_id, rides_posted, rides_taken, co2_saved_g, updated_at)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET
+            rides_posted = user_stats.rides_posted + excluded.rides_posted,
+            rides_taken = user_stats.rides_taken + excluded.rides_taken,
+            co2_saved_g = user_stats.co2_saved_g + excluded.co2_saved_g,
+            updated_at = excluded.updated_at
+        """,
+        (int(user_id), int(rides_posted), int(rides_taken), int(co2_saved_g), utc_iso()),
+    )
+
+
+def _reprice_ride(con: sqlite3.Connection, ride, exclude_booking_id: int, old_passengers: int, new_passengers: int) -> None:
+    delta = (
+        estimate_co2_saved_g(ride["distance_km"], ride["vehicle_type"], new_passengers)
+        - estimate_co2_saved_g(ride["distance_km"], ride["vehicle_type"], old_passengers)
+    )
+    if delta == 0:
+        return
+    rows = con.execute(
+        """
+        SELECT rider_id, COUNT(*) AS n FROM bookings
+        WHERE ride_id=? AND status='CONFIRMED' AND id != ?
+        GROUP BY rider_id
+        """,
+        (int(ride["id"]), int(exclude_booking_id)),
+    ).fetchall()
+    for r in rows:
+        bump_user_stats(con, int(r["rider_id"]), co2_saved_g=delta * int(r["n"]))
+
+
+def record_booking_confirmed(con: sqlite3.Connection, ride, booking_id: int, rider_id: int, seats: int, passengers_total: int) -> None:
+    """
+    Call after the booking row exists; `passengers_total` is the count
+    including the new booking's seats.
+    """
+    _reprice_ride(con, ride, booking_id, passengers_total - int(seats), passengers_total)
+    bump_user_stats(
+        con, rider_id, rides_taken=1,
+        co2_saved_g=estimate_co2_saved_g(ride["distance_km"], ride["vehicle_type"], passengers_total),
+    )
+
+
+def record_booking_cancelled(con: sqlite3.Connection, ride, booking_id: int, rider_id: int, seats: int, passengers_total: int) -> None:
+    """
+    Call after the booking is marked cancelled; `passengers_total` is the
+    count before the cancellation released its seats.
+    """
+    _reprice_ride(con, ride, booking_id, passengers_total, passengers_total - int(seats))
+    bump_user_stats(
+        con, rider_id, rides_taken=-1,
+        co2_saved_g=-estimate_co2_saved_g(ride["distance_km"], ride["vehicle_type"], passengers_total),
+    )
+
+
+def _user_stats_from_source(con: sqlite3.Connection) -> Dict[int, Tuple[int, int, int]]:
+    rows = con.execute(
+        f"""
+        SELECT user_id, SUM(posted), SUM(taken), SUM(co2_g) FROM (
+            SELECT driver_id AS user_id, 1 AS posted, 0 AS taken, 0 AS co2_g
+            FROM rides
+            UNION ALL
+            SELECT b.rider_id, 0, 1, {ride_co2_saved_g_sql()}
+            FROM bookings b
+            JOIN rides r ON r.id = b.ride_id
+            {EMISSION_FACTORS_JOIN}
+            WHERE b.status='CONFIRMED'
+        ) activity
+        GROUP BY user_id
+        """
+    ).fetchall()
+    return {int(r[0]): (int(r[1]), int(r[2]), int(r[3])) for r in rows}
+
+
+def rebuild_user_stats(con: sqlite3.Connection) -> int:
+    """
+    Recompute every row from rides and bookings. Returns the number of users.
+    """
+    source = _user_stats_from_source(con)
+    now = utc_iso()
+    con.execute("DELETE FROM user_stats")
+    con.executemany(
+        "INSERT INTO user_stats (user_id, rides_posted, rides_taken, co2_saved_g, updated_at) VALUES (?, ?, ?, ?, ?)",
+        [(user_id, *values, now) for user_id, values in source.items()],
+    )
+    return len(source)
+
+
+def diff_user_stats(con: sqlite3.Connection) -> List[Dict[str, Any]]:
+    """
+    Users whose stored stats disagree with rides/bookings. Tuples are
+    (rides_posted, rides_taken, co2_saved_g); all-zero rows equal no row.
+    """
+    zero = (0, 0, 0)
+    expected = _user_stats_from_source(con)
+    stored = {
+        int(r[0]): tuple(int(v) for v in r[1:])
+        for r in con.execute("SELECT user_id, rides_posted, rides_taken, co2_saved_g FROM user_stats")
+    }
+    mismatches = []
+    for user_id in sorted(expected.keys() | stored.keys()):
+        want = expected.get(user_id, zero)
+        have = stored.get(user_id, zero)
+        if want != have:
+            mismatches.append({"user_id": user_id, "stored": have, "expected": want})
+    return mismatches
+
+
+# -------------------------------------------------
+# Analytics rollups
+# -------------------------------------------------
+# Rides are bucketed by departure time (UTC hour / day). Triggers mark a ride
+# dirty whenever it or one of its bookings changes; roll_up_dirty_rides()
+# recomputes each dirty ride's contribution, subtracts the previous one kept
+# in analytics_ride_facts / analytics_ride_riders and adds the difference to
+# the rollup tables, so analytics reads never touch rides or bookings.
+
+ROLLUP_METRICS = ("rides_offered", "rides_shared", "bookings", "seats_offered", "seats_booked", "co2_saved_g")
+USER_ROLLUP_METRICS = ("rides_driven", "seats_filled", "rides_taken", "co2_saved_g")
+
+# rollup table -> key columns
+ROLLUP_KEYS = {
+    "analytics_hourly": ("hour",),
+    "analytics_daily": ("day",),
+    "analytics_route_daily": ("day", "from_key", "to_key"),
+    "analytics_user_daily": ("day", "user_id"),
+}
+
+_ROLLUP_TABLES = tuple(ROLLUP_KEYS) + ("analytics_ride_facts", "analytics_ride_riders")
+
+
+def _metric_columns(metrics: Tuple[str, ...]) -> str:
+    return ",\n".join(f"            {m} INTEGER NOT NULL DEFAULT 0" for m in metrics)
+
+
+def create_analytics_rollups(con: sqlite3.Connection) -> None:
+    """
+    Migration step: rollup tables, per-ride contribution snapshots, the dirty
+    queue with its triggers, and every existing ride queued for the first run.
+    """
+    metrics = _metric_columns(ROLLUP_METRICS)
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS analytics_hourly (
+            hour TEXT PRIMARY KEY,                   -- "YYYY-MM-DDTHH" (UTC)
+{metrics}
+        )
+    """)
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS analytics_daily (
+            day TEXT PRIMARY KEY,                    -- "YYYY-MM-DD" (UTC)
+{metrics}
+        )
+    """)
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS analytics_route_daily (
+            day TEXT NOT NULL,
+            from_key TEXT NOT NULL,
+            to_key TEXT NOT NULL,
+{metrics},
+            PRIMARY KEY (day, from_key, to_key)
+        )
+    """)
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS analytics_user_daily (
+            day TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+{_metric_columns(USER_ROLLUP_METRICS)},
+            PRIMARY KEY (day, user_id)
+        )
+    """)
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS analytics_ride_facts (
+            ride_id INTEGER PRIMARY KEY,
+            hour TEXT NOT NULL,
+            day TEXT NOT NULL,
+            from_key TEXT NOT NULL,
+            to_key TEXT NOT NULL,
+            driver_id INTEGER NOT NULL,
+{metrics}
+        )
+    """)
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS analytics_ride_riders (
+            ride_id INTEGER NOT NULL,
+            rider_id INTEGER NOT NULL,
+            bookings INTEGER NOT NULL,
+            co2_saved_g INTEGER NOT NULL,
+            PRIMARY KEY (ride_id, rider_id)
+        )
+    """)
+    con.execute("CREATE TABLE IF NOT EXISTS analytics_dirty_rides (ride_id INTEGER PRIMARY KEY)")
+
+    con.execute("""
+        CREATE TRIGGER IF NOT EXISTS analytics_rides_ai AFTER INSERT ON rides BEGIN
+            INSERT INTO analytics_dirty_rides (ride_id) VALUES (new.id) ON CONFLICT (ride_id) DO NOTHING;
+        END
+    """)
+    con.execute("""
+        CREATE TRIGGER IF NOT EXISTS analytics_rides_au AFTER UPDATE ON rides BEGIN
+            INSERT INTO analytics_dirty_rides (ride_id) VALUES (new.id) ON CONFLICT (ride_id) DO NOTHING;
+        END
+    """)
+    con.execute("""
+        CREATE TRIGGER IF NOT EXISTS analytics_rides_ad AFTER DELETE ON rides BEGIN
+            INSERT INTO analytics_dirty_rides (ride_id) VALUES (old.id) ON CONFLICT (ride_id) DO NOTHING;
+        END
+    """)
+    con.execute("""
+        CREATE TRIGGER IF NOT EXISTS analytics_bookings_ai AFTER INSERT ON bookings BEGIN
+            INSERT INTO analytics_dirty_rides (ride_id) VALUES (new.ride_id) ON CONFLICT (ride_id) DO NOTHING;
+        END
+    """)
+    con.execute("""
+        CREATE TRIGGER IF NOT EXISTS analytics_bookings_au AFTER UPDATE OF status ON bookings BEGIN
+            INSERT INTO analytics_dirty_rides (ride_id) VALUES (new.ride_id) ON CONFLICT (ride_id) DO NOTHING;
+        END
+    """)
+    # "WHERE true" lets SQLite parse INSERT ... SELECT ... ON CONFLICT
+    con.execute("INSERT INTO analytics_dirty_rides (ride_id) SELECT id FROM rides WHERE true ON CONFLICT (ride_id) DO NOTHING")
+
+
+def reset_analytics_rollups(con: sqlite3.Connection) -> None:
+    """
+    Empty every rollup and queue all rides, so the next roll-up rebuilds
+    from scratch (e.g. after changing emission factors).
+    """
+    for table in _ROLLUP_TABLES:
+        con.execute(f"DELETE FROM {table}")
+    con.execute("INSERT INTO analytics_dirty_rides (ride_id) SELECT id FROM rides WHERE true ON CONFLICT (ride_id) DO NOTHING")
+
+
+def pending_rollup_rides(con: sqlite3.Connection) -> int:
+    return int(con.execute("SELECT COUNT(*) FROM analytics_dirty_rides").fetchone()[0])
+
+
+def time_buckets(depart_time: str) -> Tuple[str, str]:
+    """
+    (day, hour) UTC bucket keys for a stored departure time.
+    """
+    dt = parse_iso_datetime(depart_time)
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc)
+    return dt.strftime("%Y-%m-%d"), dt.strftime("%Y-%m-%dT%H")
+
+
+def _ride_fact(ride, riders: Dict[int, int], per_booking: int) -> Tuple[Dict[str, Any], Dict[int, Tuple[int, int]]]:
+    """
+    `per_booking` is the CO2 (g) one booking on this ride saves.
+    """
+    seats_total = int(ride["seats_total"])
+    seats_booked = max(seats_total - int(ride["seats_left"]), 0)
+    bookings = sum(riders.values())
+    day, hour = time_buckets(ride["depart_time"])
+    fact = {
+        "ride_id": int(ride["id"]),
+        "hour": hour,
+        "day": day,
+        "from_key": normalize_place(ride["from_text"]),
+        "to_key": normalize_place(ride["to_text"]),
+        "driver_id": int(ride["driver_id"]),
+        "rides_offered": 1,
+        "rides_shared": 1 if bookings else 0,
+        "bookings": bookings,
+        "seats_offered": seats_total,
+        "seats_booked": seats_booked,
+        "co2_saved_g": per_booking * bookings,
+    }
+    return fact, {rider_id: (n, per_booking * n) for rider_id, n in riders.items()}
+
+
+def _contribute(
+    acc: Dict[Tuple[str, Tuple[Any, ...]], Counter],
+    fact: Dict[str, Any],
+    riders: Dict[int, Tuple[int, int]],
+    sign: int,
+) -> None:
+    metrics = {m: sign * int(fact[m]) for m in ROLLUP_METRICS}
+    acc[("analytics_hourly", (fact["hour"],))].update(metrics)
+    acc[("analytics_daily", (fact["day"],))].update(metrics)
+    acc[("analytics_route_daily", (fact["day"], fact["from_key"], fact["to_key"]))].update(metrics)
+    acc[("analytics_user_daily", (fact["day"], fact["driver_id"]))].update(
+        {"rides_driven": sign, "seats_filled": sign * int(fact["seats_booked"])}
+    )
+    for rider_id, (bookings, co2_g) in riders.items():
+        acc[("analytics_user_daily", (fact["day"], rider_id))].update(
+            {"rides_taken": sign * bookings, "co2_saved_g": sign * co2_g}
+        )
+
+
+def _flush_rollups(con: sqlite3.Connection, acc: Dict[Tuple[str, Tuple[Any, ...]], Counter]) -> None:
+    for (table, key), deltas in acc.items():
+        deltas = {m: v for m, v in deltas.items() if v}
+        if not deltas:
+            continue
+        key_cols = ROLLUP_KEYS[table]
+        cols = key_cols + tuple(deltas)
+        con.execute(
+            f"""
+            INSERT INTO {table} ({", ".join(cols)}) VALUES ({", ".join("?" * len(cols))})
+            ON CONFLICT({", ".join(key_cols)}) DO UPDATE SET
+                {", ".join(f"{m} = {table}.{m} + excluded.{m}" for m in deltas)}
+            """,
+            (*key, *deltas.values()),
+        )
+
+
+def roll_up_dirty_rides(con: sqlite3.Connection, limit: int) -> int:
+    """
+    Fold up to `limit` dirty rides into the rollups (caller owns the
+    transaction). Returns how many rides were processed.
+    """
+    ids = [int(r[0]) for r in con.execute(
+        "SELECT ride_id FROM analytics_dirty_rides ORDER BY ride_id LIMIT ?", (int(limit),)
+    )]
+    if not ids:
+        return 0
+    marks = ", ".join("?" * len(ids))
+
+    rides = {int(r["id"]): r for r in con.execute(f"SELECT * FROM rides WHERE id IN ({marks})", ids)}
+    riders: Dict[int, Dict[int, int]] = {}
+    for r in con.execute(
+        f"""
+        SELECT ride_id, rider_id, COUNT(*) AS n FROM bookings
+        WHERE status='CONFIRMED' AND ride_id IN ({marks})
+        GROUP BY ride_id, rider_id
+        """,
+        ids,
+    ):
+        riders.setdefault(int(r["ride_id"]), {})[int(r["rider_id"])] = int(r["n"])
+    old_facts = {
+        int(r["ride_id"]): dict(r)
+        for r in con.execute(f"SELECT * FROM analytics_ride_facts WHERE ride_id IN ({marks})", ids)
+    }
+    old_riders: Dict[int, Dict[int, Tuple[int, int]]] = {}
+    for r in con.execute(f"SELECT * FROM analytics_ride_riders WHERE ride_id IN ({marks})", ids):
+        old_riders.setdefault(int(r["ride_id"]), {})[int(r["rider_id"])] = (int(r["bookings"]), int(r["co2_saved_g"]))
+
+    present = [rides[i] for i in ids if i in rides]
+    per_booking = dict(zip(
+        (int(r["id"]) for r in present),
+        estimate_co2_saved_g_batch(
+            [float(r["distance_km"]) for r in present],
+            [r["vehicle_type"] for r in present],
+            [ride_passengers(r["seats_total"], r["seats_left"]) for r in present],
+        ),
+    ))
+
+    acc: Dict[Tuple[str, Tuple[Any, ...]], Counter] = defaultdict(Counter)
+    new_fact_rows = []
+    new_rider_rows = []
+    for ride_id in ids:
+        old = old_facts.get(ride_id)
+        if old is not None:
+            _contribute(acc, old, old_riders.get(ride_id, {}), -1)
+        ride = rides.get(ride_id)
+        if ride is None:
+            continue
+        fact, fact_riders = _ride_fact(ride, riders.get(ride_id, {}), per_booking[ride_id])
+        _contribute(acc, fact, fact_riders, +1)
+        new_fact_rows.append(fact)
+        new_rider_rows.extend((ride_id, rider_id, n, co2_g) for rider_id, (n, co2_g) in fact_riders.items())
+
+    _flush_rollups(con, acc)
+
+    con.execute(f"DELETE FROM analytics_ride_facts WHERE ride_id IN ({marks})", ids)
+    con.execute(f"DELETE FROM analytics_ride_riders WHERE ride_id IN ({marks})", ids)
+    if new_fact_rows:
+        cols = tuple(new_fact_rows[0])
+        con.executemany(
+            f"INSERT INTO analytics_ride_facts ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})",
+            [tuple(f[c] for c in cols) for f in new_fact_rows],
+        )
+    con.executemany(
+        "INSERT INTO analytics_ride_riders (ride_id, rider_id, bookings, co2_saved_g) VALUES (?, ?, ?, ?)",
+        new_rider_rows,
+    )
+    con.execute(f"DELETE FROM analytics_dirty_rides WHERE ride_id IN ({marks})", ids)
+    return len(ids)
@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from .aggregates import ROLLUP_METRICS, pending_rollup_rides, reset_analytics_rollups, roll_up_dirty_rides
+from .background import PeriodicTask
+from .db import connection, run_write
+from .settings import settings
+from .utils import utc_iso
+
+MAX_SERIES_POINTS = 1000
+MAX_LEADERBOARD_SIZE = 100
+
+# public metric name -> analytics_user_daily column
+LEADERBOARD_METRICS = {
+    "co2_saved_kg": "co2_saved_g",
+    "rides_taken": "rides_taken",
+    "rides_driven": "rides_driven",
+    "seats_filled": "seats_filled",
+}
+ROUTE_METRICS = ("bookings", "seats_booked", "rides_offered", "co2_saved_kg")
+
+_last_rollup_at: Optional[str] = None
+
+
+# -------------------------------------------------
+# Incremental roll-up job
+# -------------------------------------------------
+def run_rollup(batch_size: Optional[int] = None) -> int:
+    """
+    Fold every dirty ride into the rollups, one write job per batch so
+    request writes interleave with a long catch-up. Returns the number of
+    rides processed.
+    """
+    global _last_rollup_at
+    batch_size = max(int(batch_size or settings.ANALYTICS_ROLLUP_BATCH_SIZE), 1)
+    processed = 0
+    while True:
+        n = run_write(roll_up_dirty_rides, batch_size)
+        processed += n
+        if n < batch_size:
+            break
+    _last_rollup_at = utc_iso()
+    return processed
+
+
+def rebuild_rollups() -> int:
+    run_write(reset_analytics_rollups)
+    return run_rollup()
+
+
+_rollup_task = PeriodicTask(
+    "analytics-rollup",
+    settings.ANALYTICS_ROLLUP_INTERVAL_SECONDS,
+    run_rollup,
+)
+
+
+def start_analytics_rollup() -> None:
+    _rollup_task.start()
+
+
+def stop_analytics_rollup() -> None:
+    _rollup_task.stop()
+
+
+def analytics_stats() -> Dict[str, Any]:
+    with connection() as con:
+        pending = pending_rollup_rides(con)
+    return {
+        "running": _rollup_task.running,
+        "pending_rides": pending,
+        "last_rollup_at": _last_rollup_at,
+    }
+
+
+# -------------------------------------------------
+# Queries (rollup tables only)
+# -------------------------------------------------
+def _range_clause(column: str, start: Optional[date], end: Optional[date]) -> Tuple[str, List[str]]:
+    """
+    Half-open [start, end + 1 day) filter on a "YYYY-MM-DD..." bucket column.
+    """
+    if start and end and start > end:
+        raise ValueError("start must not be after end")
+    clauses, params = [], []
+    if start:
+        clauses.append(f"{column} >= ?")
+        params.append(start.isoformat())
+    if end:
+        clauses.append(f"{column} < ?")
+        params.append((end + timedelta(days=1)).isoformat())
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+def _with_kg(row: Dict[str, Any]) -> Dict[str, Any]:
+    row["co2_saved_kg"] = round(int(row.pop("co2_saved_g") or 0) / 1000, 3)
+    return row
+
+
+def get_totals(start: Optional[date] = None, end: Optional[date] = None) -> Dict[str, Any]:
+    where, params = _range_clause("day", start, end)
+    sums = ", ".join(f"COALESCE(SUM({m}), 0) AS {m}" for m in ROLLUP_METRICS)
+    with connection() as con:
+        row = dict(con.execute(f"SELECT {sums} FROM analytics_daily{where}", params).fetchone())
+        pending = pending_rollup_rides(con)
+
+    seats_offered = int(row["seats_offered"])
+    row["seat_utilization"] = round(int(row["seats_booked"]) / seats_offered, 4) if seats_offered else 0.0
+    row["pending_rides"] = pending
+    row["as_of"] = _last_rollup_at
+    return _with_kg(row)
+
+
+def get_time_series(
+    granularity: str = "day",
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    limit: int = 365,
+) -> List[Dict[str, Any]]:
+    """
+    Buckets in ascending order; without bounds, the most recent `limit` ones.
+    """
+    if granularity == "day":
+        table, column = "analytics_daily", "day"
+    elif granularity == "hour":
+        table, column = "analytics_hourly", "hour"
+    else:
+        raise ValueError("granularity must be 'day' or 'hour'")
+    limit = max(1, min(int(limit), MAX_SERIES_POINTS))
+    where, params = _range_clause(column, start, end)
+    with connection() as con:
+        rows = con.execute(
+            f"SELECT {column} AS bucket, {', '.join(ROLLUP_METRICS)} FROM {table}{where} ORDER BY {column} DESC LIMIT ?",
+            (*params, limit),
+        ).fetchall()
+    return [_with_kg(dict(r)) for r in reversed(rows)]
+
+
+def get_leaderboard(
+    metric: str = "co2_saved_kg",
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    limit: int = 10,
+) -> List[Dict[str, Any]]:
+    column = LEADERBOARD_METRICS.get(metric)
+    if column is None:
+        raise ValueError(f"metric must be one of: {', '.join(LEADERBOARD_METRICS)}")
+    limit = max(1, min(int(limit), MAX_LEADERBOARD_SIZE))
+    where, params = _range_clause("day", start, end)
+    with connection() as con:
+        rows = con.execute(
+            f"""
+            SELECT t.user_id, u.name, t.value FROM (
+                SELECT user_id, SUM({column}) AS value
+                FROM analytics_user_daily{where}
+                GROUP BY user_id
+                HAVING SUM({column}) > 0
+                ORDER BY value DESC, user_id
+                LIMIT ?
+            ) AS t
+            LEFT JOIN users u ON u.id = t.user_id
+            ORDER BY t.value DESC, t.user_id
+            """,
+            (*params, limit),
+        ).fetchall()
+    scale = 1000 if column == "co2_saved_g" else 1
+    return [
+        {
+            "rank": i,
+            "user_id": int(r["user_id"]),
+            "name": r["name"],
+            "value": round(int(r["value"]) / scale, 3) if scale != 1 else int(r["value"]),
+        }
+        for i, r in enumerate(rows, start=1)
+    ]
+
+
+def get_busiest_routes(
+    metric: str = "bookings",
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    limit: int = 10,
+) -> List[Dict[str, Any]]:
+    if metric not in ROUTE_METRICS:
+        raise ValueError(f"metric must be one of: {', '.join(ROUTE_METRICS)}")
+    order_by = "co2_saved_g" if metric == "co2_saved_kg" else metric
+    limit = max(1, min(int(limit), MAX_LEADERBOARD_SIZE))
+    where, params = _range_clause("day", start, end)
+    with connection() as con:
+        rows = con.execute(
+            f"""
+            SELECT from_key, to_key, {', '.join(f'SUM({m}) AS {m}' for m in ROLLUP_METRICS)}
+            FROM analytics_route_daily{where}
+            GROUP BY from_key, to_key
+            HAVING SUM(rides_offered) > 0
+            ORDER BY {order_by} DESC, from_key, to_key
+            LIMIT ?
+            """,
+            (*params, limit),
+        ).fetchall()
+    return [_with_kg(dict(r)) for r in rows]
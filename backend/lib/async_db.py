@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+
+from .settings import settings
+
+T = TypeVar("T")
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """
+    Dedicated DB executor, one thread per pooled connection: a job never
+    waits for a connection while holding a thread, and DB work no longer
+    competes with other blocking calls in the framework's default threadpool.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=max(settings.DB_POOL_SIZE, 1),
+                thread_name_prefix="db",
+            )
+        return _executor
+
+
+async def run_db(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    Run a blocking service call on the DB executor and await its result.
+    The call sees the caller's context variables (e.g. read routing).
+    """
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(_get_executor(), functools.partial(ctx.run, fn, *args, **kwargs))
+
+
+def db_async(fn: Callable[..., T]) -> Callable[..., Awaitable[T]]:
+    """
+    Async variant of a blocking service function (same arguments, same
+    exceptions), for use from async routes.
+    """
+    @functools.wraps(fn)
+    async def wrapper(*args: Any, **kwargs: Any) -> T:
+        return await run_db(fn, *args, **kwargs)
+
+    return wrapper
+
+
+def shutdown_db_executor() -> None:
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
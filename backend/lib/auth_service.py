@@ -1,11 +1,19 @@
 from __future__ import annotations
 
 import secrets
-from typing import Optional,Dict,Any
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional,Dict,Any,List,Set
 from fastapi import HTTPException
 
-from .db import connect
-from .utils import utc_iso
+from .aggregates import diff_user_stats, rebuild_user_stats
+from .async_db import db_async, run_db
+from .background import PeriodicTask
+from .cache import TTLCache
+from .db import connection, insert_returning_id, run_write
+from .replicas import read_connection
+from .utils import utc_iso, utc_now, parse_iso_datetime
 
 
 from .validators import (
@@ -21,7 +29,7 @@ from .validators import (
 from .models import AuthResponse, UserPublic, UserProfileResponse
 
 from .settings import settings
-from .notification_service import create_notification
+from .notification_service import add_notification, notify_outbox
 
 def _user_row_to_public(row) -> UserPublic:
     return UserPublic(
@@ -39,52 +47,254 @@ def _token_from_auth_header(authorization: Optional[str]) -> str:
         raise ValueError("Invalid Authorization header format")
     return parts[1].strip()
 
-def get_user_id_from_token(token: str) -> int | None:
-    conn = connect()
+# -------------------------------------------------
+# Session cache: token -> {user_id, user_type, is_verified, expires_ts}
+# Per process; TTL bounds staleness for changes made by other workers.
+# -------------------------------------------------
+_tokens_by_user: Dict[int, Set[str]] = {}
+_tokens_lock = threading.Lock()
+
+
+def _forget_token(token: str, session: Dict[str, Any]) -> None:
+    with _tokens_lock:
+        tokens = _tokens_by_user.get(session["user_id"])
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del _tokens_by_user[session["user_id"]]
+
+
+_session_cache: TTLCache[str, Dict[str, Any]] = TTLCache(
+    max_size=settings.SESSION_CACHE_SIZE,
+    ttl=settings.SESSION_CACHE_TTL_SECONDS,
+    on_evict=_forget_token,
+)
+
+
+def _cache_session(token: str, session: Dict[str, Any]) -> None:
+    _session_cache.set(token, session)
+    with _tokens_lock:
+        _tokens_by_user.setdefault(session["user_id"], set()).add(token)
+
+
+def invalidate_token(token: str) -> None:
+    session = _session_cache.delete(token)
+    if session is not None:
+        _forget_token(token, session)
+
+
+def invalidate_user_sessions(user_id: int) -> None:
+    """
+    Drop every cached session of a user, e.g. after their user_type or
+    verification status changed.
+    """
+    with _tokens_lock:
+        tokens = _tokens_by_user.pop(int(user_id), set())
+    for token in tokens:
+        _session_cache.delete(token)
+
+
+def session_cache_stats() -> Dict[str, Any]:
+    return _session_cache.stats()
+
+
+# -------------------------------------------------
+# Session lifecycle: expiry, sliding refresh, per-user cap, purge
+# -------------------------------------------------
+def _session_ttl() -> timedelta:
+    return timedelta(hours=settings.SESSION_TTL_HOURS)
+
+
+def _create_session(conn, user_id: int) -> Dict[str, Any]:
+    """
+    Insert a new session and trim the user's oldest ones beyond
+    MAX_SESSIONS_PER_USER. Runs inside the caller's transaction.
+    Returns token, expires_at and the tokens that were trimmed.
+    """
+    now = utc_now()
+    token = secrets.token_urlsafe(24)
+    expires_at = utc_iso(now + _session_ttl())
     cur = conn.cursor()
-    cur.execute("SELECT user_id FROM sessions WHERE token = ?", (token,))
-    row = cur.fetchone()
-    conn.close()
-    return row[0] if row else None
+    cur.execute(
+        "INSERT INTO sessions (token, user_id, created_at, expires_at, last_seen_at) VALUES (?, ?, ?, ?, ?)",
+        (token, user_id, utc_iso(now), expires_at, utc_iso(now)),
+    )
+    # the new session is always kept; a user has at most the cap + 1 rows here
+    cur.execute(
+        """
+        SELECT token FROM sessions
+        WHERE user_id=? AND token != ?
+        ORDER BY created_at DESC, token
+        """,
+        (user_id, token),
+    )
+    trimmed = [r["token"] for r in cur.fetchall()[max(settings.MAX_SESSIONS_PER_USER, 1) - 1:]]
+    if trimmed:
+        cur.executemany("DELETE FROM sessions WHERE token=?", [(t,) for t in trimmed])
+    return {"token": token, "expires_at": expires_at, "trimmed": trimmed}
 
-def require_user_id(authorization: Optional[str]) -> int:
+
+def _extend_session(conn, token: str, expires_at: str, last_seen_at: str) -> None:
+    conn.execute(
+        "UPDATE sessions SET expires_at=?, last_seen_at=? WHERE token=?",
+        (expires_at, last_seen_at, token),
+    )
+
+
+def _delete_session(conn, token: str) -> None:
+    conn.execute("DELETE FROM sessions WHERE token=?", (token,))
+
+
+def _needs_refresh(session: Dict[str, Any], now: datetime) -> bool:
+    remaining = session["expires_ts"] - now.timestamp()
+    return remaining < _session_ttl().total_seconds() * settings.SESSION_REFRESH_THRESHOLD
+
+
+def _maybe_refresh(token: str, session: Dict[str, Any], now: datetime) -> None:
+    """
+    Sliding expiry: extend the session once less than
+    SESSION_REFRESH_THRESHOLD of its TTL remains, so active users stay
+    logged in while most requests still cost no write.
+    """
+    if not _needs_refresh(session, now):
+        return
+
+    new_expiry = now + _session_ttl()
+    run_write(_extend_session, token, utc_iso(new_expiry), utc_iso(now))
+    refreshed = dict(session, expires_ts=new_expiry.timestamp())
+    _cache_session(token, refreshed)
+
+
+def get_session(token: str) -> Optional[Dict[str, Any]]:
+    return _resolve_session(token, _session_cache.get(token), utc_now())
+
+
+def _resolve_session(token: str, session: Optional[Dict[str, Any]], now: datetime) -> Optional[Dict[str, Any]]:
+    """
+    `session` is the cache entry for `token` (or None); falls back to the
+    database and refreshes the session when due.
+    """
+    if session is not None and session["expires_ts"] <= now.timestamp():
+        # may have been refreshed by another worker; re-check the database
+        invalidate_token(token)
+        session = None
+
+    if session is None:
+        with connection() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                """
+                SELECT s.user_id, s.expires_at, u.user_type, u.is_verified
+                FROM sessions s
+                JOIN users u ON u.id = s.user_id
+                WHERE s.token = ? AND s.expires_at > ?
+                """,
+                (token, utc_iso(now)),
+            )
+            row = cur.fetchone()
+        if not row:
+            return None
+
+        session = {
+            "user_id": int(row["user_id"]),
+            "user_type": row["user_type"],
+            "is_verified": bool(row["is_verified"]),
+            "expires_ts": parse_iso_datetime(row["expires_at"]).timestamp(),
+        }
+        _cache_session(token, session)
+
+    _maybe_refresh(token, session, now)
+    return session
+
+
+def _replace_session(conn, token: str, user_id: int) -> Dict[str, Any]:
+    _delete_session(conn, token)
+    return _create_session(conn, user_id)
+
+
+def rotate_token(authorization: Optional[str]) -> Dict[str, Any]:
+    """
+    Swap a valid token for a fresh one with a full TTL; the old token stops
+    working immediately.
+    """
     token = _token_from_auth_header(authorization)
-    uid = get_user_id_from_token(token)
-    if not uid:
+    session = get_session(token)
+    if not session:
         raise ValueError("Invalid or expired token")
-    return int(uid)
 
-def logout_token(authorization: Optional[str]) -> None:
-    token = _token_from_auth_header(authorization)
-    conn = connect()
-    cur = conn.cursor()
-    cur.execute("DELETE FROM sessions WHERE token = ?", (token,))
-    conn.commit()
-    conn.close()
+    created = run_write(_replace_session, token, session["user_id"])
+    invalidate_token(token)
+    for stale in created["trimmed"]:
+        invalidate_token(stale)
+    return {"token": created["token"], "expires_at": created["expires_at"]}
 
-def login_or_create_user(name: str, contact: str, user_type: str) -> Dict[str, Any]:
-    validate_user_type(user_type)
-    validate_contact(contact, user_type)
 
-    name = (name or "").strip()
-    contact = (contact or "").strip()
+def _delete_expired_sessions(conn, cutoff: str, batch_size: int) -> int:
+    cur = conn.execute(
+        """
+        DELETE FROM sessions WHERE token IN (
+            SELECT token FROM sessions WHERE expires_at <= ? LIMIT ?
+        )
+        """,
+        (cutoff, batch_size),
+    )
+    return cur.rowcount
+
+
+def purge_expired_sessions(batch_size: Optional[int] = None) -> int:
+    """
+    Delete expired sessions in small batches, one write job each, so
+    request writes queued behind the sweeper never wait for one large
+    DELETE. Returns the number of rows removed.
+    """
+    batch_size = max(int(batch_size or settings.SESSION_SWEEP_BATCH_SIZE), 1)
+    cutoff = utc_iso()
+    removed = 0
+    while True:
+        deleted = run_write(_delete_expired_sessions, cutoff, batch_size)
+        removed += deleted
+        if deleted < batch_size:
+            return removed
+        time.sleep(0.01)
+
+
+_session_sweeper = PeriodicTask(
+    "session-sweeper",
+    settings.SESSION_SWEEP_INTERVAL_SECONDS,
+    purge_expired_sessions,
+)
 
-    is_email = "@" in contact
 
-    email = None
-    phone = None
+def start_session_sweeper() -> None:
+    _session_sweeper.start()
+
+
+def stop_session_sweeper() -> None:
+    _session_sweeper.stop()
 
-    if is_email:
-        email = normalize_email(contact)
-        if user_type == "campus":
-            validate_campus_email(email)
-        else:
-            validate_email_format(email)
-    else:
-        phone = contact
-        validate_phone(phone)
 
-    conn = connect()
+def get_user_id_from_token(token: str) -> int | None:
+    session = get_session(token)
+    return session["user_id"] if session else None
+
+def require_user_id(authorization: Optional[str]) -> int:
+    token = _token_from_auth_header(authorization)
+    uid = get_user_id_from_token(token)
+    if not uid:
+        raise ValueError("Invalid or expired token")
+    return int(uid)
+
+def logout_token(authorization: Optional[str]) -> None:
+    token = _token_from_auth_header(authorization)
+    run_write(_delete_session, token)
+    invalidate_token(token)
+
+def _upsert_user_session(conn, name: str, user_type: str, email: Optional[str], phone: Optional[str]):
+    """
+    Write job: find or create the user and open a session; the user row,
+    welcome notification and session commit together.
+    Returns (existed, user_id, created_session).
+    """
     cur = conn.cursor()
 
     if email:
@@ -95,90 +305,121 @@ def login_or_create_user(name: str, contact: str, user_type: str) -> Dict[str, A
     row = cur.fetchone()
 
     if not row:
-        cur.execute(
+        user_id = insert_returning_id(
+            conn,
             """
             INSERT INTO users (name, user_type, email, phone, is_verified, created_at)
             VALUES (?, ?, ?, ?, 1, ?)
             """,
             (name, user_type, email, phone, utc_iso()),
         )
-        conn.commit()
-        user_id = cur.lastrowid
 
         if settings.ENABLE_IN_APP_NOTIFICATIONS:
-            create_notification(int(user_id), "Welcome to PoolRide", "You’re all set. 🌱")
+            add_notification(conn, int(user_id), "Welcome to PoolRide", "You’re all set. 🌱")
     else:
         user_id = row["id"]
         cur.execute(
             "UPDATE users SET name=?, user_type=? WHERE id=?",
             (name or row["name"], user_type or row["user_type"], user_id),
         )
-        conn.commit()
 
-    token = secrets.token_urlsafe(24)
+    created = _create_session(conn, int(user_id))
+    return row is not None, user_id, created
 
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS sessions (
-            token TEXT PRIMARY KEY,
-            user_id INTEGER NOT NULL,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    cur.execute("INSERT INTO sessions (token, user_id) VALUES (?, ?)", (token, user_id))
-    conn.commit()
-    conn.close()
+
+def login_or_create_user(name: str, contact: str, user_type: str) -> Dict[str, Any]:
+    validate_user_type(user_type)
+    validate_contact(contact, user_type)
+
+    name = (name or "").strip()
+    contact = (contact or "").strip()
+
+    is_email = "@" in contact
+
+    email = None
+    phone = None
+
+    if is_email:
+        email = normalize_email(contact)
+        if user_type == "campus":
+            validate_campus_email(email)
+        else:
+            validate_email_format(email)
+    else:
+        phone = contact
+        validate_phone(phone)
+
+    existed, user_id, created = run_write(_upsert_user_session, name, user_type, email, phone)
+
+    if existed:
+        invalidate_user_sessions(int(user_id))
+    for stale in created["trimmed"]:
+        invalidate_token(stale)
+    notify_outbox()
 
     return {
-        "token": token,
+        "token": created["token"],
+        "expires_at": created["expires_at"],
         "user": {"id": user_id, "name": name, "user_type": user_type},
         "message": "Login successful",
     }
 
 
 def get_user_profile(user_id: int) -> UserProfileResponse:
-    conn = connect()
-    cur = conn.cursor()
-
-    cur.execute("SELECT * FROM users WHERE id=?", (user_id,))
-    user = cur.fetchone()
-    if not user:
-        conn.close()
-        raise ValueError("User not found")
+    with read_connection() as conn:
+        cur = conn.cursor()
 
-    cur.execute("SELECT COUNT(*) AS c FROM rides WHERE driver_id=?", (user_id,))
-    rides_posted = int(cur.fetchone()["c"])
+        # user_stats is kept current by create_ride / create_booking / cancel_booking
+        cur.execute(
+            """
+            SELECT u.*,
+                   COALESCE(s.rides_posted, 0) AS stat_rides_posted,
+                   COALESCE(s.rides_taken, 0) AS stat_rides_taken,
+                   COALESCE(s.co2_saved_g, 0) AS stat_co2_saved_g
+            FROM users u
+            LEFT JOIN user_stats s ON s.user_id = u.id
+            WHERE u.id=?
+            """,
+            (user_id,),
+        )
+        user = cur.fetchone()
+        if not user:
+            raise ValueError("User not found")
 
-    cur.execute(
-        "SELECT COUNT(*) AS c FROM bookings WHERE rider_id=? AND status='CONFIRMED'",
-        (user_id,),
+    return UserProfileResponse(
+        user=_user_row_to_public(user),
+        rides_posted=int(user["stat_rides_posted"]),
+        rides_taken=int(user["stat_rides_taken"]),
+        total_co2_saved_kg=round(int(user["stat_co2_saved_g"]) / 1000, 3),
     )
-    rides_taken = int(cur.fetchone()["c"])
 
-    cur.execute(
-        """
-        SELECT b.id, r.distance_km, r.vehicle_type, r.seats_total, r.seats_left
-        FROM bookings b
-        JOIN rides r ON r.id = b.ride_id
-        WHERE b.rider_id=? AND b.status='CONFIRMED'
-        """,
-        (user_id,),
-    )
-    rows = cur.fetchall()
-    conn.close()
 
-    from .co2_service import estimate_co2_saved
+# -------------------------------------------------
+# Maintenance (see manage.py)
+# -------------------------------------------------
+def rebuild_profile_stats() -> int:
+    return run_write(rebuild_user_stats)
 
-    total = 0.0
-    for row in rows:
-        seats_total = int(row["seats_total"])
-        seats_left = int(row["seats_left"])
-        riders_now = seats_total - seats_left
-        passengers_total = 1 + max(riders_now, 0)
-        total += float(estimate_co2_saved(float(row["distance_km"]), row["vehicle_type"], passengers_total))
 
-    return UserProfileResponse(
-        user=_user_row_to_public(user),
-        rides_posted=rides_posted,
-        rides_taken=rides_taken,
-        total_co2_saved_kg=round(total, 3),
-    )
+def verify_profile_stats() -> List[Dict[str, Any]]:
+    with connection() as conn:
+        return diff_user_stats(conn)
+
+
+# -------------------------------------------------
+# Async variants (run on the async_db executor)
+# -------------------------------------------------
+async def require_user_id_async(authorization: Optional[str]) -> int:
+    # a cached session that is neither expired nor due for a refresh needs
+    # no database call, so it is answered without the executor hop
+    token = _token_from_auth_header(authorization)
+    now = utc_now()
+    session = _session_cache.get(token)
+    if session is None or session["expires_ts"] <= now.timestamp() or _needs_refresh(session, now):
+        session = await run_db(_resolve_session, token, session, now)
+    if not session:
+        raise ValueError("Invalid or expired token")
+    return int(session["user_id"])
+
+
+get_user_profile_async = db_async(get_user_profile)
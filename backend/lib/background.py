@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import threading
+import traceback
+from typing import Callable, Optional
+
+
+class PeriodicTask:
+    """
+    Runs `fn` every `interval` seconds on a daemon thread, off the request path.
+    wake() triggers an early run. Exceptions are logged and the task keeps
+    running; stop() wakes the thread and waits for the current run to finish.
+    """
+
+    def __init__(self, name: str, interval: float, fn: Callable[[], object]):
+        self.name = name
+        self.interval = max(float(interval), 0.01)
+        self._fn = fn
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            self.run_once()
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    def run_once(self) -> None:
+        try:
+            self._fn()
+        except Exception:
+            print(f"[{self.name}] background run failed:")
+            traceback.print_exc()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stop.clear()
+        self._wake.clear()
+        self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
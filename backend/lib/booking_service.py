@@ -1,19 +1,30 @@
 from __future__ import annotations
 
 from typing import List
-from .db import connect
+from .async_db import db_async
+from .db import connection, insert_returning_id, run_write
 from .settings import settings
 from .utils import utc_iso, parse_iso_datetime
-from .co2_service import estimate_co2_saved
-from .notification_service import create_notification
+from .co2_service import EMISSION_FACTORS_JOIN, estimate_co2_saved, ride_co2_saved_g_sql
+from .aggregates import record_booking_cancelled, record_booking_confirmed
+from .limits_service import BOOKING, CANCELLATION, consume
+from .notification_service import add_notification, notify_outbox
+from .ride_service import invalidate_ride_cache
+
+
+class SeatConflictError(ValueError):
+    """Raised when a ride no longer has enough free seats for a booking."""
+
+
+class BookingOwnershipError(ValueError):
+    """Raised when a user acts on another user's booking."""
 
 
 def _ensure_user_verified(user_id: int):
-    con = connect()
-    cur = con.cursor()
-    cur.execute("SELECT id, is_verified, user_type FROM users WHERE id=?", (user_id,))
-    row = cur.fetchone()
-    con.close()
+    with connection() as con:
+        cur = con.cursor()
+        cur.execute("SELECT id, is_verified, user_type FROM users WHERE id=?", (user_id,))
+        row = cur.fetchone()
     if not row:
         raise ValueError("User not found")
     if int(row["is_verified"]) != 1:
@@ -21,52 +32,47 @@ def _ensure_user_verified(user_id: int):
     return row
 
 
-def create_booking(payload):
+def _reserve_seats(con, payload, rider):
     """
-    payload: BookingCreateRequest
+    Write job: validate the ride, take the seats with a single conditional
+    UPDATE and record the booking.
     """
-    rider = _ensure_user_verified(payload.rider_id)
-
-    con = connect()
     cur = con.cursor()
 
     # ride exists?
     cur.execute("SELECT * FROM rides WHERE id=?", (payload.ride_id,))
     ride = cur.fetchone()
     if not ride:
-        con.close()
         raise ValueError("Ride not found")
 
-    # seats
-    if int(ride["seats_left"]) < int(payload.seats):
-        con.close()
-        raise ValueError("Not enough seats available")
-
     # guest policy
     rider_is_guest = (rider["user_type"] == "guest")
     allow_guests = bool(int(ride["allow_guests"]))
     if rider_is_guest and not allow_guests:
-        con.close()
         raise ValueError("This ride does not allow guest bookings")
 
-    # booking limits (MVP simple check: bookings today)
-    # optional: kept simple here; you can enforce later with date filtering
+    # MAX_BOOKINGS_PER_DAY (rolling 24h); counted in this transaction, so
+    # a failed booking does not use up the quota
+    consume(con, int(payload.rider_id), BOOKING)
 
-    # update seats and create booking
+    # take the seats only if they are still free; the guard lives in the
+    # UPDATE itself so concurrent bookings can never oversell the ride
     cur.execute(
-        "UPDATE rides SET seats_left = seats_left - ? WHERE id=?",
-        (int(payload.seats), int(payload.ride_id)),
+        "UPDATE rides SET seats_left = seats_left - ? WHERE id=? AND seats_left >= ?",
+        (int(payload.seats), int(payload.ride_id), int(payload.seats)),
     )
+    if cur.rowcount == 0:
+        raise SeatConflictError("Not enough seats available")
 
     created_at = utc_iso()
-    cur.execute(
+    booking_id = insert_returning_id(
+        con,
         """
         INSERT INTO bookings (ride_id, rider_id, seats, status, created_at)
         VALUES (?, ?, ?, 'CONFIRMED', ?)
         """,
         (int(payload.ride_id), int(payload.rider_id), int(payload.seats), created_at),
     )
-    booking_id = cur.lastrowid
 
     # compute passengers total (driver + current riders)
     cur.execute("SELECT seats_total, seats_left FROM rides WHERE id=?", (int(payload.ride_id),))
@@ -76,13 +82,27 @@ def create_booking(payload):
     riders_now = seats_total - seats_left
     passengers_total = 1 + max(riders_now, 0)
 
-    con.commit()
-    con.close()
+    record_booking_confirmed(con, ride, booking_id, int(payload.rider_id), int(payload.seats), passengers_total)
 
-    # notifications
+    # notifications commit with the booking
     if settings.ENABLE_IN_APP_NOTIFICATIONS:
-        create_notification(int(ride["driver_id"]), "New Booking", "Someone booked a seat on your ride.")
-        create_notification(int(payload.rider_id), "Booking Confirmed", "Your booking is confirmed. 🌱")
+        add_notification(con, int(ride["driver_id"]), "New Booking", "Someone booked a seat on your ride.")
+        add_notification(con, int(payload.rider_id), "Booking Confirmed", "Your booking is confirmed. 🌱")
+
+    return ride, booking_id, created_at, passengers_total
+
+
+def create_booking(payload):
+    """
+    payload: BookingCreateRequest
+    Raises SeatConflictError if the seats were taken first.
+    """
+    rider = _ensure_user_verified(payload.rider_id)
+    rider_is_guest = (rider["user_type"] == "guest")
+
+    ride, booking_id, created_at, passengers_total = run_write(_reserve_seats, payload, rider)
+    invalidate_ride_cache(int(ride["id"]), ride["from_text"], ride["to_text"], ride["from_place_id"], ride["to_place_id"])
+    notify_outbox()
 
     co2_saved = estimate_co2_saved(float(ride["distance_km"]), ride["vehicle_type"], passengers_total)
 
@@ -107,65 +127,70 @@ def create_booking(payload):
     }
 
 
-def cancel_booking(booking_id: int) -> None:
-    con = connect()
+def _cancel(con, booking_id: int, user_id: int):
     cur = con.cursor()
 
     # only cancel if exists and confirmed
     cur.execute("SELECT id, status, ride_id, seats, rider_id FROM bookings WHERE id=?", (booking_id,))
     b = cur.fetchone()
     if not b:
-        con.close()
         raise ValueError("Booking not found")
+    if int(b["rider_id"]) != int(user_id):
+        raise BookingOwnershipError("You can only cancel your own bookings")
 
-    if b["status"] != "CONFIRMED":
-        con.close()
-        raise ValueError("Booking already cancelled")
-
-    # mark cancelled + restore seats
+    # mark cancelled + restore seats; the status guard makes a repeated
+    # cancel a no-op instead of returning the seats twice
     cur.execute(
-        "UPDATE bookings SET status='CANCELLED', cancelled_at=? WHERE id=?",
+        "UPDATE bookings SET status='CANCELLED', cancelled_at=? WHERE id=? AND status='CONFIRMED'",
         (utc_iso(), booking_id),
     )
+    if cur.rowcount == 0:
+        raise ValueError("Booking already cancelled")
+
+    # MAX_CANCELLATIONS_PER_WEEK (rolling 7 days), charged to the caller
+    consume(con, int(user_id), CANCELLATION)
+
+    cur.execute("SELECT * FROM rides WHERE id=?", (int(b["ride_id"]),))
+    ride = cur.fetchone()
+    passengers_before = 1 + max(int(ride["seats_total"]) - int(ride["seats_left"]), 0)
     cur.execute(
         "UPDATE rides SET seats_left = seats_left + ? WHERE id=?",
         (int(b["seats"]), int(b["ride_id"])),
     )
-
-    con.commit()
-    con.close()
+    record_booking_cancelled(con, ride, booking_id, int(b["rider_id"]), int(b["seats"]), passengers_before)
 
     if settings.ENABLE_IN_APP_NOTIFICATIONS:
-        create_notification(int(b["rider_id"]), "Booking Cancelled", "Your booking was cancelled.")
+        add_notification(con, int(b["rider_id"]), "Booking Cancelled", "Your booking was cancelled.")
         # driver notification optional; can add later
+    return b, ride
+
+
+def cancel_booking(booking_id: int, user_id: int) -> None:
+    _, ride = run_write(_cancel, booking_id, user_id)
+    invalidate_ride_cache(int(ride["id"]), ride["from_text"], ride["to_text"], ride["from_place_id"], ride["to_place_id"])
+    notify_outbox()
 
 
 def get_user_bookings(user_id: int) -> List[dict]:
-    con = connect()
-    cur = con.cursor()
-    cur.execute(
-       """
-        SELECT b.id, b.ride_id, b.rider_id, b.seats, b.status, b.created_at,
-               r.driver_id, r.from_text, r.to_text, r.depart_time,
-               r.distance_km, r.vehicle_type, r.seats_total, r.seats_left
-        FROM bookings b
-        JOIN rides r ON r.id = b.ride_id
-        WHERE b.rider_id=?
-        ORDER BY b.id DESC
-        """,
-        (user_id,),
-    )
-    rows = cur.fetchall()
-    con.close()
+    with connection() as con:
+        cur = con.cursor()
+        cur.execute(
+            f"""
+            SELECT b.id, b.ride_id, b.rider_id, b.seats, b.status, b.created_at,
+                   r.driver_id, r.from_text, r.to_text, r.depart_time,
+                   {ride_co2_saved_g_sql()} / 1000.0 AS co2_saved_kg_est
+            FROM bookings b
+            JOIN rides r ON r.id = b.ride_id
+            {EMISSION_FACTORS_JOIN}
+            WHERE b.rider_id=?
+            ORDER BY b.id DESC
+            """,
+            (user_id,),
+        )
+        rows = cur.fetchall()
 
     out = []
     for row in rows:
-        seats_total = int(row["seats_total"])
-        seats_left = int(row["seats_left"])
-        riders_now = seats_total - seats_left
-        passengers_total = 1 + max(riders_now, 0)
-        co2_saved = estimate_co2_saved(float(row["distance_km"]), row["vehicle_type"], passengers_total)
-
         out.append(
             {
                 "id": row["id"],
@@ -174,7 +199,7 @@ def get_user_bookings(user_id: int) -> List[dict]:
                 "seats": row["seats"],
                 "status": row["status"],
                 "created_at": parse_iso_datetime(row["created_at"]),
-                "co2_saved_kg_est": float(co2_saved),
+                "co2_saved_kg_est": float(row["co2_saved_kg_est"]),
                 "drop_note": None,
                 "driver_id": int(row["driver_id"]),
                 "from_text": row["from_text"],
@@ -183,3 +208,11 @@ def get_user_bookings(user_id: int) -> List[dict]:
             }
         )
     return out
+
+
+# -------------------------------------------------
+# Async variants (run on the async_db executor)
+# -------------------------------------------------
+create_booking_async = db_async(create_booking)
+cancel_booking_async = db_async(cancel_booking)
+get_user_bookings_async = db_async(get_user_bookings)
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Generic, Hashable, Optional, Tuple, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+_MISSING = object()
+
+
+class TTLCache(Generic[K, V]):
+    """
+    Thread-safe LRU cache with a per-entry time-to-live.
+
+    - At most `max_size` entries; the least recently used one is evicted first.
+    - Entries older than `ttl` seconds are treated as missing.
+    - `on_evict(key, value)` is called for entries dropped by size or expiry
+      (not for explicit delete/clear), so callers can keep side indexes tidy.
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        ttl: float,
+        on_evict: Optional[Callable[[K, V], None]] = None,
+    ):
+        self.max_size = max(int(max_size), 1)
+        self.ttl = float(ttl)
+        self._on_evict = on_evict
+        self._data: "OrderedDict[K, Tuple[float, V]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _evicted(self, key: K, value: V) -> None:
+        self.evictions += 1
+        if self._on_evict is not None:
+            self._on_evict(key, value)
+
+    def get(self, key: K, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                self._evicted(key, value)
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: K, value: V, ttl: Optional[float] = None) -> None:
+        expires_at = time.monotonic() + (self.ttl if ttl is None else float(ttl))
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                old_key, (_, old_value) = self._data.popitem(last=False)
+                self._evicted(old_key, old_value)
+
+    def delete(self, key: K) -> Optional[V]:
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return entry[1] if entry else None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
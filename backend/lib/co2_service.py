@@ -1,21 +1,193 @@
 from __future__ import annotations
+
+import math
+from typing import Dict, List, Optional, Sequence
+
+from .drivers import get_driver
 from .settings import settings
 
+try:  # optional: vectorizes the batch path for large inputs
+    import numpy as np
+except ImportError:  # pragma: no cover - pure-Python fallback below
+    np = None
+
 
 def emission_factor(vehicle_type: str) -> float:
     v = (vehicle_type or "").strip().lower()
     return float(settings.VEHICLE_TYPE_FACTORS.get(v, settings.DEFAULT_EMISSION_FACTOR_KG_PER_KM))
 
 
-def estimate_co2_saved(distance_km: float, vehicle_type: str, passengers_total: int) -> float:
+def _grams(saved_kg: float) -> int:
+    # half-up to the gram; ride_co2_saved_g_sql() repeats this in SQL
+    return int(math.floor(saved_kg * 1000 + 0.5)) if saved_kg > 0 else 0
+
+
+def estimate_co2_saved_g(distance_km: float, vehicle_type: str, passengers_total: int) -> int:
     """
-    Very simple MVP estimate:
+    Very simple MVP estimate, in whole grams:
     - Solo emission = distance * factor
     - Shared per person = (distance * factor) / passengers_total
     - Saved per rider = solo - shared
     """
     factor = emission_factor(vehicle_type)
-    solo = distance_km * factor
-    shared_per_person = (distance_km * factor) / max(passengers_total, 1)
-    saved = max(solo - shared_per_person, 0.0)
-    return round(saved, 3)
+    solo = float(distance_km) * factor
+    shared_per_person = (float(distance_km) * factor) / max(int(passengers_total), 1)
+    return _grams(solo - shared_per_person)
+
+
+def estimate_co2_saved(distance_km: float, vehicle_type: str, passengers_total: int) -> float:
+    """
+    estimate_co2_saved_g in kg (three decimals).
+    """
+    return estimate_co2_saved_g(distance_km, vehicle_type, passengers_total) / 1000
+
+
+# -------------------------------------------------
+# Batch estimation
+# -------------------------------------------------
+# Same arithmetic as estimate_co2_saved_g, evaluated once per input array,
+# for bulk paths that already hold the rides in Python (analytics rollups).
+# The factor lookup is resolved once per distinct vehicle type; with NumPy
+# installed the float math runs vectorized (identical IEEE operations, so
+# results match the scalar function exactly), otherwise in a plain loop.
+
+_factor_table: Optional[Dict[str, float]] = None
+
+
+def factor_table() -> Dict[str, float]:
+    """
+    Emission factors keyed the way emission_factor() looks them up.
+    """
+    global _factor_table
+    if _factor_table is None:
+        _factor_table = {k: float(v) for k, v in settings.VEHICLE_TYPE_FACTORS.items()}
+    return _factor_table
+
+
+def _factors_for(vehicle_types: Sequence[str]) -> List[float]:
+    table = factor_table()
+    default = float(settings.DEFAULT_EMISSION_FACTOR_KG_PER_KM)
+    resolved: Dict[str, float] = {}
+    out = []
+    for vt in vehicle_types:
+        f = resolved.get(vt)
+        if f is None:
+            f = resolved[vt] = table.get((vt or "").strip().lower(), default)
+        out.append(f)
+    return out
+
+
+def estimate_co2_saved_g_batch(
+    distances_km: Sequence[float],
+    vehicle_types: Sequence[str],
+    passengers_totals: Sequence[int],
+) -> List[int]:
+    """
+    estimate_co2_saved_g for many rows at once; element i of the result
+    equals estimate_co2_saved_g(distances_km[i], vehicle_types[i], passengers_totals[i]).
+    """
+    n = len(distances_km)
+    if len(vehicle_types) != n or len(passengers_totals) != n:
+        raise ValueError("Batch inputs must have the same length")
+    if n == 0:
+        return []
+
+    factors = _factors_for(vehicle_types)
+
+    if np is not None:
+        d = np.asarray(distances_km, dtype=np.float64)
+        f = np.asarray(factors, dtype=np.float64)
+        p = np.maximum(np.asarray(passengers_totals, dtype=np.int64), 1).astype(np.float64)
+        solo = d * f
+        saved = solo - solo / p
+        grams = np.where(saved > 0, np.floor(saved * 1000 + 0.5), 0.0)
+        return [int(g) for g in grams.tolist()]
+
+    out = []
+    for dist, factor, passengers in zip(distances_km, factors, passengers_totals):
+        solo = float(dist) * factor
+        shared_per_person = (float(dist) * factor) / max(int(passengers), 1)
+        out.append(_grams(solo - shared_per_person))
+    return out
+
+
+def estimate_co2_saved_batch(
+    distances_km: Sequence[float],
+    vehicle_types: Sequence[str],
+    passengers_totals: Sequence[int],
+) -> List[float]:
+    """
+    estimate_co2_saved for many rows at once.
+    """
+    return [g / 1000 for g in estimate_co2_saved_g_batch(distances_km, vehicle_types, passengers_totals)]
+
+
+def ride_passengers(seats_total: int, seats_left: int) -> int:
+    """
+    Driver plus booked seats.
+    """
+    return 1 + max(int(seats_total) - int(seats_left), 0)
+
+
+# -------------------------------------------------
+# SQL
+# -------------------------------------------------
+# vehicle_emission_factors holds settings.VEHICLE_TYPE_FACTORS plus the
+# default factor (under the key ""), rewritten from settings at startup, so
+# listing and aggregate queries estimate in the database. The expression
+# repeats estimate_co2_saved_g's float operations in the same order, so SQL
+# and Python totals agree to the gram on every driver.
+
+DEFAULT_FACTOR_KEY = ""
+
+# joins the factors for the ride aliased `r`
+EMISSION_FACTORS_JOIN = """
+    LEFT JOIN vehicle_emission_factors ef ON ef.vehicle_type = r.vehicle_type
+    JOIN vehicle_emission_factors ef_default ON ef_default.vehicle_type = ''
+"""
+
+
+def ride_co2_saved_g_sql() -> str:
+    """
+    estimate_co2_saved_g of each booking on the ride aliased `r`, at the
+    ride's current passenger count; needs EMISSION_FACTORS_JOIN.
+    """
+    passengers = "(1 + CASE WHEN r.seats_total > r.seats_left THEN r.seats_total - r.seats_left ELSE 0 END)"
+    solo = "(r.distance_km * COALESCE(ef.kg_per_km, ef_default.kg_per_km))"
+    saved = f"({solo} - {solo} / {passengers})"
+    return f"(CASE WHEN {saved} > 0 THEN {get_driver().floor_int_sql(f'{saved} * 1000 + 0.5')} ELSE 0 END)"
+
+
+def create_emission_factors(con) -> None:
+    """
+    Migration step: the factor table, filled from settings.
+    """
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS vehicle_emission_factors (
+            vehicle_type TEXT PRIMARY KEY,           -- as in VEHICLE_TYPE_FACTORS; "" = default
+            kg_per_km REAL NOT NULL
+        )
+    """)
+    sync_emission_factors(con)
+
+
+def sync_emission_factors(con) -> None:
+    """
+    Make vehicle_emission_factors match settings. Runs at every startup;
+    totals already stored in user_stats / analytics need a rebuild after
+    the factors change.
+    """
+    factors = dict(factor_table())
+    factors[DEFAULT_FACTOR_KEY] = float(settings.DEFAULT_EMISSION_FACTOR_KG_PER_KM)
+    stored = {r[0]: float(r[1]) for r in con.execute("SELECT vehicle_type, kg_per_km FROM vehicle_emission_factors")}
+    if stored == factors:
+        return
+    con.executemany(
+        """
+        INSERT INTO vehicle_emission_factors (vehicle_type, kg_per_km) VALUES (?, ?)
+        ON CONFLICT (vehicle_type) DO UPDATE SET kg_per_km = excluded.kg_per_km
+        """,
+        list(factors.items()),
+    )
+    stale = [(k,) for k in stored if k not in factors]
+    con.executemany("DELETE FROM vehicle_emission_factors WHERE vehicle_type=?", stale)
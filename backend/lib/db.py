@@ -1,109 +1,538 @@
 from __future__ import annotations
 
-import sqlite3
-from pathlib import Path
+import queue
+import random
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+from .co2_service import sync_emission_factors
+from .drivers import StorageDriver, get_driver
+from .migrations import MIGRATIONS, current_version, run_migrations
 from .settings import settings
 
 
-def connect() -> sqlite3.Connection:
-    db_path = settings.db_path_abs
-    db_path.parent.mkdir(parents=True, exist_ok=True)
-    con = sqlite3.connect(str(db_path))
-    con.row_factory = sqlite3.Row
-    return con
+# Retry policy for writes that lose the race for the database write lock
+WRITE_RETRY_ATTEMPTS = 4
+WRITE_RETRY_BASE_DELAY_SECONDS = 0.05
 
+T = TypeVar("T")
 
-def init_db() -> None:
-    con = connect()
-    cur = con.cursor()
-
-    # USERS
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL,
-        user_type TEXT NOT NULL,                 -- "campus" | "guest"
-        email TEXT UNIQUE,                       -- nullable for guest (phone-only)
-        phone TEXT UNIQUE,                       -- nullable for campus (email-only)
-        is_verified INTEGER NOT NULL DEFAULT 0,  -- OTP verified
-        created_at TEXT NOT NULL
-    )
-    """)
-
-    # OTPs
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS otps (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        code TEXT NOT NULL,
-        expires_at TEXT NOT NULL,
-        used INTEGER NOT NULL DEFAULT 0,
-        created_at TEXT NOT NULL,
-        FOREIGN KEY(user_id) REFERENCES users(id)
-    )
-    """)
-
-    # RIDES
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS rides (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        driver_id INTEGER NOT NULL,
-        from_text TEXT NOT NULL,
-        to_text TEXT NOT NULL,
-        depart_time TEXT NOT NULL,
-        seats_total INTEGER NOT NULL,
-        seats_left INTEGER NOT NULL,
-        vehicle_type TEXT NOT NULL,
-        allow_guests INTEGER NOT NULL DEFAULT 0,
-        distance_km REAL NOT NULL,
-        created_at TEXT NOT NULL,
-        FOREIGN KEY(driver_id) REFERENCES users(id)
-    )
-    """)
-
-    # BOOKINGS
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS bookings (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        ride_id INTEGER NOT NULL,
-        rider_id INTEGER NOT NULL,
-        seats INTEGER NOT NULL,
-        status TEXT NOT NULL,                    -- "CONFIRMED" | "CANCELLED"
-        created_at TEXT NOT NULL,
-        cancelled_at TEXT,
-        FOREIGN KEY(ride_id) REFERENCES rides(id),
-        FOREIGN KEY(rider_id) REFERENCES users(id)
-    )
-    """)
-
-    # NOTIFICATIONS
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS notifications (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        title TEXT NOT NULL,
-        body TEXT NOT NULL,
-        created_at TEXT NOT NULL,
-        is_read INTEGER NOT NULL DEFAULT 0,
-        FOREIGN KEY(user_id) REFERENCES users(id)
-    )
-    """)
-
-    # RATINGS
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS ratings (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        ride_id INTEGER NOT NULL,
-        rater_id INTEGER NOT NULL,
-        driver_id INTEGER NOT NULL,
-        stars INTEGER NOT NULL,
-        comment TEXT,
-        created_at TEXT NOT NULL,
-        FOREIGN KEY(ride_id) REFERENCES rides(id),
-        FOREIGN KEY(rater_id) REFERENCES users(id),
-        FOREIGN KEY(driver_id) REFERENCES users(id)
-    )
-    """)
+class PoolTimeout(RuntimeError):
+    """Raised when no pooled connection becomes free within the checkout timeout."""
+
+
+class WriterBusy(RuntimeError):
+    """Raised when the write queue stays full for longer than the pool timeout."""
+
+
+def connect(read_only: bool = False):
+    """
+    Open a raw connection through the configured driver. Services should
+    use connection() for reads and run_write() for writes instead.
+    """
+    return get_driver().connect(read_only=read_only)
+
+
+class ConnectionPool:
+    """
+    Bounded pool of driver connections: the read-only reader pool, plus the
+    write pool for drivers without a single writer.
+
+    - At most `max_size` connections exist at once; checkout blocks up to
+      `timeout` seconds and then raises PoolTimeout.
+    - Checkout is per thread: nested connection() calls on the same thread
+      get the connection that thread already holds.
+    - Idle connections are pinged before reuse and replaced if broken.
+    """
+
+    def __init__(
+        self,
+        driver: StorageDriver,
+        max_size: int = 8,
+        timeout: float = 10.0,
+        ping_after: float = 30.0,
+        read_only: bool = False,
+    ):
+        self.driver = driver
+        self.read_only = read_only
+        self.max_size = max(int(max_size), 1)
+        self.timeout = float(timeout)
+        self.ping_after = float(ping_after)
+
+        self._idle: "queue.LifoQueue[tuple[Any, float]]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.max_size)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._closed = False
+
+    # ---------- internal ----------
+    def _open(self):
+        con = self.driver.connect(read_only=self.read_only)
+        with self._lock:
+            self._opened += 1
+        return con
+
+    def _discard(self, con) -> None:
+        try:
+            con.close()
+        except self.driver.errors:
+            pass
+        with self._lock:
+            self._opened -= 1
+
+    def _is_healthy(self, con) -> bool:
+        try:
+            con.execute("SELECT 1").fetchone()
+            con.rollback()
+            return True
+        except self.driver.errors:
+            return False
+
+    def _checkout(self):
+        if self._closed:
+            raise RuntimeError("Connection pool is closed")
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolTimeout(f"No database connection available within {self.timeout:.1f}s")
+        try:
+            while True:
+                try:
+                    con, idle_since = self._idle.get_nowait()
+                except queue.Empty:
+                    return self._open()
+                if time.monotonic() - idle_since < self.ping_after or self._is_healthy(con):
+                    return con
+                self._discard(con)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _checkin(self, con) -> None:
+        try:
+            if con.in_transaction:
+                # never hand uncommitted work to the next borrower
+                con.rollback()
+            if self._closed:
+                self._discard(con)
+            else:
+                self._idle.put((con, time.monotonic()))
+        except self.driver.errors:
+            self._discard(con)
+        finally:
+            self._slots.release()
+
+    # ---------- public ----------
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        held = getattr(self._local, "con", None)
+        if held is not None:
+            self._local.depth += 1
+            try:
+                yield held
+            finally:
+                self._local.depth -= 1
+            return
+
+        con = self._checkout()
+        self._local.con = con
+        self._local.depth = 1
+        try:
+            yield con
+        finally:
+            self._local.con = None
+            self._local.depth = 0
+            self._checkin(con)
+
+    def stats(self) -> dict:
+        return {
+            "max_size": self.max_size,
+            "open": self._opened,
+            "idle": self._idle.qsize(),
+        }
+
+    def close(self) -> None:
+        self._closed = True
+        while True:
+            try:
+                con, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(con)
+
+
+_pool: Optional[ConnectionPool] = None
+_write_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+# connection of the write job running on this thread, if any
+_job_local = threading.local()
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    get_driver(),
+                    max_size=settings.DB_POOL_SIZE,
+                    timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+                    read_only=True,
+                )
+    return _pool
+
+
+def get_write_pool() -> ConnectionPool:
+    """
+    Write connections for drivers that allow concurrent writers.
+    """
+    global _write_pool
+    if _write_pool is None:
+        with _pool_lock:
+            if _write_pool is None:
+                _write_pool = ConnectionPool(
+                    get_driver(),
+                    max_size=settings.DB_POOL_SIZE,
+                    timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+                )
+    return _write_pool
+
+
+def close_pool() -> None:
+    """
+    Stop the writer (after it finished the queued jobs) and close the pools.
+    """
+    global _pool, _write_pool, _writer
+    with _pool_lock:
+        if _writer is not None:
+            _writer.close()
+            _writer = None
+        for pool in (_write_pool, _pool):
+            if pool is not None:
+                pool.close()
+        _pool = _write_pool = None
+
+
+def in_write_job() -> bool:
+    return getattr(_job_local, "con", None) is not None
+
+
+@contextmanager
+def connection() -> Iterator[Any]:
+    """
+    Borrow a read-only pooled connection for the current thread.
+    Inside a write job it is the job's connection, so the job reads its
+    own uncommitted changes.
+    """
+    con = getattr(_job_local, "con", None)
+    if con is not None:
+        yield con
+        return
+    with get_pool().connection() as con:
+        yield con
+
+
+# -------------------------------------------------
+# Single writer
+# -------------------------------------------------
+WriteJob = Tuple[Callable[..., Any], tuple, dict, Future]
+
+
+class WriteExecutor:
+    """
+    One thread that owns the only write connection and runs every write.
+
+    Jobs are callables fn(con, *args, **kwargs). The thread takes the next
+    job plus whatever else is already queued (up to `batch_size`, optionally
+    waiting `batch_wait` seconds for more) and runs them in one BEGIN
+    IMMEDIATE transaction, each inside its own SAVEPOINT:
 
+    - a job that raises is rolled back alone and its caller gets the exception;
+    - the others commit together, one fsync for the whole group;
+    - callers get their results only after COMMIT succeeded.
+
+    Jobs must not commit or roll back themselves. Since writes in this
+    process never compete with each other, the write lock is only contended
+    by other processes (workers, manage.py); such busy errors retry the group.
+    """
+
+    _STOP = object()
+
+    def __init__(self, driver: StorageDriver, batch_size: int = 64, batch_wait: float = 0.0,
+                 max_queue: int = 1000, timeout: float = 10.0):
+        self.driver = driver
+        self.batch_size = max(int(batch_size), 1)
+        self.batch_wait = max(float(batch_wait), 0.0)
+        self.timeout = float(timeout)
+        self.con: Any = None
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max(int(max_queue), 1))
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._closed = False
+        self.jobs = 0
+        self.transactions = 0
+        self.failed_jobs = 0
+
+    def _ensure_started(self) -> None:
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Database writer is closed")
+            if self._thread is None:
+                self.con = self.driver.connect()
+                self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, fn: Callable[..., T], *args, **kwargs) -> "Future[T]":
+        self._ensure_started()
+        future: Future = Future()
+        try:
+            self._queue.put((fn, args, kwargs, future), timeout=self.timeout)
+        except queue.Full:
+            raise WriterBusy(f"Write queue still full after {self.timeout:.1f}s")
+        return future
+
+    def run(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        return self.submit(fn, *args, **kwargs).result()
+
+    # ---------- writer thread ----------
+    def _next_group(self, first: WriteJob) -> Tuple[List[WriteJob], bool]:
+        jobs, stop = [first], False
+        deadline = time.monotonic() + self.batch_wait
+        while len(jobs) < self.batch_size:
+            try:
+                wait = deadline - time.monotonic()
+                job = self._queue.get(timeout=wait) if wait > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is self._STOP:
+                stop = True
+                break
+            jobs.append(job)
+        return jobs, stop
+
+    def _run_group(self, jobs: List[WriteJob]) -> List[Tuple[bool, Any]]:
+        con = self.con
+        self.driver.begin_write(con)
+        outcomes: List[Tuple[bool, Any]] = []
+        try:
+            for fn, args, kwargs, _ in jobs:
+                con.execute("SAVEPOINT write_job")
+                try:
+                    value = fn(con, *args, **kwargs)
+                except Exception as e:
+                    con.execute("ROLLBACK TO write_job")
+                    con.execute("RELEASE write_job")
+                    if is_busy_error(e):
+                        raise
+                    outcomes.append((False, e))
+                else:
+                    con.execute("RELEASE write_job")
+                    outcomes.append((True, value))
+            con.commit()
+        except BaseException:
+            con.rollback()
+            raise
+        return outcomes
+
+    def _execute(self, jobs: List[WriteJob]) -> None:
+        jobs = [job for job in jobs if job[3].set_running_or_notify_cancel()]
+        if not jobs:
+            return
+        try:
+            # nothing of a failed attempt was committed, so the group can rerun
+            outcomes = with_write_retry(self._run_group, jobs)
+        except Exception as e:
+            self.failed_jobs += len(jobs)
+            for job in jobs:
+                job[3].set_exception(e)
+            return
+        self.jobs += len(jobs)
+        self.transactions += 1
+        for job, (ok, value) in zip(jobs, outcomes):
+            if ok:
+                job[3].set_result(value)
+            else:
+                self.failed_jobs += 1
+                job[3].set_exception(value)
+
+    def _run(self) -> None:
+        _job_local.con = self.con
+        try:
+            while True:
+                job = self._queue.get()
+                if job is self._STOP:
+                    return
+                jobs, stop = self._next_group(job)
+                self._execute(jobs)
+                if stop:
+                    return
+        finally:
+            self.con.close()
+            # jobs that raced with close() are failed rather than left hanging
+            while True:
+                try:
+                    job = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is not self._STOP and job[3].set_running_or_notify_cancel():
+                    job[3].set_exception(RuntimeError("Database writer is closed"))
+
+    # ---------- public ----------
+    def stats(self) -> dict:
+        return {
+            "running": self._thread is not None and self._thread.is_alive(),
+            "pending": self._queue.qsize(),
+            "jobs": self.jobs,
+            "transactions": self.transactions,
+            "avg_jobs_per_transaction": round(self.jobs / self.transactions, 2) if self.transactions else 0.0,
+            "failed_jobs": self.failed_jobs,
+        }
+
+    def close(self, timeout: float = 10.0) -> None:
+        """
+        Stop accepting jobs, finish everything already queued and stop the thread.
+        """
+        with self._lock:
+            self._closed = True
+            thread = self._thread
+        if thread is not None:
+            self._queue.put(self._STOP)
+            thread.join(timeout)
+
+
+_writer: Optional[WriteExecutor] = None
+
+
+def get_writer() -> WriteExecutor:
+    global _writer
+    if _writer is None:
+        with _pool_lock:
+            if _writer is None:
+                _writer = WriteExecutor(
+                    get_driver(),
+                    batch_size=settings.DB_WRITE_BATCH_SIZE,
+                    batch_wait=settings.DB_WRITE_BATCH_WAIT_MS / 1000.0,
+                    max_queue=settings.DB_WRITE_QUEUE_SIZE,
+                    timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+                )
+    return _writer
+
+
+def _run_write_direct(fn: Callable[..., T], *args, **kwargs) -> T:
+    driver = get_driver()
+    with get_write_pool().connection() as con:
+        driver.begin_write(con)
+        _job_local.con = con
+        try:
+            value = fn(con, *args, **kwargs)
+        except BaseException:
+            con.rollback()
+            raise
+        finally:
+            _job_local.con = None
+        con.commit()
+        return value
+
+
+def run_write(fn: Callable[..., T], *args, **kwargs) -> T:
+    """
+    Run fn(con, *args, **kwargs) as a write job and return its result (or
+    raise its exception) once committed. With a single-writer driver the job
+    is group-committed on the writer thread; otherwise it runs here in its
+    own transaction on a pooled write connection, retried on lock conflicts.
+    Post-commit side effects belong in the caller.
+    """
+    con = getattr(_job_local, "con", None)
+    if con is not None:
+        # a write issued from inside a job joins that job's transaction
+        return fn(con, *args, **kwargs)
+    if get_driver().single_writer:
+        return get_writer().run(fn, *args, **kwargs)
+    return with_write_retry(_run_write_direct, fn, *args, **kwargs)
+
+
+def insert_returning_id(con, sql: str, params) -> int:
+    """
+    Run an INSERT into a table with an `id` key and return the new id.
+    """
+    return get_driver().insert_returning_id(con, sql, params)
+
+
+def db_stats() -> Dict[str, object]:
+    driver = get_driver()
+    stats: Dict[str, object] = {"driver": driver.name, "readers": get_pool().stats()}
+    if driver.single_writer:
+        stats["writer"] = get_writer().stats()
+    else:
+        stats["writers"] = get_write_pool().stats()
+    return stats
+
+
+def is_busy_error(exc: BaseException) -> bool:
+    return get_driver().is_busy_error(exc)
+
+
+def with_write_retry(fn: Callable[..., T], *args, **kwargs) -> T:
+    """
+    Run a write unit, retrying with jittered exponential backoff when it
+    could not get the write lock within busy_timeout (only another process
+    can hold it). Business errors (ValueError) are never retried.
+    """
+    for attempt in range(WRITE_RETRY_ATTEMPTS):
+        try:
+            return fn(*args, **kwargs)
+        except get_driver().errors as e:
+            if not is_busy_error(e) or attempt == WRITE_RETRY_ATTEMPTS - 1:
+                raise
+            delay = WRITE_RETRY_BASE_DELAY_SECONDS * (2 ** attempt)
+            time.sleep(delay * random.uniform(0.5, 1.5))
+    raise AssertionError("unreachable")
+
+
+def storage_report() -> Dict[str, object]:
+    with connection() as con:
+        return get_driver().storage_report(con)
+
+
+def _sync_emission_factors(driver: StorageDriver, con) -> None:
+    driver.begin_write(con)
+    try:
+        sync_emission_factors(con)
+    except BaseException:
+        con.rollback()
+        raise
     con.commit()
-    con.close()
+
+
+def init_db() -> List[int]:
+    """
+    Bring the schema up to date. Returns the migration versions applied.
+    Migrations manage their own transactions, so they run on a dedicated
+    connection rather than as a write job. Drivers whose schema is managed
+    externally only have its version checked.
+    """
+    driver = get_driver()
+    con = connect()
+    try:
+        if driver.runs_migrations:
+            applied = run_migrations(con)
+        else:
+            expected = max(m.version for m in MIGRATIONS)
+            found = current_version(con) if driver.has_table(con, "schema_migrations") else 0
+            con.rollback()
+            if found < expected:
+                raise RuntimeError(f"{driver.name} schema is at v{found}, expected v{expected}")
+            applied = []
+        # config may have changed since the last start
+        with_write_retry(_sync_emission_factors, driver, con)
+        return applied
+    finally:
+        con.close()
+
+
+def schema_version() -> int:
+    with connection() as con:
+        return current_version(con)
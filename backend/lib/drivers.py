@@ -0,0 +1,468 @@
+from __future__ import annotations
+
+import abc
+import sqlite3
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from .settings import settings
+
+try:  # optional: only needed for DB_TYPE=postgres
+    import psycopg
+except ImportError:  # pragma: no cover - SQLite drivers need nothing extra
+    psycopg = None
+
+
+JOURNAL_MODES = {"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"}
+SYNCHRONOUS_LEVELS = {"OFF", "NORMAL", "FULL", "EXTRA"}
+TEMP_STORES = {"DEFAULT", "FILE", "MEMORY"}
+
+# PRAGMA synchronous / temp_store read back as integers
+_SYNCHRONOUS_NAMES = {0: "OFF", 1: "NORMAL", 2: "FULL", 3: "EXTRA"}
+_TEMP_STORE_NAMES = {0: "DEFAULT", 1: "FILE", 2: "MEMORY"}
+
+# SQLSTATEs worth retrying: serialization_failure, deadlock_detected, lock_not_available
+_PG_RETRYABLE_STATES = {"40001", "40P01", "55P03"}
+
+
+# -------------------------------------------------
+# SQLite storage profile
+# -------------------------------------------------
+def _storage_pragmas() -> Dict[str, object]:
+    """
+    PRAGMA values from the configured storage profile, validated because
+    PRAGMA arguments cannot be bound as parameters.
+    """
+    if settings.DB_JOURNAL_MODE not in JOURNAL_MODES:
+        raise ValueError(f"Invalid storage_profile.journal_mode: {settings.DB_JOURNAL_MODE}")
+    if settings.DB_SYNCHRONOUS not in SYNCHRONOUS_LEVELS:
+        raise ValueError(f"Invalid storage_profile.synchronous: {settings.DB_SYNCHRONOUS}")
+    if settings.DB_TEMP_STORE not in TEMP_STORES:
+        raise ValueError(f"Invalid storage_profile.temp_store: {settings.DB_TEMP_STORE}")
+
+    return {
+        "journal_mode": settings.DB_JOURNAL_MODE,
+        "synchronous": settings.DB_SYNCHRONOUS,
+        # negative cache_size is interpreted by SQLite as KiB instead of pages
+        "cache_size": -abs(int(settings.DB_CACHE_SIZE_KB)),
+        "mmap_size": max(int(settings.DB_MMAP_SIZE_MB), 0) * 1024 * 1024,
+        "busy_timeout": max(int(settings.DB_BUSY_TIMEOUT_MS), 0),
+        "temp_store": settings.DB_TEMP_STORE,
+    }
+
+
+def apply_storage_profile(con) -> None:
+    for name, value in _storage_pragmas().items():
+        con.execute(f"PRAGMA {name}={value}")
+
+
+# -------------------------------------------------
+# DB-API adapter
+# -------------------------------------------------
+@lru_cache(maxsize=1024)
+def translate_placeholders(sql: str, paramstyle: str) -> str:
+    """
+    Rewrite the services' qmark SQL for a driver's paramstyle. For "format"
+    and "pyformat", ? becomes %s outside quotes and comments, and every
+    literal % is doubled (those drivers scan for % everywhere).
+    """
+    if paramstyle == "qmark":
+        return sql
+    if paramstyle not in ("format", "pyformat"):
+        raise ValueError(f"Unsupported paramstyle: {paramstyle}")
+    out: List[str] = []
+    quote: Optional[str] = None
+    comment = False
+    for i, ch in enumerate(sql):
+        if ch == "%":
+            ch = "%%"
+        elif comment:
+            comment = ch != "\n"
+        elif quote:
+            if ch == quote:
+                quote = None
+        elif ch in ("'", '"'):
+            quote = ch
+        elif ch == "-" and sql.startswith("--", i):
+            comment = True
+        elif ch == "?":
+            ch = "%s"
+        out.append(ch)
+    return "".join(out)
+
+
+class Row:
+    """
+    Result row addressable by position or column name, like sqlite3.Row
+    (so dict(row), row["id"] and row[0] work the same on every driver).
+    """
+
+    __slots__ = ("_values", "_index")
+
+    def __init__(self, values: Sequence[Any], index: Dict[str, int]):
+        self._values = tuple(values)
+        self._index = index
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self._values[self._index[key]]
+        return self._values[key]
+
+    def keys(self) -> List[str]:
+        return list(self._index)
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self._values)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __repr__(self) -> str:
+        return f"Row({dict(zip(self._index, self._values))!r})"
+
+
+class DBAPICursor:
+    def __init__(self, raw, paramstyle: str):
+        self._raw = raw
+        self._paramstyle = paramstyle
+        self._index: Dict[str, int] = {}
+
+    def _described(self) -> None:
+        description = self._raw.description or ()
+        self._index = {d[0]: i for i, d in enumerate(description)}
+
+    def execute(self, sql: str, params: Sequence[Any] = ()) -> "DBAPICursor":
+        self._raw.execute(translate_placeholders(sql, self._paramstyle), tuple(params))
+        self._described()
+        return self
+
+    def executemany(self, sql: str, seq_of_params) -> "DBAPICursor":
+        self._raw.executemany(translate_placeholders(sql, self._paramstyle), [tuple(p) for p in seq_of_params])
+        return self
+
+    def fetchone(self) -> Optional[Row]:
+        values = self._raw.fetchone()
+        return None if values is None else Row(values, self._index)
+
+    def fetchall(self) -> List[Row]:
+        return [Row(values, self._index) for values in self._raw.fetchall()]
+
+    def __iter__(self) -> Iterator[Row]:
+        return iter(self.fetchall())
+
+    @property
+    def rowcount(self) -> int:
+        return self._raw.rowcount
+
+    @property
+    def lastrowid(self):
+        return getattr(self._raw, "lastrowid", None)
+
+    @property
+    def description(self):
+        return self._raw.description
+
+
+class DBAPIConnection:
+    """
+    sqlite3-style facade over any DB-API 2 connection: con.execute(), ?
+    placeholders, name-addressable rows and in_transaction, so service code
+    does not depend on the driver.
+    """
+
+    def __init__(self, raw, paramstyle: str):
+        self.raw = raw
+        self.paramstyle = paramstyle
+        self._dirty = False
+
+    def cursor(self) -> DBAPICursor:
+        self._dirty = True
+        return DBAPICursor(self.raw.cursor(), self.paramstyle)
+
+    def execute(self, sql: str, params: Sequence[Any] = ()) -> DBAPICursor:
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql: str, seq_of_params) -> DBAPICursor:
+        return self.cursor().executemany(sql, seq_of_params)
+
+    @property
+    def in_transaction(self) -> bool:
+        status = getattr(self.raw, "in_transaction", None)
+        # DB-API opens a transaction implicitly on the first statement
+        return bool(status) if status is not None else self._dirty
+
+    def commit(self) -> None:
+        self.raw.commit()
+        self._dirty = False
+
+    def rollback(self) -> None:
+        self.raw.rollback()
+        self._dirty = False
+
+    def close(self) -> None:
+        self.raw.close()
+
+
+# -------------------------------------------------
+# Drivers
+# -------------------------------------------------
+class StorageDriver(abc.ABC):
+    """
+    What db.py needs from a database: opening connections, starting a write
+    transaction, telling retryable lock/serialization errors apart, and the
+    few statements whose syntax differs (generated ids, catalog lookups).
+    Connections behave like sqlite3 ones, see DBAPIConnection.
+    """
+
+    name = ""
+    dialect = ""
+    # True: every write goes through the single writer thread (db.WriteExecutor);
+    # False: writes run concurrently on a pool of write connections
+    single_writer = False
+    # False: the schema is provisioned externally; init_db only checks its version
+    runs_migrations = True
+    errors: Tuple[type, ...] = (Exception,)
+
+    @abc.abstractmethod
+    def connect(self, read_only: bool = False):
+        ...
+
+    def begin_write(self, con) -> None:
+        """Start the write transaction a write job runs in."""
+
+    def is_busy_error(self, exc: BaseException) -> bool:
+        return False
+
+    def insert_returning_id(self, con, sql: str, params: Sequence[Any]) -> int:
+        row = con.execute(f"{sql} RETURNING id", params).fetchone()
+        return int(row[0])
+
+    @abc.abstractmethod
+    def has_table(self, con, name: str) -> bool:
+        ...
+
+    def storage_report(self, con) -> Dict[str, object]:
+        return {}
+
+    def floor_int_sql(self, expr: str) -> str:
+        """SQL for the integer floor of a non-negative REAL expression."""
+        return f"CAST(FLOOR({expr}) AS BIGINT)"
+
+    def replica_lag_seconds(self, con) -> Optional[float]:
+        """
+        How far the replica behind `con` trails its primary, or None if the
+        server can't tell (such a replica is never read from).
+        """
+        return None
+
+
+class SQLiteDriver(StorageDriver):
+    """
+    Native sqlite3 connections with the storage profile applied; one writer
+    thread per process owns all writes.
+    """
+
+    name = "sqlite"
+    dialect = "sqlite"
+    single_writer = True
+    errors = (sqlite3.Error,)
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        # only touch the filesystem once, when the driver is created
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+
+    def _open(self) -> sqlite3.Connection:
+        # pooled connections migrate between threadpool workers, so the
+        # same-thread check is replaced by the pool's own per-thread checkout
+        con = sqlite3.connect(
+            str(self.db_path),
+            timeout=max(settings.DB_BUSY_TIMEOUT_MS, 0) / 1000.0,
+            check_same_thread=False,
+        )
+        apply_storage_profile(con)
+        return con
+
+    def connect(self, read_only: bool = False):
+        con = self._open()
+        con.row_factory = sqlite3.Row
+        if read_only:
+            # a stray write on a reader fails fast instead of taking the write lock
+            con.execute("PRAGMA query_only=ON")
+        return con
+
+    def begin_write(self, con) -> None:
+        con.execute("BEGIN IMMEDIATE")
+
+    def is_busy_error(self, exc: BaseException) -> bool:
+        if not isinstance(exc, sqlite3.OperationalError):
+            return False
+        msg = str(exc).lower()
+        return "database is locked" in msg or "database is busy" in msg
+
+    def insert_returning_id(self, con, sql: str, params: Sequence[Any]) -> int:
+        return int(con.execute(sql, params).lastrowid)
+
+    def has_table(self, con, name: str) -> bool:
+        row = con.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (name,)).fetchone()
+        return row is not None
+
+    def floor_int_sql(self, expr: str) -> str:
+        # FLOOR() needs SQLite's optional math functions; CAST truncates
+        return f"CAST({expr} AS INTEGER)"
+
+    def storage_report(self, con) -> Dict[str, object]:
+        """
+        PRAGMA values as SQLite actually applied them (e.g. journal_mode falls
+        back to "memory" for in-memory databases).
+        """
+        report: Dict[str, object] = {}
+        for name in _storage_pragmas():
+            row = con.execute(f"PRAGMA {name}").fetchone()
+            report[name] = row[0] if row else None
+        report["synchronous"] = _SYNCHRONOUS_NAMES.get(report["synchronous"], report["synchronous"])
+        report["temp_store"] = _TEMP_STORE_NAMES.get(report["temp_store"], report["temp_store"])
+        return report
+
+    def open_snapshot_source(self) -> sqlite3.Connection:
+        """
+        Raw read-only connection to the database file, for copy_to().
+        """
+        con = sqlite3.connect(
+            str(self.db_path),
+            timeout=max(settings.DB_BUSY_TIMEOUT_MS, 0) / 1000.0,
+            check_same_thread=False,
+        )
+        con.execute("PRAGMA query_only=ON")
+        return con
+
+    @staticmethod
+    def copy_to(source: sqlite3.Connection, target: Path) -> None:
+        """
+        Consistent copy of the database behind `source` into `target` via the
+        online backup API; writers keep going while it runs.
+        """
+        for suffix in ("", "-wal", "-shm", "-journal"):
+            Path(f"{target}{suffix}").unlink(missing_ok=True)
+        dst = sqlite3.connect(str(target))
+        try:
+            source.backup(dst)
+        finally:
+            dst.close()
+
+
+class SQLiteServerDriver(SQLiteDriver):
+    """
+    Local stand-in for a client-server database: the same SQLite file, but
+    driven through the server code path (DB-API adapter rows, RETURNING ids,
+    a pool of concurrent writers with lock-conflict retries).
+    """
+
+    name = "sqlite-server"
+    single_writer = False
+
+    def connect(self, read_only: bool = False):
+        con = self._open()
+        if read_only:
+            con.execute("PRAGMA query_only=ON")
+        return DBAPIConnection(con, sqlite3.paramstyle)
+
+    def insert_returning_id(self, con, sql: str, params: Sequence[Any]) -> int:
+        return StorageDriver.insert_returning_id(self, con, sql, params)
+
+
+class PostgresDriver(StorageDriver):
+    """
+    PostgreSQL through psycopg 3. Writers run concurrently at SERIALIZABLE
+    isolation, so the services' read-check-write sequences stay safe and
+    conflicts surface as retryable serialization failures.
+    The schema is expected to be provisioned by the deployment.
+    """
+
+    name = "postgres"
+    dialect = "postgresql"
+    runs_migrations = False
+
+    def __init__(self, url: str):
+        if psycopg is None:
+            raise RuntimeError("DB_TYPE=postgres requires the psycopg package (pip install 'psycopg[binary]')")
+        if not url:
+            raise ValueError("DB_TYPE=postgres requires database.url (or DATABASE_URL)")
+        self.url = url
+        self.errors = (psycopg.Error,)
+
+    def connect(self, read_only: bool = False):
+        raw = psycopg.connect(self.url, autocommit=False)
+        if read_only:
+            raw.read_only = True
+        else:
+            raw.isolation_level = psycopg.IsolationLevel.SERIALIZABLE
+        return DBAPIConnection(raw, psycopg.paramstyle)
+
+    def is_busy_error(self, exc: BaseException) -> bool:
+        return getattr(exc, "sqlstate", None) in _PG_RETRYABLE_STATES
+
+    def has_table(self, con, name: str) -> bool:
+        row = con.execute("SELECT to_regclass(?)", (name,)).fetchone()
+        return row is not None and row[0] is not None
+
+    def storage_report(self, con) -> Dict[str, object]:
+        row = con.execute("SHOW server_version").fetchone()
+        return {"server_version": row[0] if row else None}
+
+    def replica_lag_seconds(self, con) -> Optional[float]:
+        """
+        A streaming standby that replayed everything it received holds every
+        commit up to its last message from the primary, so its lag is that
+        message's age (plus the replay backlog's, if any). A standby that is
+        not streaming (lost its primary, or pg_stat_wal_receiver is hidden
+        from this role) only vouches for its last replayed transaction.
+        """
+        row = con.execute(
+            """
+            SELECT pg_is_in_recovery(),
+                   w.status,
+                   EXTRACT(EPOCH FROM now() - w.last_msg_receipt_time),
+                   pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn(),
+                   EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+            FROM (SELECT 1) AS one
+            LEFT JOIN pg_stat_wal_receiver w ON true
+            """
+        ).fetchone()
+        con.rollback()
+        if row is None or not row[0]:
+            return None
+        _, status, receipt_age, caught_up, replay_age = row
+        if status == "streaming" and receipt_age is not None:
+            ages = [receipt_age] if caught_up else [receipt_age, replay_age]
+        else:
+            ages = [replay_age]
+        if any(age is None for age in ages):
+            return None
+        return max(float(age) for age in ages)
+
+
+_driver: Optional[StorageDriver] = None
+_driver_lock = threading.Lock()
+
+
+def get_driver() -> StorageDriver:
+    """
+    The driver for settings.DB_TYPE: "sqlite", "sqlite-server" or "postgres".
+    """
+    global _driver
+    if _driver is None:
+        with _driver_lock:
+            if _driver is None:
+                db_type = settings.DB_TYPE
+                if db_type == "sqlite":
+                    _driver = SQLiteDriver(settings.db_path_abs)
+                elif db_type == "sqlite-server":
+                    _driver = SQLiteServerDriver(settings.db_path_abs)
+                elif db_type == "postgres":
+                    _driver = PostgresDriver(settings.DB_URL)
+                else:
+                    raise ValueError(f"Unsupported database.type: {db_type}")
+    return _driver
@@ -0,0 +1,266 @@
+from __future__ import annotations
+
+import bisect
+import re
+import sqlite3
+import threading
+import unicodedata
+from typing import Any, Dict, List, Optional, Tuple
+
+from .drivers import get_driver
+from .utils import utc_iso
+
+# Upper bound on prefix-index entries scanned per autocomplete call
+AUTOCOMPLETE_SCAN_LIMIT = 500
+
+_NON_ALNUM_RE = re.compile(r"[^0-9a-z]+")
+_APOSTROPHE_RE = re.compile(r"['\u2019]")
+
+# Spelled-out form of abbreviations common in campus / city place names
+_ABBREVIATIONS = {
+    "apt": "apartments",
+    "apts": "apartments",
+    "ave": "avenue",
+    "bldg": "building",
+    "blvd": "boulevard",
+    "centre": "center",
+    "ctr": "center",
+    "coll": "college",
+    "dept": "department",
+    "govt": "government",
+    "hosp": "hospital",
+    "hwy": "highway",
+    "intl": "international",
+    "ln": "lane",
+    "mkt": "market",
+    "mt": "mount",
+    "natl": "national",
+    "opp": "opposite",
+    "rd": "road",
+    "rly": "railway",
+    "sq": "square",
+    "st": "street",
+    "stn": "station",
+    "uni": "university",
+    "univ": "university",
+}
+# Dropped from the start of a multi-word name ("The Mall" == "Mall")
+_LEADING_STOPWORDS = frozenset({"the"})
+
+# (name, lat, lon)
+PlaceInfo = Tuple[str, Optional[float], Optional[float]]
+
+
+def place_key(text: str, partial: bool = False) -> str:
+    """
+    Lookup key for a place name: case, accents-as-composed, punctuation and
+    spacing differences collapse ("Main Gate", " main-gate. " -> "main gate"),
+    "&" reads as "and", abbreviations are spelled out ("Station Rd" ->
+    "station road") and a leading "the" is dropped. With partial=True the
+    last word is kept as typed, so it still works as a prefix ("st" must
+    complete to "Stadium").
+
+    Changing these rules changes stored keys: add a migration running
+    rekey_place_aliases().
+    """
+    t = unicodedata.normalize("NFKC", text or "").casefold()
+    words = _NON_ALNUM_RE.sub(" ", _APOSTROPHE_RE.sub("", t).replace("&", " and ")).split()
+    if not words:
+        # names made only of symbols still get a stable key
+        return " ".join(t.split())
+    spelled = len(words) - 1 if partial else len(words)
+    words = [_ABBREVIATIONS.get(w, w) if i < spelled else w for i, w in enumerate(words)]
+    while len(words) > 1 and words[0] in _LEADING_STOPWORDS:
+        words = words[1:]
+    return " ".join(words)
+
+
+def _word_starts(key: str) -> List[int]:
+    return [0] + [i + 1 for i, ch in enumerate(key) if ch == " "]
+
+
+# -------------------------------------------------
+# Schema helpers (run inside migrations / write jobs)
+# -------------------------------------------------
+def resolve_or_create_place(con, text: str, point: Optional[Tuple[float, float]] = None) -> Tuple[int, bool]:
+    """
+    Place id for free text, creating the place (named as typed) when no
+    alias matches. Returns (place_id, created). Runs inside a write job.
+    """
+    key = place_key(text)
+    row = con.execute("SELECT place_id FROM place_aliases WHERE alias=?", (key,)).fetchone()
+    if row is not None:
+        return int(row[0]), False
+    lat, lon = point if point is not None else (None, None)
+    place_id = get_driver().insert_returning_id(
+        con,
+        "INSERT INTO places (name, lat, lon, created_at) VALUES (?, ?, ?, ?)",
+        (text.strip(), lat, lon, utc_iso()),
+    )
+    con.execute("INSERT INTO place_aliases (alias, place_id) VALUES (?, ?)", (key, place_id))
+    return place_id, True
+
+
+def backfill_ride_places(con: sqlite3.Connection) -> None:
+    """
+    Migration step: one place per distinct endpoint key of existing rides.
+    """
+    rows = con.execute(
+        "SELECT id, from_text, to_text, from_lat, from_lon, to_lat, to_lon FROM rides ORDER BY id"
+    ).fetchall()
+    for r in rows:
+        from_point = (r[3], r[4]) if r[3] is not None and r[4] is not None else None
+        to_point = (r[5], r[6]) if r[5] is not None and r[6] is not None else None
+        from_id, _ = resolve_or_create_place(con, r[1], from_point)
+        to_id, _ = resolve_or_create_place(con, r[2], to_point)
+        con.execute("UPDATE rides SET from_place_id=?, to_place_id=? WHERE id=?", (from_id, to_id, r[0]))
+
+
+def merge_place(con, old: int, target: int) -> int:
+    """
+    Move the rides of place `old` to `target` and delete `old`; its aliases
+    must already point elsewhere. Returns ride endpoints moved.
+    """
+    moved = con.execute("UPDATE rides SET from_place_id=? WHERE from_place_id=?", (target, old)).rowcount
+    moved += con.execute("UPDATE rides SET to_place_id=? WHERE to_place_id=?", (target, old)).rowcount
+    # keep the merged place's coordinates if the target has none
+    con.execute(
+        """
+        UPDATE places SET lat = (SELECT lat FROM places WHERE id=?), lon = (SELECT lon FROM places WHERE id=?)
+        WHERE id=? AND lat IS NULL
+        """,
+        (old, old, target),
+    )
+    con.execute("DELETE FROM places WHERE id=?", (old,))
+    return moved
+
+
+def rekey_place_aliases(con) -> None:
+    """
+    Migration step: rewrite stored alias keys under the current place_key()
+    rules. Places whose aliases now share a key are merged into the oldest.
+    Aliases are deleted and re-inserted, so running gazetteers sync them.
+    """
+    rows = con.execute("SELECT alias, place_id FROM place_aliases ORDER BY place_id, id").fetchall()
+    merged_into: Dict[int, int] = {}
+
+    def survivor(place_id: int) -> int:
+        while place_id in merged_into:
+            place_id = merged_into[place_id]
+        return place_id
+
+    owners: Dict[str, int] = {}
+    for r in rows:
+        place_id = survivor(int(r[1]))
+        key = place_key(r[0])
+        owner = survivor(owners.setdefault(key, place_id))
+        if owner != place_id:
+            # place ids grow with age: the smaller one survives
+            old, target = max(owner, place_id), min(owner, place_id)
+            merged_into[old] = target
+
+    con.execute("DELETE FROM place_aliases")
+    con.executemany(
+        "INSERT INTO place_aliases (alias, place_id) VALUES (?, ?)",
+        [(key, survivor(place_id)) for key, place_id in owners.items()],
+    )
+    for old in sorted(merged_into):
+        merge_place(con, old, survivor(old))
+
+
+# -------------------------------------------------
+# In-memory index
+# -------------------------------------------------
+class Gazetteer:
+    """
+    In-memory copy of places + aliases.
+
+    - resolve(): exact alias-key lookup, a dict hit.
+    - complete(): prefix match at any word start of any alias, via bisect
+      on a sorted list of (key suffix, word offset, place_id).
+
+    sync() applies alias rows added since the last sync (alias ids only
+    grow; a re-pointed alias is deleted and re-inserted, so it syncs too).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._places: Dict[int, PlaceInfo] = {}
+        self._aliases: Dict[str, int] = {}
+        self._index: List[Tuple[str, int, int]] = []
+        self._last_alias_id = 0
+        self.loaded = False
+
+    def _unindex(self, key: str, place_id: int) -> None:
+        for start in _word_starts(key):
+            entry = (key[start:], start, place_id)
+            i = bisect.bisect_left(self._index, entry)
+            if i < len(self._index) and self._index[i] == entry:
+                del self._index[i]
+
+    def _apply(self, alias_id: int, key: str, place_id: int, info: PlaceInfo) -> None:
+        self._places[place_id] = info
+        old = self._aliases.get(key)
+        if old != place_id:
+            if old is not None:
+                self._unindex(key, old)
+            self._aliases[key] = place_id
+            for start in _word_starts(key):
+                bisect.insort(self._index, (key[start:], start, place_id))
+        self._last_alias_id = max(self._last_alias_id, alias_id)
+
+    def sync(self, con) -> int:
+        """
+        Load alias rows newer than the last sync. Returns how many.
+        """
+        rows = con.execute(
+            """
+            SELECT a.id, a.alias, a.place_id, p.name, p.lat, p.lon
+            FROM place_aliases a JOIN places p ON p.id = a.place_id
+            WHERE a.id > ?
+            ORDER BY a.id
+            """,
+            (self._last_alias_id,),
+        ).fetchall()
+        with self._lock:
+            for r in rows:
+                if int(r[0]) > self._last_alias_id:
+                    self._apply(int(r[0]), r[1], int(r[2]), (r[3], r[4], r[5]))
+            self.loaded = True
+        return len(rows)
+
+    def resolve(self, text: str) -> Optional[int]:
+        return self._aliases.get(place_key(text))
+
+    def complete(self, prefix: str, limit: int) -> List[Dict[str, Any]]:
+        """
+        Places with an alias word starting with `prefix`; places matched at
+        the start of an alias first, then shorter names.
+        """
+        key = place_key(prefix, partial=True)
+        if not key:
+            return []
+        best: Dict[int, int] = {}
+        with self._lock:
+            i = bisect.bisect_left(self._index, (key,))
+            end = min(len(self._index), i + AUTOCOMPLETE_SCAN_LIMIT)
+            while i < end and self._index[i][0].startswith(key):
+                _, start, place_id = self._index[i]
+                if place_id not in best or start < best[place_id]:
+                    best[place_id] = start
+                i += 1
+            places = {pid: self._places[pid] for pid in best}
+
+        ranked = sorted(best, key=lambda pid: (best[pid] > 0, len(places[pid][0]), places[pid][0], pid))
+        return [
+            {"id": pid, "name": places[pid][0], "lat": places[pid][1], "lon": places[pid][2]}
+            for pid in ranked[:limit]
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "loaded": self.loaded,
+            "places": len(self._places),
+            "aliases": len(self._aliases),
+            "index_entries": len(self._index),
+        }
@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import math
+import sqlite3
+from typing import Optional, Tuple
+
+from .drivers import get_driver
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = 111.32
+# Ranking: an hour between the wanted and the actual departure weighs like
+# this many km of driver detour
+DETOUR_KM_PER_HOUR = 5.0
+
+# (lat, lon) in degrees
+Point = Tuple[float, float]
+
+_geo_index_available: Optional[bool] = None
+
+
+def validate_point(lat: Optional[float], lon: Optional[float], label: str) -> Optional[Point]:
+    if lat is None and lon is None:
+        return None
+    if lat is None or lon is None:
+        raise ValueError(f"{label}_lat and {label}_lon must be given together")
+    if not (-90.0 <= lat <= 90.0) or not (-180.0 <= lon <= 180.0):
+        raise ValueError(f"{label} coordinates out of range")
+    return float(lat), float(lon)
+
+
+def haversine_km(a: Point, b: Point) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(h)))
+
+
+def bounding_box(center: Point, radius_km: float) -> Tuple[float, float, float, float]:
+    """
+    (min_lat, max_lat, min_lon, max_lon) containing every point within
+    radius_km of center. Not split at the antimeridian.
+    """
+    lat, lon = center
+    dlat = radius_km / KM_PER_DEGREE_LAT
+    cos_lat = math.cos(math.radians(lat))
+    dlon = 180.0 if cos_lat < 1e-6 else min(radius_km / (KM_PER_DEGREE_LAT * cos_lat), 180.0)
+    return max(lat - dlat, -90.0), min(lat + dlat, 90.0), max(lon - dlon, -180.0), min(lon + dlon, 180.0)
+
+
+def detour_km(origin: Point, destination: Point, pickup: Point, dropoff: Point) -> float:
+    """
+    Extra straight-line distance for a driver going origin -> pickup ->
+    dropoff -> destination instead of origin -> destination.
+    """
+    via = haversine_km(origin, pickup) + haversine_km(pickup, dropoff) + haversine_km(dropoff, destination)
+    return max(via - haversine_km(origin, destination), 0.0)
+
+
+def create_geo_index(con: sqlite3.Connection) -> None:
+    """
+    Migration step: 4-D R*Tree over (from_lat, from_lon, to_lat, to_lon), so
+    "origin near A and destination near B" is one index lookup. Kept in sync
+    by triggers and filled from the rides that already have coordinates;
+    rides without both endpoints' coordinates are not indexed.
+    Without the R*Tree module, a B-tree on the origin coordinates backs a
+    bounding-box scan instead.
+    """
+    try:
+        con.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS rides_geo USING rtree(
+                id,
+                from_lat_min, from_lat_max, from_lon_min, from_lon_max,
+                to_lat_min, to_lat_max, to_lon_min, to_lon_max
+            )
+        """)
+    except sqlite3.OperationalError:
+        con.execute("CREATE INDEX IF NOT EXISTS idx_rides_from_geo ON rides(from_lat, from_lon)")
+        return
+
+    insert = """
+        INSERT INTO rides_geo VALUES (
+            new.id,
+            new.from_lat, new.from_lat, new.from_lon, new.from_lon,
+            new.to_lat, new.to_lat, new.to_lon, new.to_lon
+        );
+    """
+    complete = "new.from_lat IS NOT NULL AND new.from_lon IS NOT NULL AND new.to_lat IS NOT NULL AND new.to_lon IS NOT NULL"
+    con.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS rides_geo_ai AFTER INSERT ON rides
+        WHEN {complete} BEGIN
+            {insert}
+        END
+    """)
+    con.execute("""
+        CREATE TRIGGER IF NOT EXISTS rides_geo_ad AFTER DELETE ON rides BEGIN
+            DELETE FROM rides_geo WHERE id = old.id;
+        END
+    """)
+    con.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS rides_geo_au AFTER UPDATE OF from_lat, from_lon, to_lat, to_lon ON rides BEGIN
+            DELETE FROM rides_geo WHERE id = old.id;
+            INSERT INTO rides_geo SELECT
+                new.id,
+                new.from_lat, new.from_lat, new.from_lon, new.from_lon,
+                new.to_lat, new.to_lat, new.to_lon, new.to_lon
+            WHERE {complete};
+        END
+    """)
+    con.execute("""
+        INSERT INTO rides_geo SELECT
+            id, from_lat, from_lat, from_lon, from_lon, to_lat, to_lat, to_lon, to_lon
+        FROM rides
+        WHERE from_lat IS NOT NULL AND from_lon IS NOT NULL AND to_lat IS NOT NULL AND to_lon IS NOT NULL
+            AND id NOT IN (SELECT id FROM rides_geo)
+    """)
+
+
+def geo_index_available(con: sqlite3.Connection) -> bool:
+    global _geo_index_available
+    if _geo_index_available is None:
+        driver = get_driver()
+        _geo_index_available = driver.dialect == "sqlite" and driver.has_table(con, "rides_geo")
+    return _geo_index_available
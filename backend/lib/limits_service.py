@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import math
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from .settings import settings
+
+
+class LimitExceededError(ValueError):
+    """Raised when a user action would exceed its sliding-window quota."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@dataclass(frozen=True)
+class ActionLimit:
+    action: str
+    limit: int             # <= 0 disables the check
+    window_seconds: int
+    bucket_seconds: int    # counter granularity; a user has at most `limit` non-empty buckets
+    message: str
+
+
+BOOKING = "booking"
+CANCELLATION = "cancellation"
+
+ACTION_LIMITS: Dict[str, ActionLimit] = {
+    BOOKING: ActionLimit(
+        BOOKING,
+        settings.MAX_BOOKINGS_PER_DAY,
+        24 * 3600,
+        60,
+        "Daily booking limit reached",
+    ),
+    CANCELLATION: ActionLimit(
+        CANCELLATION,
+        settings.MAX_CANCELLATIONS_PER_WEEK,
+        7 * 24 * 3600,
+        60,
+        "Weekly cancellation limit reached",
+    ),
+}
+
+
+def create_action_counters(con: Any) -> None:
+    """
+    Migration step: per-user action counts in fixed time buckets.
+    """
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS user_action_counters (
+            user_id INTEGER NOT NULL,
+            action TEXT NOT NULL,
+            bucket_start INTEGER NOT NULL,           -- unix seconds
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, action, bucket_start)
+        ) WITHOUT ROWID
+    """)
+
+
+def _window(rule: ActionLimit, now: float):
+    bucket = int(now) - int(now) % rule.bucket_seconds
+    # the oldest bucket that still overlaps the window is counted in full,
+    # so the check errs on the strict side by at most one bucket
+    oldest = bucket - (rule.window_seconds // rule.bucket_seconds) * rule.bucket_seconds
+    return bucket, oldest
+
+
+def consume(con: Any, user_id: int, action: str, now: Optional[float] = None) -> None:
+    """
+    Check the user's quota for `action` and count one more use. Runs inside
+    the caller's write transaction, so the check and the action commit (or
+    roll back) together. Cost is bounded by the quota (one row per non-empty
+    bucket), not by the user's booking history. Raises LimitExceededError when the quota is used up.
+    """
+    rule = ACTION_LIMITS[action]
+    if rule.limit <= 0:
+        return
+    now = time.time() if now is None else now
+    bucket, oldest = _window(rule, now)
+
+    # buckets that slid out of the window are no longer needed
+    con.execute(
+        "DELETE FROM user_action_counters WHERE user_id=? AND action=? AND bucket_start < ?",
+        (int(user_id), action, oldest),
+    )
+    row = con.execute(
+        "SELECT COALESCE(SUM(count), 0), MIN(bucket_start) FROM user_action_counters WHERE user_id=? AND action=?",
+        (int(user_id), action),
+    ).fetchone()
+    used = int(row[0])
+    if used >= rule.limit:
+        # the earliest counted bucket leaves the window first
+        frees_at = int(row[1]) + rule.window_seconds + rule.bucket_seconds
+        raise LimitExceededError(rule.message, retry_after=max(math.ceil(frees_at - now), 1))
+
+    con.execute(
+        """
+        INSERT INTO user_action_counters (user_id, action, bucket_start, count) VALUES (?, ?, ?, 1)
+        ON CONFLICT(user_id, action, bucket_start) DO UPDATE SET count = user_action_counters.count + 1
+        """,
+        (int(user_id), action, bucket),
+    )
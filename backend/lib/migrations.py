@@ -0,0 +1,325 @@
+from __future__ import annotations
+
+import sqlite3
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Callable, List, Tuple, Union
+
+from .aggregates import (
+    create_analytics_rollups,
+    create_driver_rating_stats,
+    create_user_stats,
+    rebuild_user_stats,
+    reset_analytics_rollups,
+)
+from .co2_service import create_emission_factors
+from .gazetteer import backfill_ride_places, rekey_place_aliases
+from .geo_service import create_geo_index
+from .limits_service import create_action_counters
+from .search_service import create_search_index
+from .settings import settings
+from .utils import db_time, parse_iso_datetime, utc_iso, utc_now
+
+
+# A step is either a SQL statement or a callable for data backfills
+Step = Union[str, Callable[[sqlite3.Connection], None]]
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    statements: Tuple[Step, ...]
+
+
+def _backfill_session_expiry(con: sqlite3.Connection) -> None:
+    # sessions from before expiry existed get one full TTL from now
+    expires_at = utc_iso(utc_now() + timedelta(hours=settings.SESSION_TTL_HOURS))
+    con.execute(
+        "UPDATE sessions SET expires_at=?, last_seen_at=? WHERE expires_at IS NULL",
+        (expires_at, utc_iso()),
+    )
+
+
+def _normalize_depart_times(con: sqlite3.Connection) -> None:
+    # rides stored before create_ride converted to UTC may carry any offset;
+    # search windows and cursors compare the strings, so rewrite them in UTC
+    updates = []
+    for ride_id, depart_time in con.execute("SELECT id, depart_time FROM rides").fetchall():
+        try:
+            normalized = db_time(parse_iso_datetime(depart_time))
+        except (TypeError, ValueError):
+            continue
+        if normalized != depart_time:
+            updates.append((normalized, ride_id))
+    con.executemany("UPDATE rides SET depart_time=? WHERE id=?", updates)
+
+
+# -------------------------------------------------
+# Schema history (append only - never edit a shipped migration)
+# -------------------------------------------------
+MIGRATIONS: List[Migration] = [
+    Migration(1, "base_schema", (
+        # USERS
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            user_type TEXT NOT NULL,                 -- "campus" | "guest"
+            email TEXT UNIQUE,                       -- nullable for guest (phone-only)
+            phone TEXT UNIQUE,                       -- nullable for campus (email-only)
+            is_verified INTEGER NOT NULL DEFAULT 0,  -- OTP verified
+            created_at TEXT NOT NULL
+        )
+        """,
+        # OTPs
+        """
+        CREATE TABLE IF NOT EXISTS otps (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            code TEXT NOT NULL,
+            expires_at TEXT NOT NULL,
+            used INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL,
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        )
+        """,
+        # RIDES
+        """
+        CREATE TABLE IF NOT EXISTS rides (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            driver_id INTEGER NOT NULL,
+            from_text TEXT NOT NULL,
+            to_text TEXT NOT NULL,
+            depart_time TEXT NOT NULL,
+            seats_total INTEGER NOT NULL,
+            seats_left INTEGER NOT NULL,
+            vehicle_type TEXT NOT NULL,
+            allow_guests INTEGER NOT NULL DEFAULT 0,
+            distance_km REAL NOT NULL,
+            created_at TEXT NOT NULL,
+            FOREIGN KEY(driver_id) REFERENCES users(id)
+        )
+        """,
+        # BOOKINGS
+        """
+        CREATE TABLE IF NOT EXISTS bookings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ride_id INTEGER NOT NULL,
+            rider_id INTEGER NOT NULL,
+            seats INTEGER NOT NULL,
+            status TEXT NOT NULL,                    -- "CONFIRMED" | "CANCELLED"
+            created_at TEXT NOT NULL,
+            cancelled_at TEXT,
+            FOREIGN KEY(ride_id) REFERENCES rides(id),
+            FOREIGN KEY(rider_id) REFERENCES users(id)
+        )
+        """,
+        # NOTIFICATIONS
+        """
+        CREATE TABLE IF NOT EXISTS notifications (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            body TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            is_read INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        )
+        """,
+        # RATINGS
+        """
+        CREATE TABLE IF NOT EXISTS ratings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ride_id INTEGER NOT NULL,
+            rater_id INTEGER NOT NULL,
+            driver_id INTEGER NOT NULL,
+            stars INTEGER NOT NULL,
+            comment TEXT,
+            created_at TEXT NOT NULL,
+            FOREIGN KEY(ride_id) REFERENCES rides(id),
+            FOREIGN KEY(rater_id) REFERENCES users(id),
+            FOREIGN KEY(driver_id) REFERENCES users(id)
+        )
+        """,
+    )),
+
+    # Previously created lazily by login_or_create_user
+    Migration(2, "sessions_table", (
+        """
+        CREATE TABLE IF NOT EXISTS sessions (
+            token TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    )),
+
+    Migration(3, "hot_path_indexes", (
+        # get_user_bookings / get_user_profile (id is the rowid, so it is
+        # implicitly the last index column and ORDER BY id DESC is free)
+        "CREATE INDEX IF NOT EXISTS idx_bookings_rider ON bookings(rider_id)",
+        # submit_rating: "has this rider booked this ride?"
+        "CREATE INDEX IF NOT EXISTS idx_bookings_ride_rider ON bookings(ride_id, rider_id)",
+        # get_user_notifications: WHERE user_id=? ORDER BY id DESC
+        "CREATE INDEX IF NOT EXISTS idx_notifications_user ON notifications(user_id)",
+        # get_driver_rating_summary
+        "CREATE INDEX IF NOT EXISTS idx_ratings_driver ON ratings(driver_id)",
+        # get_user_profile: rides posted
+        "CREATE INDEX IF NOT EXISTS idx_rides_driver ON rides(driver_id)",
+        # search_rides: only rides with free seats, in departure order
+        "CREATE INDEX IF NOT EXISTS idx_rides_active_depart ON rides(depart_time) WHERE seats_left > 0",
+        # sessions by user (logout-all, session caps)
+        "CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions(user_id)",
+    )),
+
+    # FTS5 trigram index + sync triggers for ride search
+    Migration(4, "rides_search_index", (
+        create_search_index,
+    )),
+
+    Migration(5, "session_expiry", (
+        "ALTER TABLE sessions ADD COLUMN expires_at TEXT",
+        "ALTER TABLE sessions ADD COLUMN last_seen_at TEXT",
+        _backfill_session_expiry,
+        # sweeper: oldest expiries first
+        "CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions(expires_at)",
+    )),
+
+    # notifications double as the outbox: rows are written in the business
+    # transaction and delivered_at is set once the dispatcher fanned them out
+    Migration(6, "notification_outbox", (
+        "ALTER TABLE notifications ADD COLUMN delivered_at TEXT",
+        "UPDATE notifications SET delivered_at = created_at",
+        "CREATE INDEX IF NOT EXISTS idx_notifications_undelivered ON notifications(id) WHERE delivered_at IS NULL",
+    )),
+
+    # unread inbox page / unread count / bulk mark-read
+    Migration(7, "notifications_unread_index", (
+        "CREATE INDEX IF NOT EXISTS idx_notifications_user_unread ON notifications(user_id) WHERE is_read = 0",
+    )),
+
+    # per-driver count/sum/histogram, backfilled from existing ratings
+    Migration(8, "driver_rating_stats", (
+        create_driver_rating_stats,
+    )),
+
+    # per-user rides posted / taken / CO2 saved for get_user_profile
+    Migration(9, "user_stats", (
+        create_user_stats,
+    )),
+
+    # hourly/daily/route/user rollups fed from a trigger-maintained dirty queue
+    Migration(10, "analytics_rollups", (
+        create_analytics_rollups,
+    )),
+
+    # sliding-window counters for MAX_BOOKINGS_PER_DAY / MAX_CANCELLATIONS_PER_WEEK
+    Migration(11, "user_action_counters", (
+        create_action_counters,
+    )),
+
+    # optional endpoint coordinates + R*Tree for nearby-ride search
+    Migration(12, "ride_coordinates", (
+        "ALTER TABLE rides ADD COLUMN from_lat REAL",
+        "ALTER TABLE rides ADD COLUMN from_lon REAL",
+        "ALTER TABLE rides ADD COLUMN to_lat REAL",
+        "ALTER TABLE rides ADD COLUMN to_lon REAL",
+        create_geo_index,
+    )),
+
+    # canonical places + aliases; rides point at the places their endpoints resolve to
+    Migration(13, "places", (
+        """
+        CREATE TABLE IF NOT EXISTS places (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            lat REAL,
+            lon REAL,
+            created_at TEXT NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS place_aliases (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            alias TEXT NOT NULL UNIQUE,            -- gazetteer.place_key() of a name
+            place_id INTEGER NOT NULL,
+            FOREIGN KEY(place_id) REFERENCES places(id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_place_aliases_place ON place_aliases(place_id)",
+        "ALTER TABLE rides ADD COLUMN from_place_id INTEGER",
+        "ALTER TABLE rides ADD COLUMN to_place_id INTEGER",
+        backfill_ride_places,
+        # place-id search: equality on both endpoints, then the departure keyset
+        "CREATE INDEX IF NOT EXISTS idx_rides_route_places ON rides(from_place_id, to_place_id, depart_time, id)",
+    )),
+
+    # departure times written with a non-UTC offset, before they were stored in UTC
+    Migration(14, "utc_depart_times", (
+        _normalize_depart_times,
+    )),
+
+    # place_key() spells out abbreviations and drops a leading "the"
+    Migration(15, "place_key_rules", (
+        rekey_place_aliases,
+    )),
+
+    # emission factors as a table, for CO2 estimates computed in SQL; the
+    # estimate now rounds half-up to the gram, so stored totals are redone
+    Migration(16, "vehicle_emission_factors", (
+        create_emission_factors,
+        rebuild_user_stats,
+        reset_analytics_rollups,
+    )),
+]
+
+
+def _ensure_version_table(con: sqlite3.Connection) -> None:
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        )
+    """)
+
+
+def current_version(con: sqlite3.Connection) -> int:
+    row = con.execute("SELECT MAX(version) FROM schema_migrations").fetchone()
+    return int(row[0] or 0)
+
+
+def run_migrations(con: sqlite3.Connection) -> List[int]:
+    """
+    Apply every pending migration, each in its own transaction.
+    BEGIN IMMEDIATE serializes concurrent workers starting up against the
+    same file; the version is re-read under that lock.
+    Returns the versions applied by this call.
+    """
+    _ensure_version_table(con)
+    if con.in_transaction:
+        con.commit()
+
+    applied: List[int] = []
+    for migration in sorted(MIGRATIONS, key=lambda m: m.version):
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            if current_version(con) >= migration.version:
+                con.rollback()
+                continue
+            for step in migration.statements:
+                if callable(step):
+                    step(con)
+                else:
+                    con.execute(step)
+            con.execute(
+                "INSERT INTO schema_migrations (version, name, applied_at) VALUES (?, ?, ?)",
+                (migration.version, migration.name, utc_iso()),
+            )
+            con.commit()
+        except BaseException:
+            con.rollback()
+            raise
+        applied.append(migration.version)
+    return applied
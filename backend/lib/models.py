@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from datetime import datetime
-from typing import List, Optional, Literal
+from typing import Dict, List, Optional, Literal
 from pydantic import BaseModel, Field
 
 
@@ -55,6 +55,11 @@ class RideCreateRequest(BaseModel):
     vehicle_type: str = Field(default="car", min_length=1, max_length=20)
     allow_guests: bool = False
     distance_km: float = Field(ge=0.5, le=200.0)
+    # optional endpoint coordinates; rides with both endpoints show up in /rides/nearby
+    from_lat: Optional[float] = Field(default=None, ge=-90, le=90)
+    from_lon: Optional[float] = Field(default=None, ge=-180, le=180)
+    to_lat: Optional[float] = Field(default=None, ge=-90, le=90)
+    to_lon: Optional[float] = Field(default=None, ge=-180, le=180)
 
 
 class RideResponse(BaseModel):
@@ -68,10 +73,40 @@ class RideResponse(BaseModel):
     vehicle_type: str
     allow_guests: bool
     distance_km: float
+    from_lat: Optional[float] = None
+    from_lon: Optional[float] = None
+    to_lat: Optional[float] = None
+    to_lon: Optional[float] = None
+    from_place_id: Optional[int] = None
+    to_place_id: Optional[int] = None
 
 
 class RideListResponse(BaseModel):
     rides: List[RideResponse]
+    next_cursor: Optional[str] = None  # pass back as ?cursor= for the next page
+
+
+class NearbyRideResponse(RideResponse):
+    pickup_km: float  # rider's origin -> ride's origin
+    dropoff_km: float  # ride's destination -> rider's destination
+    detour_km: float  # extra distance for the driver to pick up and drop off
+
+
+class NearbyRideListResponse(BaseModel):
+    rides: List[NearbyRideResponse]
+    next_cursor: Optional[str] = None
+
+
+# -------- Places --------
+class PlaceResponse(BaseModel):
+    id: int
+    name: str
+    lat: Optional[float] = None
+    lon: Optional[float] = None
+
+
+class PlaceListResponse(BaseModel):
+    places: List[PlaceResponse]
 
 
 # -------- Bookings --------
@@ -114,6 +149,11 @@ class NotificationResponse(BaseModel):
 
 class NotificationListResponse(BaseModel):
     notifications: List[NotificationResponse]
+    next_cursor: Optional[str] = None  # pass back as ?cursor= for older notifications
+
+
+class UnreadCountResponse(BaseModel):
+    unread_count: int
 
 
 # -------- Ratings --------
@@ -129,6 +169,12 @@ class RatingSummaryResponse(BaseModel):
     driver_id: int
     average_stars: float
     total_ratings: int
+    histogram: Optional[Dict[int, int]] = None  # stars -> count
+    bayesian_average: Optional[float] = None
+
+
+class TopDriversResponse(BaseModel):
+    drivers: List[RatingSummaryResponse]
 
 
 # -------- Profile --------
@@ -137,3 +183,59 @@ class UserProfileResponse(BaseModel):
     rides_posted: int
     rides_taken: int
     total_co2_saved_kg: float
+
+
+# -------- Analytics --------
+class AnalyticsTotalsResponse(BaseModel):
+    rides_offered: int
+    rides_shared: int          # rides with at least one confirmed booking
+    bookings: int
+    seats_offered: int
+    seats_booked: int
+    seat_utilization: float    # seats_booked / seats_offered
+    co2_saved_kg: float
+    pending_rides: int         # changed rides not yet rolled up
+    as_of: Optional[str] = None
+
+
+class AnalyticsBucket(BaseModel):
+    bucket: str                # "YYYY-MM-DD" or "YYYY-MM-DDTHH" (UTC, by departure)
+    rides_offered: int
+    rides_shared: int
+    bookings: int
+    seats_offered: int
+    seats_booked: int
+    co2_saved_kg: float
+
+
+class AnalyticsTimeSeriesResponse(BaseModel):
+    granularity: Literal["day", "hour"]
+    points: List[AnalyticsBucket]
+
+
+class LeaderboardEntry(BaseModel):
+    rank: int
+    user_id: int
+    name: Optional[str] = None
+    value: float
+
+
+class LeaderboardResponse(BaseModel):
+    metric: str
+    entries: List[LeaderboardEntry]
+
+
+class RouteStats(BaseModel):
+    from_key: str
+    to_key: str
+    rides_offered: int
+    rides_shared: int
+    bookings: int
+    seats_offered: int
+    seats_booked: int
+    co2_saved_kg: float
+
+
+class BusiestRoutesResponse(BaseModel):
+    metric: str
+    routes: List[RouteStats]
@@ -1,53 +1,378 @@
 from __future__ import annotations
-from typing import List
-from datetime import datetime
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from datetime import datetime, timedelta
 
-from .db import connect
-from .utils import utc_iso, parse_iso_datetime
+from .async_db import db_async
+from .background import PeriodicTask
+from .cache import TTLCache
+from .db import connection, run_write
+from .drivers import get_driver
+from .pubsub import get_broker, user_channel
+from .replicas import read_connection
+from .settings import settings
+from .utils import utc_iso, utc_now, parse_iso_datetime, encode_cursor, decode_cursor
 
+DEFAULT_PAGE_SIZE = 30
+MAX_PAGE_SIZE = 100
 
-def create_notification(user_id: int, title: str, body: str) -> None:
-    con = connect()
-    cur = con.cursor()
-    cur.execute(
+# -------------------------------------------------
+# Transactional outbox
+# -------------------------------------------------
+# Business writes add their notification rows through the caller's own
+# connection, so they commit (or roll back) with the ride/booking/rating.
+# Rows with delivered_at IS NULL are the outbox; the dispatcher hands them
+# to the registered delivery handlers afterwards (at-least-once) and then
+# stamps delivered_at. delivered_at is global: one worker's dispatcher
+# claims a row for every worker, so handlers registered here must reach
+# all users by themselves (e.g. a push service). Per-process consumers use
+# the hub feed below instead.
+DeliveryHandler = Callable[[List[dict]], None]
+
+_delivery_handlers: List[DeliveryHandler] = []
+
+
+def add_notification(con, user_id: int, title: str, body: str) -> None:
+    """
+    Write a notification inside the caller's open transaction.
+    The caller commits, then calls notify_outbox().
+    """
+    con.execute(
         "INSERT INTO notifications (user_id, title, body, created_at, is_read) VALUES (?, ?, ?, ?, 0)",
-        (user_id, title, body, utc_iso()),
+        (int(user_id), title, body, utc_iso()),
     )
-    con.commit()
-    con.close()
 
 
-def get_user_notifications(user_id: int) -> List[dict]:
-    con = connect()
-    cur = con.cursor()
-    cur.execute(
-        "SELECT id, user_id, title, body, created_at, is_read FROM notifications WHERE user_id=? ORDER BY id DESC",
-        (user_id,),
+def register_delivery_handler(handler: DeliveryHandler) -> None:
+    if handler not in _delivery_handlers:
+        _delivery_handlers.append(handler)
+
+
+def _notification_row_to_dict(r) -> dict:
+    return {
+        "id": r["id"],
+        "user_id": r["user_id"],
+        "title": r["title"],
+        "body": r["body"],
+        "created_at": parse_iso_datetime(r["created_at"]),
+        "is_read": bool(r["is_read"]),
+    }
+
+
+def _mark_delivered(con, ids: List[int]) -> None:
+    delivered_at = utc_iso()
+    con.executemany(
+        "UPDATE notifications SET delivered_at=? WHERE id=?",
+        [(delivered_at, i) for i in ids],
     )
-    rows = cur.fetchall()
-    con.close()
-
-    out = []
-    for r in rows:
-        out.append(
-            {
-                "id": r["id"],
-                "user_id": r["user_id"],
-                "title": r["title"],
-                "body": r["body"],
-                "created_at": parse_iso_datetime(r["created_at"]),
-                "is_read": bool(r["is_read"]),
-            }
-        )
-    return out
 
 
-def mark_notification_read(notification_id: int) -> None:
-    con = connect()
-    cur = con.cursor()
-    cur.execute("UPDATE notifications SET is_read=1 WHERE id=?", (notification_id,))
+def dispatch_outbox(batch_size: Optional[int] = None) -> int:
+    """
+    Fan out undelivered notifications, oldest first. Returns how many were
+    delivered. A handler failure leaves the batch undelivered for the next run.
+    """
+    batch_size = max(int(batch_size or settings.NOTIFICATION_OUTBOX_BATCH_SIZE), 1)
+    delivered = 0
+    while True:
+        with connection() as con:
+            rows = con.execute(
+                """
+                SELECT id, user_id, title, body, created_at, is_read
+                FROM notifications
+                WHERE delivered_at IS NULL
+                ORDER BY id
+                LIMIT ?
+                """,
+                (batch_size,),
+            ).fetchall()
+        if not rows:
+            return delivered
+
+        batch = [_notification_row_to_dict(r) for r in rows]
+        for handler in list(_delivery_handlers):
+            handler(batch)
+
+        run_write(_mark_delivered, [n["id"] for n in batch])
+        delivered += len(batch)
+        if len(rows) < batch_size:
+            return delivered
+
+
+# -------------------------------------------------
+# Hub feed (per process)
+# -------------------------------------------------
+# A notification whose created_at is this old is assumed committed or
+# rolled back, so ids below it can no longer appear.
+HUB_SETTLE_SECONDS = 30.0
+
+
+def publish_to_hub(batch: List[dict]) -> None:
+    """
+    Push each notification to its user's pub/sub channel (consumed by the
+    SSE / long-poll endpoints).
+    """
+    broker = get_broker()
+    now = time.monotonic()
+    for n in batch:
+        _delivered_at.set(n["user_id"], now)
+        broker.publish(user_channel(n["user_id"]), n)
+
+
+class HubFeed:
+    """
+    Publishes every committed notification to this process's broker once.
+
+    The in-memory broker only reaches this process's SSE / long-poll
+    clients, so each worker follows the notifications table on its own
+    instead of relying on the outbox's global delivered_at.
+
+    While the broker has no subscribers the feed is idle and polls nothing;
+    attach() (called by each new subscriber) restarts it from the end of
+    the table. Progress is tracked by id. A single-writer database commits
+    ids in order, so the floor simply moves to the last id read. With
+    several concurrent writers (server databases) a lower id can commit
+    after a higher one, so ids above the settled floor that were already
+    published are remembered and the range is re-read until
+    HUB_SETTLE_SECONDS have passed.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._floor: Optional[int] = None  # None: idle
+        self._published: Dict[int, str] = {}  # id -> created_at, above the floor
+        self.published = 0
+
+    def _prime(self) -> int:
+        with connection() as con:
+            row = con.execute("SELECT MAX(id) FROM notifications").fetchone()
+        last_id = int(row[0] or 0)
+        if self._floor is None:
+            self._floor = last_id
+        return last_id
+
+    def attach(self) -> int:
+        """
+        For a consumer that has just subscribed: makes sure the feed runs
+        and returns the newest notification id. Everything above it reaches
+        the subscriber through the broker.
+        """
+        with self._lock:
+            return self._prime()
+
+    def poll(self, batch_size: Optional[int] = None) -> int:
+        """
+        Publish notifications committed since the last poll.
+        """
+        batch_size = max(int(batch_size or settings.NOTIFICATION_OUTBOX_BATCH_SIZE), 1)
+        with self._lock:
+            if not get_broker().has_subscribers():
+                self._floor = None
+                self._published.clear()
+                return 0
+            if self._floor is None:
+                # subscribed without attach(): start from here
+                self._prime()
+                return 0
+
+            in_order = get_driver().single_writer
+            published = 0
+            after = self._floor
+            while True:
+                with connection() as con:
+                    rows = con.execute(
+                        """
+                        SELECT id, user_id, title, body, created_at, is_read
+                        FROM notifications
+                        WHERE id > ?
+                        ORDER BY id
+                        LIMIT ?
+                        """,
+                        (after, batch_size),
+                    ).fetchall()
+                fresh = [r for r in rows if int(r["id"]) not in self._published]
+                if fresh:
+                    publish_to_hub([_notification_row_to_dict(r) for r in fresh])
+                    published += len(fresh)
+                    if in_order:
+                        self._floor = int(fresh[-1]["id"])
+                    else:
+                        for r in fresh:
+                            self._published[int(r["id"])] = r["created_at"]
+                if len(rows) < batch_size:
+                    break
+                after = int(rows[-1]["id"])
+
+            if not in_order:
+                self._settle()
+            self.published += published
+            return published
+
+    def _settle(self) -> None:
+        cutoff = utc_iso(utc_now() - timedelta(seconds=HUB_SETTLE_SECONDS))
+        for notification_id in sorted(self._published):
+            if self._published[notification_id] >= cutoff:
+                break
+            del self._published[notification_id]
+            self._floor = notification_id
+
+    def stats(self) -> dict:
+        return {
+            "idle": self._floor is None,
+            "floor_id": self._floor,
+            "tracked": len(self._published),
+            "published": self.published,
+        }
+
+
+# user_id -> when a notification was last pushed to them: a client that
+# lists right after a push must not read a replica that lacks it
+_delivered_at: TTLCache[int, float] = TTLCache(10000, settings.DB_REPLICA_MAX_LAG_SECONDS)
+
+_hub_feed = HubFeed()
+
+
+def hub_feed_stats() -> dict:
+    return _hub_feed.stats()
+
+
+def attach_hub_feed() -> int:
+    """
+    Call right after subscribing to a user channel: returns the newest
+    notification id; later ones are pushed to the subscription.
+    """
+    return _hub_feed.attach()
+
+
+def _dispatch() -> None:
+    _hub_feed.poll()
+    dispatch_outbox()
+
+
+_dispatcher = PeriodicTask(
+    "notification-outbox",
+    settings.NOTIFICATION_OUTBOX_POLL_MS / 1000.0,
+    _dispatch,
+)
+
+
+def notify_outbox() -> None:
+    """
+    Called after a commit that added notifications: wakes the dispatcher,
+    or delivers inline in "sync" mode.
+    """
+    if _dispatcher.running:
+        _dispatcher.wake()
+    elif settings.NOTIFICATION_DELIVERY_MODE == "sync":
+        _dispatch()
+
+
+def start_outbox_dispatcher() -> None:
+    if settings.NOTIFICATION_DELIVERY_MODE == "async":
+        _dispatcher.start()
+
+
+def stop_outbox_dispatcher() -> None:
+    _dispatcher.stop()
+    # deliver whatever committed before shutdown
+    dispatch_outbox()
+
+
+def get_user_notifications(
+    user_id: int,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    unread_only: bool = False,
+) -> Tuple[List[dict], Optional[str]]:
+    """
+    Newest first, keyset-paged on id. Returns (notifications, next_cursor);
+    next_cursor is None on the last page.
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    before_id = decode_cursor(cursor, int)[0] if cursor else None
+
+    sql = "SELECT id, user_id, title, body, created_at, is_read FROM notifications WHERE user_id=?"
+    params: list = [user_id]
+    if unread_only:
+        sql += " AND is_read=0"
+    if before_id is not None:
+        sql += " AND id < ?"
+        params.append(before_id)
+    sql += " ORDER BY id DESC LIMIT ?"
+    params.append(limit + 1)
+
+    with read_connection(not_before=_delivered_at.get(user_id)) as con:
+        rows = con.execute(sql, params).fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["id"])
+    return [_notification_row_to_dict(r) for r in rows], next_cursor
+
+
+def get_notifications_since(user_id: int, since_id: int, limit: int = MAX_PAGE_SIZE) -> List[dict]:
+    """
+    Oldest first; used to catch a push client up after (re)connecting.
+    """
+    with connection() as con:
+        rows = con.execute(
+            """
+            SELECT id, user_id, title, body, created_at, is_read
+            FROM notifications
+            WHERE user_id=? AND id > ?
+            ORDER BY id ASC
+            LIMIT ?
+            """,
+            (user_id, int(since_id), max(1, min(int(limit), MAX_PAGE_SIZE))),
+        ).fetchall()
+    return [_notification_row_to_dict(r) for r in rows]
+
+
+def get_unread_count(user_id: int) -> int:
+    with read_connection(not_before=_delivered_at.get(user_id)) as con:
+        row = con.execute(
+            "SELECT COUNT(*) AS c FROM notifications WHERE user_id=? AND is_read=0",
+            (user_id,),
+        ).fetchone()
+    return int(row["c"])
+
+
+def _mark_all_read(con, user_id: int, up_to_id: Optional[int]) -> int:
+    sql = "UPDATE notifications SET is_read=1 WHERE user_id=? AND is_read=0"
+    params: list = [user_id]
+    if up_to_id is not None:
+        sql += " AND id <= ?"
+        params.append(int(up_to_id))
+    return con.execute(sql, params).rowcount
+
+
+def mark_all_notifications_read(user_id: int, up_to_id: Optional[int] = None) -> int:
+    """
+    Mark the user's unread notifications read in one statement, optionally
+    only those with id <= up_to_id (what the client has actually seen).
+    Returns the number of rows changed.
+    """
+    return run_write(_mark_all_read, user_id, up_to_id)
+
+
+def _mark_read(con, notification_id: int) -> None:
+    cur = con.execute("UPDATE notifications SET is_read=1 WHERE id=?", (notification_id,))
     if cur.rowcount == 0:
-        con.close()
         raise ValueError("Notification not found")
-    con.commit()
-    con.close()
+
+
+def mark_notification_read(notification_id: int) -> None:
+    run_write(_mark_read, notification_id)
+
+
+# -------------------------------------------------
+# Async variants (run on the async_db executor)
+# -------------------------------------------------
+get_user_notifications_async = db_async(get_user_notifications)
+get_notifications_since_async = db_async(get_notifications_since)
+get_unread_count_async = db_async(get_unread_count)
+mark_all_notifications_read_async = db_async(mark_all_notifications_read)
+mark_notification_read_async = db_async(mark_notification_read)
+attach_hub_feed_async = db_async(attach_hub_feed)
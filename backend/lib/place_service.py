@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, Tuple
+
+from .background import PeriodicTask
+from .db import connection, run_write
+from .gazetteer import Gazetteer, merge_place, place_key, resolve_or_create_place
+from .settings import settings
+
+DEFAULT_AUTOCOMPLETE_LIMIT = 10
+MAX_AUTOCOMPLETE_LIMIT = 25
+
+_gazetteer = Gazetteer()
+
+
+def sync_gazetteer() -> int:
+    """
+    Pull places/aliases added since the last sync (by this or any other
+    process) into the in-memory index.
+    """
+    with connection() as con:
+        return _gazetteer.sync(con)
+
+
+_gazetteer_sync = PeriodicTask(
+    "gazetteer-sync",
+    settings.GAZETTEER_SYNC_INTERVAL_SECONDS,
+    sync_gazetteer,
+)
+
+
+def start_gazetteer() -> None:
+    sync_gazetteer()
+    _gazetteer_sync.start()
+
+
+def stop_gazetteer() -> None:
+    _gazetteer_sync.stop()
+
+
+def gazetteer_stats() -> dict:
+    return _gazetteer.stats()
+
+
+def resolve_route(from_q: str, to_q: str) -> Optional[Tuple[int, int]]:
+    """
+    (from_place_id, to_place_id) when both texts are known place names or
+    aliases, else None.
+    """
+    from_id = _gazetteer.resolve(from_q)
+    to_id = _gazetteer.resolve(to_q) if from_id is not None else None
+    if to_id is None:
+        return None
+    return from_id, to_id
+
+
+def autocomplete_places(q: str, limit: int = DEFAULT_AUTOCOMPLETE_LIMIT) -> List[Dict[str, Any]]:
+    return _gazetteer.complete(q, max(1, min(int(limit), MAX_AUTOCOMPLETE_LIMIT)))
+
+
+# -------------------------------------------------
+# Maintenance (see manage.py)
+# -------------------------------------------------
+def _point_alias(con, alias: str, place: str) -> Tuple[int, int]:
+    """
+    Write job: make `alias` resolve to `place`. A place the alias resolved
+    to before is merged into `place` (its aliases and rides move over).
+    Returns (place_id, ride endpoints moved).
+    """
+    target, _ = resolve_or_create_place(con, place)
+    key = place_key(alias)
+    row = con.execute("SELECT id, place_id FROM place_aliases WHERE alias=?", (key,)).fetchone()
+    if row is not None and int(row["place_id"]) == target:
+        return target, 0
+    if row is None:
+        con.execute("INSERT INTO place_aliases (alias, place_id) VALUES (?, ?)", (key, target))
+        return target, 0
+
+    old = int(row["place_id"])
+    aliases = [r["alias"] for r in con.execute("SELECT alias FROM place_aliases WHERE place_id=?", (old,)).fetchall()]
+    # delete + insert rather than UPDATE: new alias ids are what sync() picks up
+    con.execute("DELETE FROM place_aliases WHERE place_id=?", (old,))
+    con.executemany(
+        "INSERT INTO place_aliases (alias, place_id) VALUES (?, ?)",
+        [(a, target) for a in aliases],
+    )
+    return target, merge_place(con, old, target)
+
+
+def add_place_alias(alias: str, place: str) -> Tuple[int, int]:
+    place_id, moved = run_write(_point_alias, alias, place)
+    sync_gazetteer()
+    return place_id, moved
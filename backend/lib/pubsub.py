@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+from typing import Any, Dict, List, Optional, Set
+
+
+class Subscription:
+    """
+    One consumer of a channel. Messages are handed to the subscriber's event
+    loop thread-safely, so publishers can run on any thread (e.g. the outbox
+    dispatcher). A slow consumer whose buffer fills up has messages dropped
+    and `lagged` set, so it can re-sync from the database.
+    """
+
+    def __init__(self, broker: "InMemoryBroker", channel: str, max_pending: int):
+        self.channel = channel
+        self.lagged = False
+        self._broker = broker
+        self._loop = asyncio.get_running_loop()
+        self._queue: "asyncio.Queue[Any]" = asyncio.Queue(maxsize=max_pending)
+
+    def _offer(self, message: Any) -> None:
+        # runs on the subscriber's loop
+        try:
+            self._queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.lagged = True
+
+    def deliver(self, message: Any) -> None:
+        try:
+            self._loop.call_soon_threadsafe(self._offer, message)
+        except RuntimeError:
+            # loop already closed; the subscriber is gone
+            self.close()
+
+    async def get(self, timeout: Optional[float] = None) -> Any:
+        """
+        Next message, or raises asyncio.TimeoutError after `timeout` seconds.
+        """
+        return await asyncio.wait_for(self._queue.get(), timeout)
+
+    def close(self) -> None:
+        self._broker.unsubscribe(self)
+
+
+class InMemoryBroker:
+    """
+    Local pub/sub hub for a single process; no external service needed.
+    A shared broker (e.g. Redis) can replace it via set_broker() as long
+    as it offers publish/subscribe/unsubscribe/has_subscribers with the
+    same semantics.
+    """
+
+    def __init__(self, max_pending: int = 100):
+        self.max_pending = max_pending
+        self._channels: Dict[str, Set[Subscription]] = {}
+        self._lock = threading.Lock()
+        self.published = 0
+
+    def subscribe(self, channel: str) -> Subscription:
+        """
+        Must be called from inside the consumer's running event loop.
+        """
+        sub = Subscription(self, channel, self.max_pending)
+        with self._lock:
+            self._channels.setdefault(channel, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        with self._lock:
+            subs = self._channels.get(sub.channel)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._channels[sub.channel]
+
+    def publish(self, channel: str, message: Any) -> int:
+        """
+        Fan a message out to current subscribers; returns how many got it.
+        """
+        with self._lock:
+            subs: List[Subscription] = list(self._channels.get(channel, ()))
+            self.published += 1
+        for sub in subs:
+            sub.deliver(message)
+        return len(subs)
+
+    def has_subscribers(self) -> bool:
+        with self._lock:
+            return bool(self._channels)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "channels": len(self._channels),
+                "subscribers": sum(len(s) for s in self._channels.values()),
+                "published": self.published,
+            }
+
+
+_broker: InMemoryBroker = InMemoryBroker()
+
+
+def get_broker() -> InMemoryBroker:
+    return _broker
+
+
+def set_broker(broker: InMemoryBroker) -> None:
+    global _broker
+    _broker = broker
+
+
+def user_channel(user_id: int) -> str:
+    return f"user:{int(user_id)}"
@@ -0,0 +1,270 @@
+from __future__ import annotations
+
+import abc
+import hashlib
+import json
+import math
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .settings import settings
+
+
+@dataclass(frozen=True)
+class BucketRule:
+    rate_per_second: float
+    burst: int
+
+
+@dataclass(frozen=True)
+class RouteGroup:
+    name: str
+    paths: Tuple[str, ...]
+    per_token: Optional[BucketRule]
+    per_ip: Optional[BucketRule]
+
+
+def _bucket_rule(cfg: Optional[Dict[str, Any]]) -> Optional[BucketRule]:
+    if not cfg:
+        return None
+    per_minute = float(cfg.get("rate_per_minute", 0))
+    if per_minute <= 0:
+        return None
+    return BucketRule(per_minute / 60.0, max(int(cfg.get("burst", per_minute)), 1))
+
+
+def load_route_groups(groups_cfg: Dict[str, Dict[str, Any]]) -> List[RouteGroup]:
+    """
+    Groups in config order; a request belongs to the first group with a
+    matching path prefix.
+    """
+    return [
+        RouteGroup(
+            name,
+            tuple(g.get("paths", [])),
+            _bucket_rule(g.get("per_token")),
+            _bucket_rule(g.get("per_ip")),
+        )
+        for name, g in groups_cfg.items()
+    ]
+
+
+# -------------------------------------------------
+# Backends
+# -------------------------------------------------
+class RateLimitBackend(abc.ABC):
+    """
+    Token-bucket store. take() spends one token from each of `buckets` and
+    returns 0.0 when every bucket has one; otherwise it spends nothing and
+    returns the seconds until all of them do. The check and the spend must
+    be atomic across the buckets. A shared implementation (e.g. Redis + a
+    Lua script over all keys) can replace the in-memory one via
+    set_rate_limit_backend().
+    """
+
+    @abc.abstractmethod
+    def take(self, buckets: Sequence[Tuple[str, BucketRule]], now: float) -> float:
+        ...
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+
+class InMemoryRateLimitBackend(RateLimitBackend):
+    """
+    Per-process buckets. Memory is bounded by evicting the least recently
+    seen keys; an evicted client simply starts again with a full bucket.
+    """
+
+    def __init__(self, max_keys: int = 10000):
+        self.max_keys = max(int(max_keys), 1)
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()  # key -> (tokens, updated)
+        self._lock = threading.Lock()
+
+    def take(self, buckets: Sequence[Tuple[str, BucketRule]], now: float) -> float:
+        with self._lock:
+            refilled = []
+            wait = 0.0
+            for key, rule in buckets:
+                tokens, updated = self._buckets.get(key, (float(rule.burst), now))
+                tokens = min(float(rule.burst), tokens + (now - updated) * rule.rate_per_second)
+                if tokens < 1.0:
+                    wait = max(wait, (1.0 - tokens) / rule.rate_per_second)
+                refilled.append((key, tokens))
+            spend = 1.0 if wait == 0.0 else 0.0
+            for key, tokens in refilled:
+                self._buckets[key] = (tokens - spend, now)
+                self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def stats(self) -> Dict[str, Any]:
+        return {"tracked_keys": len(self._buckets), "max_keys": self.max_keys}
+
+
+_backend: RateLimitBackend = InMemoryRateLimitBackend(settings.RATE_LIMIT_MAX_TRACKED_CLIENTS)
+
+
+def get_rate_limit_backend() -> RateLimitBackend:
+    return _backend
+
+
+def set_rate_limit_backend(backend: RateLimitBackend) -> None:
+    global _backend
+    _backend = backend
+
+
+# -------------------------------------------------
+# Middleware
+# -------------------------------------------------
+def _starts_with_any(path: str, prefixes: Tuple[str, ...]) -> bool:
+    return any(path == p or path.startswith(p.rstrip("/") + "/") or p == "/" for p in prefixes)
+
+
+def client_ip(scope, trust_forwarded_for: bool = False) -> str:
+    if trust_forwarded_for:
+        for name, value in scope.get("headers", []):
+            if name == b"x-forwarded-for":
+                return value.decode("latin-1").split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+def bearer_token_key(scope) -> Optional[str]:
+    for name, value in scope.get("headers", []):
+        if name == b"authorization":
+            parts = value.decode("latin-1").split()
+            if len(parts) == 2 and parts[0].lower() == "bearer":
+                # never keep raw tokens in in-memory stores
+                return hashlib.sha256(parts[1].encode("utf-8")).hexdigest()[:32]
+    return None
+
+
+class RateLimitMiddleware:
+    """
+    ASGI middleware applied before routing:
+
+    - token buckets per bearer token and per client IP, with rates set per
+      route group -> 429 + Retry-After when a bucket is empty;
+    - a global cap on in-flight requests -> 503 + Retry-After, so a burst
+      queues at the client instead of inside the SQLite write lock.
+
+    Long-lived endpoints (SSE, long-poll) are rate limited on connect but do
+    not hold a concurrency slot. Exempt paths skip both checks.
+    """
+
+    def __init__(
+        self,
+        app,
+        groups: Optional[List[RouteGroup]] = None,
+        max_concurrent: Optional[int] = None,
+        enabled: Optional[bool] = None,
+    ):
+        global _current_middleware
+        self.app = app
+        self.enabled = settings.RATE_LIMIT_ENABLED if enabled is None else enabled
+        self.groups = load_route_groups(settings.RATE_LIMIT_GROUPS) if groups is None else groups
+        self.max_concurrent = settings.MAX_CONCURRENT_REQUESTS if max_concurrent is None else max_concurrent
+        self.exempt_paths = tuple(settings.RATE_LIMIT_EXEMPT_PATHS)
+        self.long_lived_paths = tuple(settings.RATE_LIMIT_LONG_LIVED_PATHS)
+        self.trust_forwarded_for = settings.RATE_LIMIT_TRUST_FORWARDED_FOR
+        self.in_flight = 0
+        self.rejected_rate = 0
+        self.rejected_overload = 0
+        self._lock = threading.Lock()
+        _current_middleware = weakref.ref(self)
+
+    def _group_for(self, path: str) -> Optional[RouteGroup]:
+        for group in self.groups:
+            if _starts_with_any(path, group.paths):
+                return group
+        return None
+
+    def _check_rate(self, scope, path: str) -> float:
+        group = self._group_for(path)
+        if group is None:
+            return 0.0
+        buckets = []
+        token_key = bearer_token_key(scope)
+        if group.per_token is not None and token_key is not None:
+            buckets.append((f"{group.name}:tok:{token_key}", group.per_token))
+        if group.per_ip is not None:
+            buckets.append((f"{group.name}:ip:{client_ip(scope, self.trust_forwarded_for)}", group.per_ip))
+        if not buckets:
+            return 0.0
+        # a request rejected by either bucket spends from neither
+        return get_rate_limit_backend().take(buckets, time.monotonic())
+
+    @staticmethod
+    async def _reject(send, status: int, detail: str, retry_after: float) -> None:
+        body = json.dumps({"detail": detail}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("ascii")),
+                (b"retry-after", str(max(int(math.ceil(retry_after)), 1)).encode("ascii")),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.enabled:
+            await self.app(scope, receive, send)
+            return
+        path = scope.get("path", "")
+        if _starts_with_any(path, self.exempt_paths):
+            await self.app(scope, receive, send)
+            return
+
+        wait = self._check_rate(scope, path)
+        if wait > 0:
+            with self._lock:
+                self.rejected_rate += 1
+            await self._reject(send, 429, "Too many requests", wait)
+            return
+
+        if _starts_with_any(path, self.long_lived_paths) or self.max_concurrent <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        with self._lock:
+            admitted = self.in_flight < self.max_concurrent
+            if admitted:
+                self.in_flight += 1
+            else:
+                self.rejected_overload += 1
+        if not admitted:
+            await self._reject(send, 503, "Server busy, please retry", 1)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "in_flight": self.in_flight,
+            "max_concurrent": self.max_concurrent,
+            "rejected_rate_limited": self.rejected_rate,
+            "rejected_overloaded": self.rejected_overload,
+        }
+
+
+# the app may rebuild its middleware stack; only the newest instance serves
+_current_middleware: Optional["weakref.ReferenceType[RateLimitMiddleware]"] = None
+
+
+def rate_limit_stats() -> Dict[str, Any]:
+    middleware = _current_middleware() if _current_middleware is not None else None
+    stats: Dict[str, Any] = dict(middleware.stats()) if middleware is not None else {"enabled": False}
+    stats["backend"] = get_rate_limit_backend().stats()
+    return stats
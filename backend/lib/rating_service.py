@@ -1,13 +1,17 @@
 from __future__ import annotations
 
-from .db import connect
+from typing import Any, Dict, List
+
+from .aggregates import STAR_LEVELS, apply_rating, diff_driver_rating_stats, rebuild_driver_rating_stats
+from .async_db import db_async
+from .db import connection, run_write
+from .replicas import read_connection
 from .utils import utc_iso
 from .settings import settings
-from .notification_service import create_notification
+from .notification_service import add_notification, notify_outbox
 
 
-def submit_rating(payload) -> None:
-    con = connect()
+def _insert_rating(con, payload) -> None:
     cur = con.cursor()
 
     # Ensure booking exists for this rider + ride (basic trust)
@@ -16,7 +20,6 @@ def submit_rating(payload) -> None:
         (int(payload.ride_id), int(payload.rater_id)),
     )
     if not cur.fetchone():
-        con.close()
         raise ValueError("You can only rate after you have booked this ride")
 
     cur.execute(
@@ -33,28 +36,82 @@ def submit_rating(payload) -> None:
             utc_iso(),
         ),
     )
-    con.commit()
-    con.close()
+    apply_rating(con, int(payload.driver_id), int(payload.stars))
 
     if settings.ENABLE_IN_APP_NOTIFICATIONS:
-        create_notification(int(payload.driver_id), "New Rating", "You received a new rating. 🌟")
+        add_notification(con, int(payload.driver_id), "New Rating", "You received a new rating. 🌟")
 
 
-def get_driver_rating_summary(driver_id: int) -> dict:
-    con = connect()
-    cur = con.cursor()
+def submit_rating(payload) -> None:
+    run_write(_insert_rating, payload)
+    notify_outbox()
 
-    cur.execute(
-        "SELECT COUNT(*) AS cnt, AVG(stars) AS avg_stars FROM ratings WHERE driver_id=?",
-        (driver_id,),
-    )
-    row = cur.fetchone()
-    con.close()
 
-    total = int(row["cnt"] or 0)
-    avg = float(row["avg_stars"] or 0.0)
-    return {
+def bayesian_average(stars_sum: float, count: int) -> float:
+    """
+    Average pulled towards the configured prior; drivers with few ratings
+    stay near the prior instead of jumping to 1.0 or 5.0.
+    """
+    weight = settings.RATING_PRIOR_WEIGHT
+    return (weight * settings.RATING_PRIOR_MEAN + stars_sum) / (weight + count) if weight + count else 0.0
+
+
+def _summary_from_stats(driver_id: int, row, smoothed: bool) -> Dict[str, Any]:
+    total = int(row["ratings_count"]) if row else 0
+    stars_sum = int(row["stars_sum"]) if row else 0
+    summary: Dict[str, Any] = {
         "driver_id": driver_id,
-        "average_stars": round(avg, 2),
+        "average_stars": round(stars_sum / total, 2) if total else 0.0,
         "total_ratings": total,
     }
+    if smoothed:
+        summary["histogram"] = {s: (int(row[f"stars_{s}"]) if row else 0) for s in STAR_LEVELS}
+        summary["bayesian_average"] = round(bayesian_average(stars_sum, total), 2)
+    return summary
+
+
+def get_driver_rating_summary(driver_id: int, smoothed: bool = False) -> dict:
+    with read_connection() as con:
+        row = con.execute(
+            "SELECT * FROM driver_rating_stats WHERE driver_id=?", (driver_id,)
+        ).fetchone()
+    return _summary_from_stats(driver_id, row, smoothed)
+
+
+def get_top_drivers(limit: int = 10, min_ratings: int = 1) -> List[dict]:
+    """
+    Drivers ranked by Bayesian-smoothed average, then by rating count.
+    """
+    weight = settings.RATING_PRIOR_WEIGHT
+    prior = weight * settings.RATING_PRIOR_MEAN
+    with read_connection() as con:
+        rows = con.execute(
+            """
+            SELECT * FROM driver_rating_stats
+            WHERE ratings_count >= ?
+            ORDER BY (? + stars_sum) / (? + ratings_count) DESC, ratings_count DESC, driver_id
+            LIMIT ?
+            """,
+            (int(min_ratings), prior, weight, int(limit)),
+        ).fetchall()
+    return [_summary_from_stats(int(r["driver_id"]), r, True) for r in rows]
+
+
+# -------------------------------------------------
+# Maintenance (see manage.py)
+# -------------------------------------------------
+def rebuild_rating_stats() -> int:
+    return run_write(rebuild_driver_rating_stats)
+
+
+def verify_rating_stats() -> List[Dict[str, Any]]:
+    with connection() as con:
+        return diff_driver_rating_stats(con)
+
+
+# -------------------------------------------------
+# Async variants (run on the async_db executor)
+# -------------------------------------------------
+submit_rating_async = db_async(submit_rating)
+get_driver_rating_summary_async = db_async(get_driver_rating_summary)
+get_top_drivers_async = db_async(get_top_drivers)
@@ -0,0 +1,411 @@
+from __future__ import annotations
+
+import abc
+import itertools
+import os
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .background import PeriodicTask
+from .db import ConnectionPool, connection, in_write_job
+from .drivers import SQLiteDriver, StorageDriver, get_driver
+from .rate_limit import bearer_token_key, client_ip
+from .settings import settings
+
+
+# -------------------------------------------------
+# Replicas
+# -------------------------------------------------
+class Replica(abc.ABC):
+    """
+    A read-only copy of the primary with its own connection pool.
+
+    `as_of` is a time.monotonic() instant: the replica holds every commit
+    made on the primary before it. None until the first successful refresh.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.as_of: Optional[float] = None
+        self.reads = 0
+        self.refresh_errors = 0
+
+    @property
+    @abc.abstractmethod
+    def pool(self) -> Optional[ConnectionPool]:
+        ...
+
+    @abc.abstractmethod
+    def refresh(self) -> None:
+        ...
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        with self.pool.connection() as con:
+            self.reads += 1
+            yield con
+
+    def close(self) -> None:
+        if self.pool is not None:
+            self.pool.close()
+
+    def stats(self) -> Dict[str, Any]:
+        pool = self.pool
+        return {
+            "name": self.name,
+            "lag_seconds": None if self.as_of is None else round(time.monotonic() - self.as_of, 3),
+            "reads": self.reads,
+            "refresh_errors": self.refresh_errors,
+            "pool": pool.stats() if pool is not None else None,
+        }
+
+
+class FileCopyReplica(Replica):
+    """
+    Local snapshot of a SQLite primary, taken with the online backup API.
+
+    Every copy goes to a new file, so no reader ever has a file replaced or
+    deleted under it. The copy before the current one keeps its pool open
+    for one more refresh (readers may have picked it just before the swap);
+    after that its pool is closed and its files are deleted once the last
+    connection is checked in. A refresh whose `PRAGMA data_version` shows
+    no commit since the last copy only moves `as_of` forward.
+    """
+
+    def __init__(self, name: str, primary: SQLiteDriver, path: Path, pool_size: int, timeout: float):
+        super().__init__(name)
+        self.primary = primary
+        # per process: workers sharing a database each keep their own copies
+        self.path_prefix = path.with_name(f"{path.stem}-{os.getpid()}")
+        self.suffix = path.suffix
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.copies = 0
+        self._current: Optional[Tuple[ConnectionPool, Path]] = None
+        self._previous: Optional[Tuple[ConnectionPool, Path]] = None
+        self._retired: List[Tuple[ConnectionPool, Path]] = []
+        self._source = None
+        self._data_version: Optional[int] = None
+
+    @property
+    def pool(self) -> Optional[ConnectionPool]:
+        return self._current[0] if self._current is not None else None
+
+    def _remove_retired(self) -> None:
+        """
+        Delete the files of retired copies whose connections are all closed.
+        """
+        still_open = []
+        for pool, path in self._retired:
+            if pool.stats()["open"] > 0:
+                still_open.append((pool, path))
+                continue
+            for suffix in ("", "-wal", "-shm", "-journal"):
+                Path(f"{path}{suffix}").unlink(missing_ok=True)
+        self._retired = still_open
+
+    def refresh(self) -> None:
+        started = time.monotonic()
+        if self._source is None:
+            self._source = self.primary.open_snapshot_source()
+        version = self._source.execute("PRAGMA data_version").fetchone()[0]
+        if self.pool is not None and version == self._data_version:
+            self.as_of = started
+            return
+
+        path = Path(f"{self.path_prefix}-{self.copies + 1}{self.suffix}")
+        self.primary.copy_to(self._source, path)
+        pool = ConnectionPool(
+            type(self.primary)(path),
+            max_size=self.pool_size,
+            timeout=self.timeout,
+            read_only=True,
+        )
+        if self._previous is not None:
+            # readers still holding a connection keep it until checkin
+            self._previous[0].close()
+            self._retired.append(self._previous)
+        self._previous, self._current = self._current, (pool, path)
+        self._data_version = version
+        self.as_of = started
+        self.copies += 1
+        self._remove_retired()
+
+    def close(self) -> None:
+        for copy in (self._previous, self._current):
+            if copy is not None:
+                copy[0].close()
+                self._retired.append(copy)
+        self._previous = self._current = None
+        self._remove_retired()
+        if self._source is not None:
+            self._source.close()
+            self._source = None
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats["copies"] = self.copies
+        stats["retired_copies"] = len(self._retired)
+        return stats
+
+
+class ServerReplica(Replica):
+    """
+    A replica kept current by the database server itself (e.g. a PostgreSQL
+    streaming standby); refresh() only measures its replay lag.
+    """
+
+    def __init__(self, name: str, driver: StorageDriver, pool_size: int, timeout: float):
+        super().__init__(name)
+        self.driver = driver
+        self._pool = ConnectionPool(driver, max_size=pool_size, timeout=timeout, read_only=True)
+
+    @property
+    def pool(self) -> Optional[ConnectionPool]:
+        return self._pool
+
+    def refresh(self) -> None:
+        started = time.monotonic()
+        with self._pool.connection() as con:
+            lag = self.driver.replica_lag_seconds(con)
+        self.as_of = None if lag is None else started - max(lag, 0.0)
+
+
+class ReplicaSet:
+    """
+    Picks a replica for a read, round-robin among those fresh enough.
+    A replica whose refreshes fail keeps its last `as_of`, so it drops out
+    once that is older than the staleness bound.
+    """
+
+    def __init__(self, replicas: List[Replica], max_lag: float):
+        self.replicas = replicas
+        self.max_lag = float(max_lag)
+        self.reads_primary = 0
+        self._next = itertools.count()
+
+    def pick(self, not_before: float) -> Optional[Replica]:
+        fresh = [r for r in self.replicas if r.as_of is not None and r.as_of >= not_before]
+        if not fresh:
+            self.reads_primary += 1
+            return None
+        return fresh[next(self._next) % len(fresh)]
+
+    def refresh(self) -> None:
+        for replica in self.replicas:
+            try:
+                replica.refresh()
+            except Exception:
+                replica.refresh_errors += 1
+                print(f"[replicas] refresh of {replica.name} failed:")
+                traceback.print_exc()
+
+    def close(self) -> None:
+        for replica in self.replicas:
+            replica.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_lag_seconds": self.max_lag,
+            "reads_primary": self.reads_primary,
+            "replicas": [r.stats() for r in self.replicas],
+        }
+
+
+def _build_replicas() -> List[Replica]:
+    mode = settings.DB_REPLICA_MODE
+    driver = get_driver()
+    pool_size = settings.DB_REPLICA_POOL_SIZE
+    timeout = settings.DB_POOL_TIMEOUT_SECONDS
+    if mode == "file-copy":
+        if not isinstance(driver, SQLiteDriver):
+            raise ValueError("database.replicas.mode=file-copy requires a SQLite database")
+        base = driver.db_path
+        return [
+            FileCopyReplica(
+                f"copy-{i}",
+                driver,
+                base.with_name(f"{base.stem}.replica{i}{base.suffix}"),
+                pool_size,
+                timeout,
+            )
+            for i in range(1, max(settings.DB_REPLICA_COUNT, 1) + 1)
+        ]
+    if mode == "server":
+        if isinstance(driver, SQLiteDriver):
+            raise ValueError("database.replicas.mode=server needs a server database; use file-copy for SQLite")
+        if not settings.DB_REPLICA_URLS:
+            raise ValueError("database.replicas.mode=server requires database.replicas.urls")
+        return [
+            ServerReplica(f"server-{i}", type(driver)(url), pool_size, timeout)
+            for i, url in enumerate(settings.DB_REPLICA_URLS, start=1)
+        ]
+    if mode != "off":
+        raise ValueError(f"Unsupported database.replicas.mode: {mode}")
+    return []
+
+
+_replica_set: Optional[ReplicaSet] = None
+_refresher: Optional[PeriodicTask] = None
+
+
+def start_replicas() -> None:
+    """
+    Take the first snapshots (so replicas serve reads right away) and keep
+    refreshing them in the background. No-op when replicas are off.
+    """
+    global _replica_set, _refresher
+    replicas = _build_replicas()
+    if not replicas or _replica_set is not None:
+        return
+    replica_set = ReplicaSet(replicas, settings.DB_REPLICA_MAX_LAG_SECONDS)
+    replica_set.refresh()
+    _refresher = PeriodicTask("replica-refresh", settings.DB_REPLICA_REFRESH_SECONDS, replica_set.refresh)
+    _refresher.start()
+    _replica_set = replica_set
+
+
+def stop_replicas() -> None:
+    global _replica_set, _refresher
+    if _refresher is not None:
+        _refresher.stop()
+        _refresher = None
+    replica_set, _replica_set = _replica_set, None
+    if replica_set is not None:
+        replica_set.close()
+
+
+def replica_stats() -> Dict[str, Any]:
+    if _replica_set is None:
+        return {"mode": "off"}
+    stats = _replica_set.stats()
+    stats["mode"] = settings.DB_REPLICA_MODE
+    stats["sticky_clients"] = _sticky.size()
+    return stats
+
+
+# -------------------------------------------------
+# Read routing
+# -------------------------------------------------
+# set per request by ReadYourWritesMiddleware: when the client last wrote
+_read_floor: ContextVar[Optional[float]] = ContextVar("read_floor", default=None)
+
+
+@contextmanager
+def read_connection(not_before: Optional[float] = None) -> Iterator[Any]:
+    """
+    Connection for reads that may be served by a replica. The replica must
+    hold every commit made before `not_before`, before the requesting
+    client's last write, and before now - DB_REPLICA_MAX_LAG_SECONDS;
+    otherwise (or inside a write job) the read goes to the primary.
+    """
+    replica_set = _replica_set
+    replica = None
+    if replica_set is not None and not in_write_job():
+        floor = time.monotonic() - replica_set.max_lag
+        for bound in (not_before, _read_floor.get()):
+            if bound is not None:
+                floor = max(floor, bound)
+        replica = replica_set.pick(floor)
+    if replica is None:
+        with connection() as con:
+            yield con
+        return
+    with replica.connection() as con:
+        yield con
+
+
+class _StickyClients:
+    """
+    When each client last wrote, by bearer token and by IP, bounded by
+    evicting the least recently written. Entries older than the staleness
+    bound are dropped: every replica eligible by then already has the write.
+    """
+
+    MAX_KEYS = 10000
+
+    def __init__(self):
+        self._written: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def mark(self, keys: Iterable[str], now: float) -> None:
+        with self._lock:
+            for key in keys:
+                self._written[key] = now
+                self._written.move_to_end(key)
+            while len(self._written) > self.MAX_KEYS:
+                self._written.popitem(last=False)
+
+    def last_write(self, keys: Iterable[str], now: float, max_lag: float) -> Optional[float]:
+        latest = None
+        with self._lock:
+            for key in keys:
+                written = self._written.get(key)
+                if written is None:
+                    continue
+                if now - written > max_lag:
+                    del self._written[key]
+                elif latest is None or written > latest:
+                    latest = written
+        return latest
+
+    def size(self) -> int:
+        return len(self._written)
+
+
+_sticky = _StickyClients()
+
+
+class ReadYourWritesMiddleware:
+    """
+    ASGI middleware giving each client read-your-writes over replicas.
+
+    A non-GET request records when its response started (the write has
+    committed by then) under the client's bearer token and IP. Later
+    requests from either see that time as their read floor, so
+    read_connection() skips replicas that do not have the write yet.
+    Login is covered by the IP key; clients sharing an IP (NAT, proxies)
+    share stickiness, which only costs replica offload.
+    Per process, like the rate limiter.
+    """
+
+    SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+    def __init__(self, app):
+        self.app = app
+        self.trust_forwarded_for = settings.RATE_LIMIT_TRUST_FORWARDED_FOR
+
+    def _client_keys(self, scope) -> List[str]:
+        keys = [f"ip:{client_ip(scope, self.trust_forwarded_for)}"]
+        token_key = bearer_token_key(scope)
+        if token_key is not None:
+            keys.append(f"tok:{token_key}")
+        return keys
+
+    async def __call__(self, scope, receive, send):
+        replica_set = _replica_set
+        if scope["type"] != "http" or replica_set is None:
+            await self.app(scope, receive, send)
+            return
+
+        keys = self._client_keys(scope)
+        floor = _sticky.last_write(keys, time.monotonic(), replica_set.max_lag)
+        if scope.get("method") in self.SAFE_METHODS:
+            send_through = send
+        else:
+            async def send_through(message):
+                if message["type"] == "http.response.start":
+                    _sticky.mark(keys, time.monotonic())
+                await send(message)
+
+        reset = _read_floor.set(floor)
+        try:
+            await self.app(scope, receive, send_through)
+        finally:
+            _read_floor.reset(reset)
@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from .cache import TTLCache
+
+# (from_q, to_q, depart_after, depart_before, limit, cursor), queries normalized
+SearchKey = Tuple[str, str, Optional[str], Optional[str], int, Optional[str]]
+
+
+class RideCache:
+    """
+    In-process cache for ride detail and search pages.
+
+    Writes call invalidate_ride() after commit, which drops that ride's detail
+    entry, every cached search page that contains it, and every page whose
+    query would match it per the caller's `matches(from_q, to_q)` (a new
+    ride, or a full ride whose seats came back, can join results it was not
+    part of). Everything else stays cached.
+
+    A `generation` snapshot taken before a read is passed back on put, so a
+    result computed from data that a concurrent write already invalidated is
+    never stored. `invalidated_at` (time.monotonic()) is when the last write
+    invalidated anything; loads read replicas only if they hold it.
+    Other workers' writes are only bounded by the TTLs.
+    """
+
+    def __init__(self, detail_size: int, detail_ttl: float, search_size: int, search_ttl: float):
+        self._index_lock = threading.Lock()
+        self._generation = 0
+        self.invalidated_at: Optional[float] = None
+        self._searches_by_ride: Dict[int, Set[SearchKey]] = {}
+        self._searches_by_query: Dict[Tuple[str, str], Set[SearchKey]] = {}
+        self._details: TTLCache[int, Dict[str, Any]] = TTLCache(detail_size, detail_ttl)
+        self._searches: TTLCache[SearchKey, Tuple[Tuple[Dict[str, Any], ...], Optional[str]]] = TTLCache(
+            search_size, search_ttl, on_evict=self._unindex
+        )
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def _unindex(self, key: SearchKey, entry) -> None:
+        rides, _ = entry
+        with self._index_lock:
+            for ride in rides:
+                keys = self._searches_by_ride.get(ride["id"])
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._searches_by_ride[ride["id"]]
+            keys = self._searches_by_query.get(key[:2])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._searches_by_query[key[:2]]
+
+    # ---- ride detail ----
+    def get_ride(self, ride_id: int) -> Optional[Dict[str, Any]]:
+        ride = self._details.get(int(ride_id))
+        return dict(ride) if ride is not None else None
+
+    def put_ride(self, ride: Dict[str, Any], generation: int) -> None:
+        if generation == self._generation:
+            self._details.set(int(ride["id"]), dict(ride))
+
+    # ---- search pages ----
+    def get_search(self, key: SearchKey) -> Optional[Tuple[List[Dict[str, Any]], Optional[str]]]:
+        entry = self._searches.get(key)
+        if entry is None:
+            return None
+        rides, next_cursor = entry
+        return [dict(r) for r in rides], next_cursor
+
+    def put_search(self, key: SearchKey, rides: List[Dict[str, Any]], next_cursor: Optional[str], generation: int) -> None:
+        if generation != self._generation:
+            return
+        self._searches.set(key, (tuple(dict(r) for r in rides), next_cursor))
+        with self._index_lock:
+            for ride in rides:
+                self._searches_by_ride.setdefault(ride["id"], set()).add(key)
+            self._searches_by_query.setdefault(key[:2], set()).add(key)
+
+    # ---- invalidation ----
+    def invalidate_ride(self, ride_id: int, matches: Callable[[str, str], bool]) -> None:
+        with self._index_lock:
+            self._generation += 1
+            self.invalidated_at = time.monotonic()
+            keys = set(self._searches_by_ride.get(int(ride_id), ()))
+            queries = [(q, set(k)) for q, k in self._searches_by_query.items()]
+        self._details.delete(int(ride_id))
+        for (from_q, to_q), query_keys in queries:
+            if matches(from_q, to_q):
+                keys |= query_keys
+        for key in keys:
+            entry = self._searches.delete(key)
+            if entry is not None:
+                self._unindex(key, entry)
+
+    def clear(self) -> None:
+        with self._index_lock:
+            self._generation += 1
+            self.invalidated_at = time.monotonic()
+            self._searches_by_ride.clear()
+            self._searches_by_query.clear()
+        self._details.clear()
+        self._searches.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"detail": self._details.stats(), "search": self._searches.stats()}
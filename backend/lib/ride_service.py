@@ -1,32 +1,76 @@
 from __future__ import annotations
 
-from .db import connect
+import heapq
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+from .aggregates import bump_user_stats
+from .async_db import db_async, run_db
+from .db import insert_returning_id, run_write
+from .geo_service import DETOUR_KM_PER_HOUR, bounding_box, detour_km, geo_index_available, haversine_km, validate_point
 from .settings import settings
-from .notification_service import create_notification
-from .utils import utc_iso
+from .gazetteer import resolve_or_create_place
+from .notification_service import add_notification, notify_outbox
+from .place_service import resolve_route, sync_gazetteer
+from .replicas import read_connection
+from .ride_cache import RideCache, SearchKey
+from .search_service import CANDIDATE_LIMIT, build_match_query, fts_available, normalize_place, ride_match_quality
+from .utils import utc_iso, utc_now, db_time, db_time_bound, parse_iso_datetime, encode_cursor, decode_cursor
 
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+DEFAULT_NEARBY_RADIUS_KM = 2.0
+MAX_NEARBY_RADIUS_KM = 25.0
 
-def create_ride(payload):
+_ride_cache = RideCache(
+    detail_size=settings.RIDE_CACHE_SIZE,
+    detail_ttl=settings.RIDE_CACHE_TTL_SECONDS,
+    search_size=settings.SEARCH_CACHE_SIZE,
+    search_ttl=settings.SEARCH_CACHE_TTL_SECONDS,
+)
+
+
+def invalidate_ride_cache(
+    ride_id: int,
+    from_text: str,
+    to_text: str,
+    from_place_id: Optional[int] = None,
+    to_place_id: Optional[int] = None,
+) -> None:
     """
-    payload: RideCreateRequest
-    Rule: Only campus users (and verified) can post rides.
+    Call after committing any change to a ride or its seats.
+    """
+    def matches(from_q: str, to_q: str) -> bool:
+        # the same rule _search_rides applies to the query
+        if resolve_route(from_q, to_q) == (from_place_id, to_place_id):
+            return True
+        return ride_match_quality(from_q, to_q, from_text, to_text) > 0
+
+    _ride_cache.invalidate_ride(ride_id, matches)
+
+
+def ride_cache_stats() -> dict:
+    return _ride_cache.stats()
+
+
+def _insert_ride(con, payload) -> Tuple[int, int, int, int, bool]:
+    """
+    Write job: validate the driver, resolve the endpoints to places and
+    insert the ride.
+    Returns (ride_id, allow_guests, from_place_id, to_place_id, new_places).
     """
-    con = connect()
     cur = con.cursor()
 
     # driver exists?
     cur.execute("SELECT id, user_type, is_verified FROM users WHERE id=?", (payload.driver_id,))
     driver = cur.fetchone()
     if not driver:
-        con.close()
         raise ValueError("Driver not found")
 
     if driver["user_type"] != "campus":
-        con.close()
         raise ValueError("Only campus users can post rides")
 
     if int(driver["is_verified"]) != 1:
-        con.close()
         raise ValueError("Driver must be verified before posting rides")
 
     allow_guests = int(bool(payload.allow_guests))
@@ -34,31 +78,59 @@ def create_ride(payload):
     if payload.allow_guests is None:
         allow_guests = int(settings.ALLOW_GUESTS_BY_DEFAULT)
 
-    cur.execute(
+    from_place_id, from_new = resolve_or_create_place(
+        con, payload.from_text, validate_point(payload.from_lat, payload.from_lon, "from")
+    )
+    to_place_id, to_new = resolve_or_create_place(
+        con, payload.to_text, validate_point(payload.to_lat, payload.to_lon, "to")
+    )
+
+    ride_id = insert_returning_id(
+        con,
         """
         INSERT INTO rides (driver_id, from_text, to_text, depart_time, seats_total, seats_left,
-                           vehicle_type, allow_guests, distance_km, created_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                           vehicle_type, allow_guests, distance_km, created_at,
+                           from_lat, from_lon, to_lat, to_lon, from_place_id, to_place_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         """,
         (
             payload.driver_id,
             payload.from_text.strip(),
             payload.to_text.strip(),
-            payload.depart_time.isoformat(),
+            db_time(payload.depart_time),
             payload.seats_total,
             payload.seats_total,
             payload.vehicle_type.strip().lower(),
             allow_guests,
             float(payload.distance_km),
             utc_iso(),
+            payload.from_lat,
+            payload.from_lon,
+            payload.to_lat,
+            payload.to_lon,
+            from_place_id,
+            to_place_id,
         ),
     )
-    con.commit()
-    ride_id = cur.lastrowid
-    con.close()
+    bump_user_stats(con, payload.driver_id, rides_posted=1)
 
     if settings.ENABLE_IN_APP_NOTIFICATIONS:
-        create_notification(payload.driver_id, "Ride Posted", "Your ride is now visible for bookings.")
+        add_notification(con, payload.driver_id, "Ride Posted", "Your ride is now visible for bookings.")
+    return ride_id, allow_guests, from_place_id, to_place_id, from_new or to_new
+
+
+def create_ride(payload):
+    """
+    payload: RideCreateRequest
+    Rule: Only campus users (and verified) can post rides.
+    """
+    validate_point(payload.from_lat, payload.from_lon, "from")
+    validate_point(payload.to_lat, payload.to_lon, "to")
+    ride_id, allow_guests, from_place_id, to_place_id, new_places = run_write(_insert_ride, payload)
+    if new_places:
+        sync_gazetteer()
+    invalidate_ride_cache(ride_id, payload.from_text.strip(), payload.to_text.strip(), from_place_id, to_place_id)
+    notify_outbox()
 
     return {
         "id": ride_id,
@@ -71,66 +143,16 @@ def create_ride(payload):
         "vehicle_type": payload.vehicle_type.strip().lower(),
         "allow_guests": bool(allow_guests),
         "distance_km": float(payload.distance_km),
+        "from_lat": payload.from_lat,
+        "from_lon": payload.from_lon,
+        "to_lat": payload.to_lat,
+        "to_lon": payload.to_lon,
+        "from_place_id": from_place_id,
+        "to_place_id": to_place_id,
     }
 
 
-def search_rides(from_q: str, to_q: str):
-    con = connect()
-    cur = con.cursor()
-    cur.execute(
-        """
-        SELECT id, driver_id, from_text, to_text, depart_time, seats_total, seats_left,
-               vehicle_type, allow_guests, distance_km
-        FROM rides
-        WHERE seats_left > 0
-          AND LOWER(from_text) LIKE ?
-          AND LOWER(to_text) LIKE ?
-        ORDER BY depart_time ASC
-        """,
-        (f"%{from_q.lower()}%", f"%{to_q.lower()}%"),
-    )
-    rows = cur.fetchall()
-    con.close()
-
-    from .utils import parse_iso_datetime
-    out = []
-    for r in rows:
-        out.append(
-            {
-                "id": r["id"],
-                "driver_id": r["driver_id"],
-                "from_text": r["from_text"],
-                "to_text": r["to_text"],
-                "depart_time": parse_iso_datetime(r["depart_time"]),
-                "seats_total": r["seats_total"],
-                "seats_left": r["seats_left"],
-                "vehicle_type": r["vehicle_type"],
-                "allow_guests": bool(r["allow_guests"]),
-                "distance_km": float(r["distance_km"]),
-            }
-        )
-    return out
-
-
-def get_ride_by_id(ride_id: int):
-    con = connect()
-    cur = con.cursor()
-    cur.execute(
-        """
-        SELECT id, driver_id, from_text, to_text, depart_time, seats_total, seats_left,
-               vehicle_type, allow_guests, distance_km
-        FROM rides
-        WHERE id=?
-        """,
-        (ride_id,),
-    )
-    r = cur.fetchone()
-    con.close()
-
-    if not r:
-        raise ValueError("Ride not found")
-
-    from .utils import parse_iso_datetime
+def _ride_row_to_dict(r) -> dict:
     return {
         "id": r["id"],
         "driver_id": r["driver_id"],
@@ -142,4 +164,323 @@ def get_ride_by_id(ride_id: int):
         "vehicle_type": r["vehicle_type"],
         "allow_guests": bool(r["allow_guests"]),
         "distance_km": float(r["distance_km"]),
+        "from_lat": r["from_lat"],
+        "from_lon": r["from_lon"],
+        "to_lat": r["to_lat"],
+        "to_lon": r["to_lon"],
+        "from_place_id": r["from_place_id"],
+        "to_place_id": r["to_place_id"],
     }
+
+
+def _search_key(
+    from_q: str,
+    to_q: str,
+    depart_after: Optional[datetime],
+    depart_before: Optional[datetime],
+    limit: int,
+    cursor: Optional[str],
+) -> SearchKey:
+    return (
+        normalize_place(from_q),
+        normalize_place(to_q),
+        db_time_bound(depart_after) if depart_after else None,
+        db_time_bound(depart_before) if depart_before else None,
+        max(1, min(int(limit), MAX_PAGE_SIZE)),
+        cursor or None,
+    )
+
+
+def search_rides(
+    from_q: str,
+    to_q: str,
+    depart_after: Optional[datetime] = None,
+    depart_before: Optional[datetime] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+) -> Tuple[List[dict], Optional[str]]:
+    """
+    Cached front of _search_rides, keyed by the normalized query and paging
+    arguments. Pages without depart_after mean "from now on"; the search TTL
+    bounds how long a just-departed ride can linger in them.
+    """
+    key = _search_key(from_q, to_q, depart_after, depart_before, limit, cursor)
+    cached = _ride_cache.get_search(key)
+    if cached is not None:
+        return cached
+    return _load_search(key, depart_after, depart_before)
+
+
+def _load_search(
+    key: SearchKey,
+    depart_after: Optional[datetime],
+    depart_before: Optional[datetime],
+) -> Tuple[List[dict], Optional[str]]:
+    generation = _ride_cache.generation
+    rides, next_cursor = _search_rides(
+        key[0], key[1], depart_after, depart_before, key[4], key[5],
+        not_before=_ride_cache.invalidated_at,
+    )
+    _ride_cache.put_search(key, rides, next_cursor, generation)
+    return rides, next_cursor
+
+
+def _search_rides(
+    from_q: str,
+    to_q: str,
+    depart_after: Optional[datetime] = None,
+    depart_before: Optional[datetime] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    not_before: Optional[float] = None,
+) -> Tuple[List[dict], Optional[str]]:
+    """
+    Rides between two places within a departure window, paged by an opaque
+    keyset cursor on (depart_time, id). Matches come from a trigram search
+    over from_text/to_text (prefix and typo-tolerant); when both queries
+    name known places (see place_service.resolve_route), every ride between
+    those places matches too, whatever its text. The window defaults to
+    "from now on", so departed rides are never scanned.
+    Returns (rides, next_cursor); next_cursor is None on the last page.
+    May read a replica holding every commit made before `not_before`.
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    lower = db_time_bound(depart_after or utc_now())
+    upper = db_time_bound(depart_before) if depart_before else None
+    if cursor:
+        after_time, after_id = decode_cursor(cursor, str, int)
+    else:
+        after_time, after_id = "", 0
+
+    route = resolve_route(from_q, to_q)
+    with read_connection(not_before) as con:
+        match = build_match_query(from_q, to_q) if fts_available(con) else None
+        source = "rides r"
+        if match and route is None:
+            source = "rides_fts JOIN rides r ON r.id = rides_fts.rowid"
+            filters = ["rides_fts MATCH ?"]
+            params: list = [match]
+        elif match:
+            filters = ["r.id IN (SELECT rowid FROM rides_fts WHERE rides_fts MATCH ?)"]
+            params = [match]
+        else:
+            # queries shorter than a trigram, or no FTS5 in this SQLite build
+            filters = ["LOWER(r.from_text) LIKE ? AND LOWER(r.to_text) LIKE ?"]
+            params = [f"%{from_q.lower()}%", f"%{to_q.lower()}%"]
+        if route is not None:
+            # rides between the named places, plus text matches elsewhere
+            # ("Mall" also finds rides to "City Mall")
+            filters = [f"((r.from_place_id = ? AND r.to_place_id = ?) OR ({filters[0]}))"]
+            params = [*route, *params]
+
+        filters += ["r.seats_left > 0", "r.depart_time >= ?"]
+        params.append(lower)
+        if upper:
+            filters.append("r.depart_time < ?")
+            params.append(upper)
+
+        sql = f"""
+            SELECT r.id, r.driver_id, r.from_text, r.to_text, r.depart_time, r.seats_total,
+                   r.seats_left, r.vehicle_type, r.allow_guests, r.distance_km,
+                   r.from_lat, r.from_lon, r.to_lat, r.to_lon, r.from_place_id, r.to_place_id
+            FROM {source}
+            WHERE {" AND ".join(filters)}
+              AND (r.depart_time > ? OR (r.depart_time = ? AND r.id > ?))
+            ORDER BY r.depart_time ASC, r.id ASC
+            LIMIT ?
+        """
+
+        # Rows failing the match-quality check are dropped after the fetch, so
+        # scan in batches until the page is full; the scan itself is capped so
+        # a sparse match set can't turn one request into a full-history read.
+        page: List = []
+        scanned = 0
+        exhausted = False
+        while len(page) <= limit and scanned < CANDIDATE_LIMIT:
+            batch = con.execute(sql, (*params, after_time, after_time, after_id, limit + 1)).fetchall()
+            scanned += len(batch)
+            for r in batch:
+                after_time, after_id = r["depart_time"], r["id"]
+                on_route = route is not None and (r["from_place_id"], r["to_place_id"]) == route
+                if on_route or ride_match_quality(from_q, to_q, r["from_text"], r["to_text"]) > 0:
+                    page.append(r)
+                    if len(page) > limit:
+                        break
+            if len(batch) <= limit:
+                exhausted = True
+                break
+
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        last = page[-1]
+        next_cursor = encode_cursor(last["depart_time"], last["id"])
+    elif not exhausted:
+        # scan cap hit before the page filled: resume after the last row scanned
+        next_cursor = encode_cursor(after_time, after_id)
+
+    return [_ride_row_to_dict(r) for r in page], next_cursor
+
+
+def get_ride_by_id(ride_id: int):
+    cached = _ride_cache.get_ride(ride_id)
+    if cached is not None:
+        return cached
+    return _load_ride(ride_id)
+
+
+def _load_ride(ride_id: int) -> dict:
+    generation = _ride_cache.generation
+    # a replica must already have every write that invalidated the cache,
+    # or the stale row would be cached again
+    with read_connection(not_before=_ride_cache.invalidated_at) as con:
+        cur = con.cursor()
+        cur.execute(
+            """
+            SELECT id, driver_id, from_text, to_text, depart_time, seats_total, seats_left,
+                   vehicle_type, allow_guests, distance_km, from_lat, from_lon, to_lat, to_lon,
+                   from_place_id, to_place_id
+            FROM rides
+            WHERE id=?
+            """,
+            (ride_id,),
+        )
+        r = cur.fetchone()
+
+    if not r:
+        raise ValueError("Ride not found")
+
+    ride = _ride_row_to_dict(r)
+    _ride_cache.put_ride(ride, generation)
+    return ride
+
+
+def _hours_apart(a: datetime, b: datetime) -> float:
+    # naive values are UTC, as stored
+    a = a if a.tzinfo else a.replace(tzinfo=timezone.utc)
+    b = b if b.tzinfo else b.replace(tzinfo=timezone.utc)
+    return abs((a - b).total_seconds()) / 3600.0
+
+
+def search_rides_nearby(
+    from_lat: float,
+    from_lon: float,
+    to_lat: float,
+    to_lon: float,
+    radius_km: float = DEFAULT_NEARBY_RADIUS_KM,
+    depart_after: Optional[datetime] = None,
+    depart_before: Optional[datetime] = None,
+    depart_at: Optional[datetime] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+) -> Tuple[List[dict], Optional[str]]:
+    """
+    Rides starting within radius_km of (from_lat, from_lon) and ending within
+    radius_km of (to_lat, to_lon), in a departure window that defaults to
+    "from now on". Ranked by driver detour plus DETOUR_KM_PER_HOUR per hour
+    between the ride's departure and depart_at (default: window start).
+    Every ride in the bounding boxes is ranked, keeping only the best page
+    in memory; the cursor is the last (score, id) served plus the reference
+    time, so later pages rank the same way.
+    """
+    pickup = validate_point(from_lat, from_lon, "from")
+    dropoff = validate_point(to_lat, to_lon, "to")
+    if pickup is None or dropoff is None:
+        raise ValueError("Both pickup and drop-off coordinates are required")
+    radius_km = min(max(float(radius_km), 0.1), MAX_NEARBY_RADIUS_KM)
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    window_start = depart_after or utc_now()
+    target = depart_at or window_start
+    after: Optional[Tuple[float, int]] = None
+    if cursor:
+        after_score, after_id, target_iso = decode_cursor(cursor, float, int, str)
+        after = (after_score, after_id)
+        try:
+            target = parse_iso_datetime(target_iso)
+        except ValueError:
+            raise ValueError("Invalid cursor")
+
+    with read_connection() as con:
+        if geo_index_available(con):
+            source = "rides_geo g JOIN rides r ON r.id = g.id"
+            filters = [f"g.{c}_max >= ? AND g.{c}_min <= ?" for c in ("from_lat", "from_lon", "to_lat", "to_lon")]
+        else:
+            source = "rides r"
+            filters = [f"r.{c} BETWEEN ? AND ?" for c in ("from_lat", "from_lon", "to_lat", "to_lon")]
+        from_box, to_box = bounding_box(pickup, radius_km), bounding_box(dropoff, radius_km)
+        params: list = [*from_box, *to_box]
+
+        filters += ["r.seats_left > 0", "r.depart_time >= ?"]
+        params.append(db_time_bound(window_start))
+        if depart_before:
+            filters.append("r.depart_time < ?")
+            params.append(db_time_bound(depart_before))
+
+        rows = con.execute(
+            f"""
+            SELECT r.id, r.driver_id, r.from_text, r.to_text, r.depart_time, r.seats_total,
+                   r.seats_left, r.vehicle_type, r.allow_guests, r.distance_km,
+                   r.from_lat, r.from_lon, r.to_lat, r.to_lon, r.from_place_id, r.to_place_id
+            FROM {source}
+            WHERE {" AND ".join(filters)}
+            """,
+            params,
+        )
+        candidates = _rank_nearby(rows, pickup, dropoff, radius_km, target)
+        if after is not None:
+            candidates = (c for c in candidates if c[:2] > after)
+        # one extra tells whether there is a next page
+        best = heapq.nsmallest(limit + 1, candidates, key=lambda c: c[:2])
+
+    page = [ride for _, _, ride in best[:limit]]
+    next_cursor = None
+    if len(best) > limit:
+        score, ride_id, _ = best[limit - 1]
+        next_cursor = encode_cursor(score, ride_id, db_time(target))
+    return page, next_cursor
+
+
+def _rank_nearby(rows, pickup, dropoff, radius_km: float, target: datetime):
+    """
+    (score, id, ride) for the rows within radius_km of both ends.
+    """
+    for r in rows:
+        origin, destination = (r["from_lat"], r["from_lon"]), (r["to_lat"], r["to_lon"])
+        pickup_km, dropoff_km = haversine_km(pickup, origin), haversine_km(destination, dropoff)
+        if pickup_km > radius_km or dropoff_km > radius_km:
+            continue  # inside the bounding box but outside the circle
+        ride = _ride_row_to_dict(r)
+        ride["pickup_km"] = round(pickup_km, 3)
+        ride["dropoff_km"] = round(dropoff_km, 3)
+        ride["detour_km"] = round(detour_km(origin, destination, pickup, dropoff), 3)
+        score = float(ride["detour_km"] + DETOUR_KM_PER_HOUR * _hours_apart(ride["depart_time"], target))
+        yield score, int(ride["id"]), ride
+
+
+# -------------------------------------------------
+# Async variants (DB work on the async_db executor; cache hits stay on the loop)
+# -------------------------------------------------
+create_ride_async = db_async(create_ride)
+search_rides_nearby_async = db_async(search_rides_nearby)
+
+
+async def get_ride_by_id_async(ride_id: int) -> dict:
+    cached = _ride_cache.get_ride(ride_id)
+    if cached is not None:
+        return cached
+    return await run_db(_load_ride, ride_id)
+
+
+async def search_rides_async(
+    from_q: str,
+    to_q: str,
+    depart_after: Optional[datetime] = None,
+    depart_before: Optional[datetime] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+) -> Tuple[List[dict], Optional[str]]:
+    key = _search_key(from_q, to_q, depart_after, depart_before, limit, cursor)
+    cached = _ride_cache.get_search(key)
+    if cached is not None:
+        return cached
+    return await run_db(_load_search, key, depart_after, depart_before)
@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import re
+import sqlite3
+from difflib import SequenceMatcher
+from typing import List, Optional
+
+from .drivers import get_driver
+
+# Below this fuzzy similarity a candidate is treated as noise
+MIN_FUZZY_SIMILARITY = 0.75
+# Upper bound on rows pulled from the FTS index before Python-side scoring
+CANDIDATE_LIMIT = 500
+
+_WS_RE = re.compile(r"\s+")
+
+_fts_available: Optional[bool] = None
+
+
+def normalize_place(text: str) -> str:
+    return _WS_RE.sub(" ", (text or "").strip().lower())
+
+
+def trigrams(text: str) -> List[str]:
+    t = normalize_place(text)
+    return sorted({t[i:i + 3] for i in range(len(t) - 2)})
+
+
+def create_search_index(con: sqlite3.Connection) -> None:
+    """
+    Migration step: FTS5 trigram index over rides(from_text, to_text), kept in
+    sync by triggers so create_ride updates it in the same transaction.
+    Skipped when this SQLite build lacks FTS5/trigram (< 3.34); search then
+    falls back to LIKE scanning.
+    """
+    try:
+        con.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS rides_fts USING fts5(
+                from_text, to_text,
+                content='rides', content_rowid='id',
+                tokenize='trigram'
+            )
+        """)
+    except sqlite3.OperationalError:
+        return
+
+    con.execute("""
+        CREATE TRIGGER IF NOT EXISTS rides_fts_ai AFTER INSERT ON rides BEGIN
+            INSERT INTO rides_fts(rowid, from_text, to_text)
+            VALUES (new.id, new.from_text, new.to_text);
+        END
+    """)
+    con.execute("""
+        CREATE TRIGGER IF NOT EXISTS rides_fts_ad AFTER DELETE ON rides BEGIN
+            INSERT INTO rides_fts(rides_fts, rowid, from_text, to_text)
+            VALUES ('delete', old.id, old.from_text, old.to_text);
+        END
+    """)
+    con.execute("""
+        CREATE TRIGGER IF NOT EXISTS rides_fts_au AFTER UPDATE OF from_text, to_text ON rides BEGIN
+            INSERT INTO rides_fts(rides_fts, rowid, from_text, to_text)
+            VALUES ('delete', old.id, old.from_text, old.to_text);
+            INSERT INTO rides_fts(rowid, from_text, to_text)
+            VALUES (new.id, new.from_text, new.to_text);
+        END
+    """)
+    # backfill rides that existed before the index
+    con.execute("INSERT INTO rides_fts(rides_fts) VALUES ('rebuild')")
+
+
+def fts_available(con: sqlite3.Connection) -> bool:
+    global _fts_available
+    if _fts_available is None:
+        driver = get_driver()
+        _fts_available = driver.dialect == "sqlite" and driver.has_table(con, "rides_fts")
+    return _fts_available
+
+
+def _fts_phrase(token: str) -> str:
+    return '"' + token.replace('"', '""') + '"'
+
+
+def build_match_query(from_q: str, to_q: str) -> Optional[str]:
+    """
+    FTS5 expression matching rides that share at least one trigram with each
+    query. Returns None when a query is too short to have a trigram.
+    """
+    from_grams = trigrams(from_q)
+    to_grams = trigrams(to_q)
+    if not from_grams or not to_grams:
+        return None
+    from_expr = " OR ".join(_fts_phrase(g) for g in from_grams)
+    to_expr = " OR ".join(_fts_phrase(g) for g in to_grams)
+    return f"from_text : ({from_expr}) AND to_text : ({to_expr})"
+
+
+def match_quality(query: str, text: str) -> float:
+    """
+    0..1 score of how well `text` matches `query`:
+    exact > prefix > word prefix > substring > fuzzy (typo-tolerant).
+    """
+    q = normalize_place(query)
+    t = normalize_place(text)
+    if not q:
+        return 0.0
+    if t == q:
+        return 1.0
+    if t.startswith(q):
+        return 0.95
+    if any(word.startswith(q) for word in t.split(" ")):
+        return 0.9
+    if q in t:
+        return 0.8
+
+    # best alignment of the query against any same-length window of the text
+    best = SequenceMatcher(None, q, t).ratio()
+    n = len(q)
+    for i in range(max(len(t) - n + 1, 1)):
+        best = max(best, SequenceMatcher(None, q, t[i:i + n]).ratio())
+    if best < MIN_FUZZY_SIMILARITY:
+        return 0.0
+    return round(0.75 * best, 4)
+
+
+def ride_match_quality(from_q: str, to_q: str, from_text: str, to_text: str) -> float:
+    """
+    Both ends must match; the weaker end dominates the score.
+    """
+    return min(match_quality(from_q, from_text), match_quality(to_q, to_text))
@@ -52,13 +52,73 @@ class Settings:
     MAX_CANCELLATIONS_PER_WEEK: int
     OTP_EXPIRY_MINUTES: int
 
+    # Ratings (Bayesian prior used to smooth averages of rarely-rated drivers)
+    RATING_PRIOR_MEAN: float
+    RATING_PRIOR_WEIGHT: float
+
     # Notifications
     ENABLE_IN_APP_NOTIFICATIONS: bool
     ENABLE_PUSH_NOTIFICATIONS: bool
+    NOTIFICATION_DELIVERY_MODE: str  # "async" | "sync"
+    NOTIFICATION_OUTBOX_POLL_MS: int
+    NOTIFICATION_OUTBOX_BATCH_SIZE: int
 
     # DB
-    DB_TYPE: str
+    DB_TYPE: str  # "sqlite" | "sqlite-server" (local stand-in for a server DB) | "postgres"
+    DB_URL: str  # connection URL for server databases
     DB_PATH: str
+    DB_POOL_SIZE: int
+    DB_POOL_TIMEOUT_SECONDS: float  # read-only pool
+    DB_WRITE_BATCH_SIZE: int  # max write jobs group-committed per transaction
+    DB_WRITE_BATCH_WAIT_MS: int  # how long the writer waits for more jobs; 0 = take only what is queued
+    DB_WRITE_QUEUE_SIZE: int
+
+    # Read replicas (see lib/replicas.py)
+    DB_REPLICA_MODE: str  # "off" | "file-copy" (local snapshots of a SQLite file) | "server"
+    DB_REPLICA_COUNT: int  # file-copy replicas
+    DB_REPLICA_URLS: List[str]  # server replicas
+    DB_REPLICA_POOL_SIZE: int  # read-only connections per replica
+    DB_REPLICA_REFRESH_SECONDS: float  # file-copy: snapshot interval; server: lag probe interval
+    DB_REPLICA_MAX_LAG_SECONDS: float  # staleness bound; staler replicas are skipped
+
+    # Storage profile (SQLite PRAGMAs applied on every pooled connection)
+    DB_JOURNAL_MODE: str  # "WAL" | "DELETE" | ...
+    DB_SYNCHRONOUS: str  # "OFF" | "NORMAL" | "FULL" | "EXTRA"
+    DB_CACHE_SIZE_KB: int
+    DB_MMAP_SIZE_MB: int
+    DB_BUSY_TIMEOUT_MS: int
+    DB_TEMP_STORE: str  # "DEFAULT" | "FILE" | "MEMORY"
+
+    # Sessions
+    SESSION_TTL_HOURS: float
+    SESSION_REFRESH_THRESHOLD: float  # refresh once less than this fraction of the TTL remains
+    MAX_SESSIONS_PER_USER: int
+    SESSION_SWEEP_INTERVAL_SECONDS: float
+    SESSION_SWEEP_BATCH_SIZE: int
+
+    # Gazetteer (see lib/gazetteer.py)
+    GAZETTEER_SYNC_INTERVAL_SECONDS: float  # how soon other workers' new places reach this one's index
+
+    # Analytics rollups
+    ANALYTICS_ROLLUP_INTERVAL_SECONDS: float
+    ANALYTICS_ROLLUP_BATCH_SIZE: int
+
+    # Request rate limiting / load shedding (see lib/rate_limit.py)
+    RATE_LIMIT_ENABLED: bool
+    RATE_LIMIT_GROUPS: Dict[str, Dict[str, Any]]
+    RATE_LIMIT_MAX_TRACKED_CLIENTS: int
+    RATE_LIMIT_EXEMPT_PATHS: List[str]
+    RATE_LIMIT_LONG_LIVED_PATHS: List[str]
+    RATE_LIMIT_TRUST_FORWARDED_FOR: bool
+    MAX_CONCURRENT_REQUESTS: int
+
+    # In-process caches
+    SESSION_CACHE_SIZE: int
+    SESSION_CACHE_TTL_SECONDS: float
+    RIDE_CACHE_SIZE: int
+    RIDE_CACHE_TTL_SECONDS: float
+    SEARCH_CACHE_SIZE: int
+    SEARCH_CACHE_TTL_SECONDS: float
 
     # Runtime flags
     DEV_MODE: bool
@@ -80,14 +140,68 @@ def load_settings() -> Settings:
     emissions_cfg = cfg.get("emissions", {})
     limits_cfg = cfg.get("limits", {})
     notif_cfg = cfg.get("notifications", {})
+    ratings_cfg = cfg.get("ratings", {})
     db_cfg = cfg.get("database", {})
+    storage_cfg = cfg.get("storage_profile", {})
+    cache_cfg = cfg.get("cache", {})
+    sessions_cfg = cfg.get("sessions", {})
+    analytics_cfg = cfg.get("analytics", {})
+    gazetteer_cfg = cfg.get("gazetteer", {})
+    rate_cfg = cfg.get("rate_limits", {})
 
     # ENV overrides
     env_environment = os.getenv("ENV", app_cfg.get("environment", "development"))
     dev_mode = _env_bool("DEV_MODE", env_environment != "production")
 
     db_type = os.getenv("DB_TYPE", db_cfg.get("type", "sqlite"))
+    db_url = os.getenv("DATABASE_URL", db_cfg.get("url", ""))
     db_path = os.getenv("DB_PATH", db_cfg.get("path", "backend/data/carpool.db"))
+    db_pool_size = int(os.getenv("DB_POOL_SIZE", db_cfg.get("pool_size", 8)))
+    db_pool_timeout = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", db_cfg.get("pool_timeout_seconds", 10)))
+    db_write_batch = int(os.getenv("DB_WRITE_BATCH_SIZE", db_cfg.get("write_batch_size", 64)))
+    db_write_wait_ms = int(os.getenv("DB_WRITE_BATCH_WAIT_MS", db_cfg.get("write_batch_wait_ms", 0)))
+    db_write_queue = int(os.getenv("DB_WRITE_QUEUE_SIZE", db_cfg.get("write_queue_size", 1000)))
+
+    replica_cfg = db_cfg.get("replicas", {})
+    replica_mode = os.getenv("DB_REPLICA_MODE", replica_cfg.get("mode", "off"))
+    replica_urls = os.getenv("DB_REPLICA_URLS")
+    replica_urls = replica_urls.split(",") if replica_urls is not None else replica_cfg.get("urls", [])
+    replica_count = int(os.getenv("DB_REPLICA_COUNT", replica_cfg.get("count", 1)))
+    replica_pool = int(replica_cfg.get("pool_size", db_pool_size))
+    replica_refresh = float(os.getenv("DB_REPLICA_REFRESH_SECONDS", replica_cfg.get("refresh_seconds", 1)))
+    replica_max_lag = float(os.getenv("DB_REPLICA_MAX_LAG_SECONDS", replica_cfg.get("max_lag_seconds", 5)))
+
+    journal_mode = os.getenv("DB_JOURNAL_MODE", storage_cfg.get("journal_mode", "WAL"))
+    synchronous = os.getenv("DB_SYNCHRONOUS", storage_cfg.get("synchronous", "NORMAL"))
+    cache_size_kb = int(os.getenv("DB_CACHE_SIZE_KB", storage_cfg.get("cache_size_kb", 16384)))
+    mmap_size_mb = int(os.getenv("DB_MMAP_SIZE_MB", storage_cfg.get("mmap_size_mb", 64)))
+    busy_timeout_ms = int(os.getenv("DB_BUSY_TIMEOUT_MS", storage_cfg.get("busy_timeout_ms", 5000)))
+    temp_store = os.getenv("DB_TEMP_STORE", storage_cfg.get("temp_store", "MEMORY"))
+
+    session_ttl = float(os.getenv("SESSION_TTL_HOURS", sessions_cfg.get("ttl_hours", 168)))
+    session_refresh = float(sessions_cfg.get("sliding_refresh_threshold", 0.5))
+    max_sessions = int(os.getenv("MAX_SESSIONS_PER_USER", sessions_cfg.get("max_per_user", 5)))
+    sweep_interval = float(sessions_cfg.get("sweep_interval_seconds", 300))
+    sweep_batch = int(sessions_cfg.get("sweep_batch_size", 500))
+
+    gazetteer_sync = float(gazetteer_cfg.get("sync_interval_seconds", 30))
+
+    rollup_interval = float(os.getenv("ANALYTICS_ROLLUP_INTERVAL_SECONDS", analytics_cfg.get("rollup_interval_seconds", 60)))
+    rollup_batch = int(analytics_cfg.get("rollup_batch_size", 500))
+
+    rate_limit_enabled = _env_bool("RATE_LIMIT_ENABLED", bool(rate_cfg.get("enabled", True)))
+    max_concurrent = int(os.getenv("MAX_CONCURRENT_REQUESTS", rate_cfg.get("max_concurrent_requests", 64)))
+
+    session_cache_size = int(os.getenv("SESSION_CACHE_SIZE", cache_cfg.get("session_cache_size", 10000)))
+    session_cache_ttl = float(os.getenv("SESSION_CACHE_TTL_SECONDS", cache_cfg.get("session_cache_ttl_seconds", 300)))
+    ride_cache_size = int(os.getenv("RIDE_CACHE_SIZE", cache_cfg.get("ride_cache_size", 2000)))
+    ride_cache_ttl = float(os.getenv("RIDE_CACHE_TTL_SECONDS", cache_cfg.get("ride_cache_ttl_seconds", 60)))
+    search_cache_size = int(os.getenv("SEARCH_CACHE_SIZE", cache_cfg.get("search_cache_size", 1000)))
+    search_cache_ttl = float(os.getenv("SEARCH_CACHE_TTL_SECONDS", cache_cfg.get("search_cache_ttl_seconds", 15)))
+
+    notif_mode = os.getenv("NOTIFICATION_DELIVERY_MODE", notif_cfg.get("delivery_mode", "async"))
+    outbox_poll_ms = int(notif_cfg.get("outbox_poll_interval_ms", 1000))
+    outbox_batch = int(notif_cfg.get("outbox_batch_size", 200))
 
     otp_exp = int(os.getenv("OTP_EXPIRY_MINUTES", limits_cfg.get("otp_expiry_minutes", 10)))
     max_bookings = int(os.getenv("MAX_BOOKINGS_PER_DAY", limits_cfg.get("max_bookings_per_day", 5)))
@@ -112,11 +226,63 @@ def load_settings() -> Settings:
         MAX_CANCELLATIONS_PER_WEEK=max_cancels,
         OTP_EXPIRY_MINUTES=otp_exp,
 
+        RATING_PRIOR_MEAN=float(ratings_cfg.get("prior_mean", 4.0)),
+        RATING_PRIOR_WEIGHT=float(ratings_cfg.get("prior_weight", 5)),
+
         ENABLE_IN_APP_NOTIFICATIONS=bool(notif_cfg.get("enable_in_app_notifications", True)),
         ENABLE_PUSH_NOTIFICATIONS=bool(notif_cfg.get("enable_push_notifications", False)),
+        NOTIFICATION_DELIVERY_MODE=str(notif_mode).strip().lower(),
+        NOTIFICATION_OUTBOX_POLL_MS=outbox_poll_ms,
+        NOTIFICATION_OUTBOX_BATCH_SIZE=outbox_batch,
 
-        DB_TYPE=str(db_type),
+        DB_TYPE=str(db_type).strip().lower(),
+        DB_URL=str(db_url),
         DB_PATH=str(db_path),
+        DB_POOL_SIZE=db_pool_size,
+        DB_POOL_TIMEOUT_SECONDS=db_pool_timeout,
+        DB_WRITE_BATCH_SIZE=db_write_batch,
+        DB_WRITE_BATCH_WAIT_MS=db_write_wait_ms,
+        DB_WRITE_QUEUE_SIZE=db_write_queue,
+
+        DB_REPLICA_MODE=str(replica_mode).strip().lower(),
+        DB_REPLICA_COUNT=replica_count,
+        DB_REPLICA_URLS=[u.strip() for u in replica_urls if u.strip()],
+        DB_REPLICA_POOL_SIZE=replica_pool,
+        DB_REPLICA_REFRESH_SECONDS=replica_refresh,
+        DB_REPLICA_MAX_LAG_SECONDS=replica_max_lag,
+
+        DB_JOURNAL_MODE=str(journal_mode).strip().upper(),
+        DB_SYNCHRONOUS=str(synchronous).strip().upper(),
+        DB_CACHE_SIZE_KB=cache_size_kb,
+        DB_MMAP_SIZE_MB=mmap_size_mb,
+        DB_BUSY_TIMEOUT_MS=busy_timeout_ms,
+        DB_TEMP_STORE=str(temp_store).strip().upper(),
+
+        SESSION_TTL_HOURS=session_ttl,
+        SESSION_REFRESH_THRESHOLD=session_refresh,
+        MAX_SESSIONS_PER_USER=max_sessions,
+        SESSION_SWEEP_INTERVAL_SECONDS=sweep_interval,
+        SESSION_SWEEP_BATCH_SIZE=sweep_batch,
+
+        GAZETTEER_SYNC_INTERVAL_SECONDS=gazetteer_sync,
+
+        ANALYTICS_ROLLUP_INTERVAL_SECONDS=rollup_interval,
+        ANALYTICS_ROLLUP_BATCH_SIZE=rollup_batch,
+
+        RATE_LIMIT_ENABLED=rate_limit_enabled,
+        RATE_LIMIT_GROUPS=dict(rate_cfg.get("groups", {})),
+        RATE_LIMIT_MAX_TRACKED_CLIENTS=int(rate_cfg.get("max_tracked_clients", 10000)),
+        RATE_LIMIT_EXEMPT_PATHS=list(rate_cfg.get("exempt_paths", ["/health"])),
+        RATE_LIMIT_LONG_LIVED_PATHS=list(rate_cfg.get("long_lived_paths", [])),
+        RATE_LIMIT_TRUST_FORWARDED_FOR=bool(rate_cfg.get("trust_forwarded_for", False)),
+        MAX_CONCURRENT_REQUESTS=max_concurrent,
+
+        SESSION_CACHE_SIZE=session_cache_size,
+        SESSION_CACHE_TTL_SECONDS=session_cache_ttl,
+        RIDE_CACHE_SIZE=ride_cache_size,
+        RIDE_CACHE_TTL_SECONDS=ride_cache_ttl,
+        SEARCH_CACHE_SIZE=search_cache_size,
+        SEARCH_CACHE_TTL_SECONDS=search_cache_ttl,
 
         DEV_MODE=dev_mode,
     )
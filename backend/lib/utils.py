@@ -1,6 +1,9 @@
 from __future__ import annotations
 
+import base64
+import json
 from datetime import datetime, timezone
+from typing import Any, List
 
 
 def utc_now() -> datetime:
@@ -21,3 +24,52 @@ def parse_iso_datetime(value: str) -> datetime:
     Parse ISO 8601 datetime string.
     """
     return datetime.fromisoformat(value)
+
+
+def db_time(dt: datetime) -> str:
+    """
+    ISO string as stored in TEXT time columns. Aware datetimes are converted
+    to UTC so that string order matches chronological order.
+    """
+    if dt.tzinfo is None:
+        return dt.isoformat()
+    return dt.astimezone(timezone.utc).isoformat()
+
+
+def db_time_bound(dt: datetime) -> str:
+    """
+    Offset-free UTC prefix for range comparisons against stored time
+    strings, which may or may not carry a "+00:00" suffix. Keeps the
+    microseconds db_time() stores, so ">=" and "<" hold to the microsecond.
+    Naive values are taken as UTC.
+    """
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt.isoformat()
+
+
+def encode_cursor(*values: Any) -> str:
+    """
+    Opaque keyset cursor for paginated endpoints.
+    """
+    raw = json.dumps(list(values), separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, *types: type) -> List[Any]:
+    """
+    Values of a cursor made by encode_cursor(), which must be one value of
+    each of `types` (str, int or float) in order. Raises ValueError otherwise.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, UnicodeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != len(types):
+        raise ValueError("Invalid cursor")
+    for value, expected in zip(values, types):
+        # bool is an int subclass; json true/false is never a valid position
+        if isinstance(value, bool) or not isinstance(value, expected):
+            raise ValueError("Invalid cursor")
+    return values
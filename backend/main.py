@@ -31,10 +31,29 @@ app = FastAPI(
 # Configuration & Database Initialization
 # -------------------------------------------------
 from lib.settings import settings
-from lib.db import init_db
+from lib.rate_limit import RateLimitMiddleware, rate_limit_stats
+from lib.db import init_db, close_pool, db_stats, storage_report, schema_version
+from lib.drivers import get_driver
+from lib.replicas import ReadYourWritesMiddleware, replica_stats, start_replicas, stop_replicas
+from lib.async_db import shutdown_db_executor
+from lib.ride_service import ride_cache_stats
+from lib.place_service import gazetteer_stats, start_gazetteer, stop_gazetteer
+from lib.pubsub import get_broker
+from lib.auth_service import session_cache_stats, start_session_sweeper, stop_session_sweeper
+from lib.analytics_service import analytics_stats, start_analytics_rollup, stop_analytics_rollup
+from lib.notification_service import (
+    hub_feed_stats,
+    start_outbox_dispatcher,
+    stop_outbox_dispatcher,
+)
 
 init_db()
 
+# pins a client's reads to the primary until replicas have its writes
+app.add_middleware(ReadYourWritesMiddleware)
+# per-client token buckets + global in-flight cap, ahead of all routes
+app.add_middleware(RateLimitMiddleware)
+
 # -------------------------------------------------
 # API Route Registration
 # -------------------------------------------------
@@ -44,6 +63,8 @@ from api.routes_bookings import router as bookings_router
 from api.routes_notifications import router as notifications_router
 from api.routes_ratings import router as ratings_router
 from api.routes_profile import router as profile_router
+from api.routes_analytics import router as analytics_router
+from api.routes_places import router as places_router
 
 app.include_router(auth_router, prefix="/auth", tags=["auth"])
 app.include_router(rides_router, prefix="/rides", tags=["Rides"])
@@ -51,6 +72,8 @@ app.include_router(bookings_router, prefix="/bookings", tags=["Bookings"])
 app.include_router(notifications_router, prefix="/notifications", tags=["Notifications"])
 app.include_router(ratings_router, prefix="/ratings", tags=["Ratings"])
 app.include_router(profile_router, prefix="/profile", tags=["Profile"])
+app.include_router(analytics_router, prefix="/analytics", tags=["Analytics"])
+app.include_router(places_router, prefix="/places", tags=["Places"])
 
 # -------------------------------------------------
 # Health Check Endpoint
@@ -60,7 +83,16 @@ def health_check():
     return {
         "status": "OK",
         "app": settings.APP_NAME,
-        "environment": settings.ENVIRONMENT
+        "environment": settings.ENVIRONMENT,
+        "db": db_stats(),
+        "replicas": replica_stats(),
+        "session_cache": session_cache_stats(),
+        "ride_cache": ride_cache_stats(),
+        "gazetteer": gazetteer_stats(),
+        "pubsub": get_broker().stats(),
+        "notification_hub": hub_feed_stats(),
+        "analytics": analytics_stats(),
+        "rate_limits": rate_limit_stats(),
     }
 
 # -------------------------------------------------
@@ -71,3 +103,27 @@ def on_startup():
     print("🌱 PoolRide Backend is starting...")
     print(f"Environment : {settings.ENVIRONMENT}")
     print(f"Database    : {settings.DB_TYPE}")
+    print(f"Schema      : v{schema_version()}")
+    writers = "1 writer" if get_driver().single_writer else f"up to {settings.DB_POOL_SIZE} writers"
+    print(f"DB pool     : {settings.DB_POOL_SIZE} read-only connections + {writers}")
+    for name, value in storage_report().items():
+        print(f"  {name:<13}: {value}")
+    start_replicas()
+    if settings.DB_REPLICA_MODE != "off":
+        print(f"Replicas    : {settings.DB_REPLICA_MODE}, max lag {settings.DB_REPLICA_MAX_LAG_SECONDS:g}s")
+
+    start_gazetteer()
+    start_session_sweeper()
+    start_outbox_dispatcher()
+    start_analytics_rollup()
+
+
+@app.on_event("shutdown")
+def on_shutdown():
+    stop_analytics_rollup()
+    stop_session_sweeper()
+    stop_gazetteer()
+    stop_outbox_dispatcher()
+    shutdown_db_executor()
+    stop_replicas()
+    close_pool()
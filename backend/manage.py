@@ -0,0 +1,105 @@
+"""
+PoolRide Backend - Maintenance Commands
+
+Run from the backend/ directory:
+    python manage.py rebuild-rating-stats
+    python manage.py verify-rating-stats
+    python manage.py rebuild-user-stats
+    python manage.py verify-user-stats
+    python manage.py rollup-analytics
+    python manage.py rebuild-analytics
+    python manage.py add-place-alias "<alias>" "<place name>"
+"""
+
+import argparse
+import sys
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from lib.db import init_db, close_pool
+from lib.analytics_service import rebuild_rollups, run_rollup
+from lib.auth_service import rebuild_profile_stats, verify_profile_stats
+from lib.place_service import add_place_alias
+from lib.rating_service import rebuild_rating_stats, verify_rating_stats
+
+
+def _report(name: str, mismatches: list) -> int:
+    if not mismatches:
+        print(f"{name}: OK")
+        return 0
+    print(f"{name}: {len(mismatches)} mismatch(es)")
+    for m in mismatches:
+        print("  ", m)
+    return 1
+
+
+# -------------------------------------------------
+# Commands
+# -------------------------------------------------
+def cmd_rebuild_rating_stats(args) -> int:
+    drivers = rebuild_rating_stats()
+    print(f"driver_rating_stats rebuilt for {drivers} driver(s)")
+    return 0
+
+
+def cmd_verify_rating_stats(args) -> int:
+    return _report("driver_rating_stats", verify_rating_stats())
+
+
+def cmd_rebuild_user_stats(args) -> int:
+    users = rebuild_profile_stats()
+    print(f"user_stats rebuilt for {users} user(s)")
+    return 0
+
+
+def cmd_verify_user_stats(args) -> int:
+    return _report("user_stats", verify_profile_stats())
+
+
+def cmd_rollup_analytics(args) -> int:
+    print(f"analytics: rolled up {run_rollup()} ride(s)")
+    return 0
+
+
+def cmd_rebuild_analytics(args) -> int:
+    print(f"analytics: rebuilt from {rebuild_rollups()} ride(s)")
+    return 0
+
+
+def cmd_add_place_alias(args) -> int:
+    if len(args.args) != 2:
+        print('usage: manage.py add-place-alias "<alias>" "<place name>"')
+        return 2
+    place_id, moved = add_place_alias(args.args[0], args.args[1])
+    print(f"places: '{args.args[0]}' -> place {place_id}, {moved} ride endpoint(s) moved")
+    return 0
+
+
+COMMANDS = {
+    "rebuild-rating-stats": cmd_rebuild_rating_stats,
+    "verify-rating-stats": cmd_verify_rating_stats,
+    "rebuild-user-stats": cmd_rebuild_user_stats,
+    "verify-user-stats": cmd_verify_user_stats,
+    "rollup-analytics": cmd_rollup_analytics,
+    "rebuild-analytics": cmd_rebuild_analytics,
+    "add-place-alias": cmd_add_place_alias,
+}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="PoolRide maintenance commands")
+    parser.add_argument("command", choices=sorted(COMMANDS))
+    parser.add_argument("args", nargs="*")
+    args = parser.parse_args(argv)
+
+    init_db()
+    try:
+        return COMMANDS[args.command](args)
+    finally:
+        close_pool()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,284 @@
+-- PoolRide schema for database.type = "postgres", equivalent to SQLite
+-- migrations 1-16 (lib/migrations.py). The PostgreSQL driver does not run
+-- migrations; provision a fresh database with
+--
+--     psql "$DATABASE_URL" -v ON_ERROR_STOP=1 -f backend/sql/postgres_schema.sql
+--
+-- Keep in step with lib/migrations.py: a new migration needs the same change
+-- here plus its schema_migrations row, or init_db refuses to start.
+--
+-- Column types mirror the SQLite ones: times are ISO 8601 TEXT in UTC (the
+-- services compare them as strings) and flags are 0/1 INTEGERs.
+-- SQLite-only indexes have no counterpart: ride search falls back from the
+-- FTS5 trigram index to LIKE scans, nearby search from the R*Tree to a
+-- bounding-box scan on idx_rides_from_geo.
+
+BEGIN;
+
+CREATE TABLE schema_migrations (
+    version INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    applied_at TEXT NOT NULL
+);
+
+-- -------------------------------------------------
+-- Core tables
+-- -------------------------------------------------
+CREATE TABLE users (
+    id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    name TEXT NOT NULL,
+    user_type TEXT NOT NULL,                 -- "campus" | "guest"
+    email TEXT UNIQUE,                       -- nullable for guest (phone-only)
+    phone TEXT UNIQUE,                       -- nullable for campus (email-only)
+    is_verified INTEGER NOT NULL DEFAULT 0,  -- OTP verified
+    created_at TEXT NOT NULL
+);
+
+CREATE TABLE otps (
+    id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    user_id BIGINT NOT NULL REFERENCES users(id),
+    code TEXT NOT NULL,
+    expires_at TEXT NOT NULL,
+    used INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL
+);
+
+CREATE TABLE places (
+    id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    name TEXT NOT NULL,
+    lat DOUBLE PRECISION,
+    lon DOUBLE PRECISION,
+    created_at TEXT NOT NULL
+);
+
+CREATE TABLE place_aliases (
+    id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    alias TEXT NOT NULL UNIQUE,            -- gazetteer.place_key() of a name
+    place_id BIGINT NOT NULL REFERENCES places(id)
+);
+
+CREATE TABLE rides (
+    id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    driver_id BIGINT NOT NULL REFERENCES users(id),
+    from_text TEXT NOT NULL,
+    to_text TEXT NOT NULL,
+    depart_time TEXT NOT NULL,
+    seats_total INTEGER NOT NULL,
+    seats_left INTEGER NOT NULL,
+    vehicle_type TEXT NOT NULL,
+    allow_guests INTEGER NOT NULL DEFAULT 0,
+    distance_km DOUBLE PRECISION NOT NULL,
+    created_at TEXT NOT NULL,
+    from_lat DOUBLE PRECISION,
+    from_lon DOUBLE PRECISION,
+    to_lat DOUBLE PRECISION,
+    to_lon DOUBLE PRECISION,
+    from_place_id BIGINT,
+    to_place_id BIGINT
+);
+
+CREATE TABLE bookings (
+    id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    ride_id BIGINT NOT NULL REFERENCES rides(id),
+    rider_id BIGINT NOT NULL REFERENCES users(id),
+    seats INTEGER NOT NULL,
+    status TEXT NOT NULL,                    -- "CONFIRMED" | "CANCELLED"
+    created_at TEXT NOT NULL,
+    cancelled_at TEXT
+);
+
+CREATE TABLE notifications (
+    id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    user_id BIGINT NOT NULL REFERENCES users(id),
+    title TEXT NOT NULL,
+    body TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    is_read INTEGER NOT NULL DEFAULT 0,
+    delivered_at TEXT
+);
+
+CREATE TABLE ratings (
+    id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    ride_id BIGINT NOT NULL REFERENCES rides(id),
+    rater_id BIGINT NOT NULL REFERENCES users(id),
+    driver_id BIGINT NOT NULL REFERENCES users(id),
+    stars INTEGER NOT NULL,
+    comment TEXT,
+    created_at TEXT NOT NULL
+);
+
+CREATE TABLE sessions (
+    token TEXT PRIMARY KEY,
+    user_id BIGINT NOT NULL,
+    created_at TEXT,
+    expires_at TEXT,
+    last_seen_at TEXT
+);
+
+-- id is not implicitly part of a PostgreSQL index, so the "newest first"
+-- pages get it as an explicit trailing column
+CREATE INDEX idx_bookings_rider ON bookings(rider_id, id);
+CREATE INDEX idx_bookings_ride_rider ON bookings(ride_id, rider_id);
+CREATE INDEX idx_notifications_user ON notifications(user_id, id);
+CREATE INDEX idx_ratings_driver ON ratings(driver_id);
+CREATE INDEX idx_rides_driver ON rides(driver_id);
+CREATE INDEX idx_rides_active_depart ON rides(depart_time, id) WHERE seats_left > 0;
+CREATE INDEX idx_rides_from_geo ON rides(from_lat, from_lon);
+CREATE INDEX idx_rides_route_places ON rides(from_place_id, to_place_id, depart_time, id);
+CREATE INDEX idx_sessions_user ON sessions(user_id);
+CREATE INDEX idx_sessions_expires ON sessions(expires_at);
+CREATE INDEX idx_notifications_undelivered ON notifications(id) WHERE delivered_at IS NULL;
+CREATE INDEX idx_notifications_user_unread ON notifications(user_id, id) WHERE is_read = 0;
+CREATE INDEX idx_place_aliases_place ON place_aliases(place_id);
+
+-- -------------------------------------------------
+-- Maintained aggregates (lib/aggregates.py)
+-- -------------------------------------------------
+CREATE TABLE driver_rating_stats (
+    driver_id BIGINT PRIMARY KEY REFERENCES users(id),
+    ratings_count INTEGER NOT NULL DEFAULT 0,
+    stars_sum INTEGER NOT NULL DEFAULT 0,
+    stars_1 INTEGER NOT NULL DEFAULT 0,
+    stars_2 INTEGER NOT NULL DEFAULT 0,
+    stars_3 INTEGER NOT NULL DEFAULT 0,
+    stars_4 INTEGER NOT NULL DEFAULT 0,
+    stars_5 INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT NOT NULL
+);
+
+CREATE TABLE user_stats (
+    user_id BIGINT PRIMARY KEY REFERENCES users(id),
+    rides_posted INTEGER NOT NULL DEFAULT 0,
+    rides_taken INTEGER NOT NULL DEFAULT 0,
+    co2_saved_g BIGINT NOT NULL DEFAULT 0,
+    updated_at TEXT NOT NULL
+);
+
+CREATE TABLE analytics_hourly (
+    hour TEXT PRIMARY KEY,                   -- "YYYY-MM-DDTHH" (UTC)
+    rides_offered INTEGER NOT NULL DEFAULT 0,
+    rides_shared INTEGER NOT NULL DEFAULT 0,
+    bookings INTEGER NOT NULL DEFAULT 0,
+    seats_offered INTEGER NOT NULL DEFAULT 0,
+    seats_booked INTEGER NOT NULL DEFAULT 0,
+    co2_saved_g BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE analytics_daily (
+    day TEXT PRIMARY KEY,                    -- "YYYY-MM-DD" (UTC)
+    rides_offered INTEGER NOT NULL DEFAULT 0,
+    rides_shared INTEGER NOT NULL DEFAULT 0,
+    bookings INTEGER NOT NULL DEFAULT 0,
+    seats_offered INTEGER NOT NULL DEFAULT 0,
+    seats_booked INTEGER NOT NULL DEFAULT 0,
+    co2_saved_g BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE analytics_route_daily (
+    day TEXT NOT NULL,
+    from_key TEXT NOT NULL,
+    to_key TEXT NOT NULL,
+    rides_offered INTEGER NOT NULL DEFAULT 0,
+    rides_shared INTEGER NOT NULL DEFAULT 0,
+    bookings INTEGER NOT NULL DEFAULT 0,
+    seats_offered INTEGER NOT NULL DEFAULT 0,
+    seats_booked INTEGER NOT NULL DEFAULT 0,
+    co2_saved_g BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, from_key, to_key)
+);
+
+CREATE TABLE analytics_user_daily (
+    day TEXT NOT NULL,
+    user_id BIGINT NOT NULL,
+    rides_driven INTEGER NOT NULL DEFAULT 0,
+    seats_filled INTEGER NOT NULL DEFAULT 0,
+    rides_taken INTEGER NOT NULL DEFAULT 0,
+    co2_saved_g BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, user_id)
+);
+
+CREATE TABLE analytics_ride_facts (
+    ride_id BIGINT PRIMARY KEY,
+    hour TEXT NOT NULL,
+    day TEXT NOT NULL,
+    from_key TEXT NOT NULL,
+    to_key TEXT NOT NULL,
+    driver_id BIGINT NOT NULL,
+    rides_offered INTEGER NOT NULL DEFAULT 0,
+    rides_shared INTEGER NOT NULL DEFAULT 0,
+    bookings INTEGER NOT NULL DEFAULT 0,
+    seats_offered INTEGER NOT NULL DEFAULT 0,
+    seats_booked INTEGER NOT NULL DEFAULT 0,
+    co2_saved_g BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE analytics_ride_riders (
+    ride_id BIGINT NOT NULL,
+    rider_id BIGINT NOT NULL,
+    bookings INTEGER NOT NULL,
+    co2_saved_g BIGINT NOT NULL,
+    PRIMARY KEY (ride_id, rider_id)
+);
+
+CREATE TABLE analytics_dirty_rides (ride_id BIGINT PRIMARY KEY);
+
+-- rides whose rollup contribution must be recomputed, like the SQLite triggers
+CREATE FUNCTION analytics_mark_ride_dirty() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'bookings' THEN
+        INSERT INTO analytics_dirty_rides (ride_id) VALUES (NEW.ride_id) ON CONFLICT (ride_id) DO NOTHING;
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO analytics_dirty_rides (ride_id) VALUES (OLD.id) ON CONFLICT (ride_id) DO NOTHING;
+    ELSE
+        INSERT INTO analytics_dirty_rides (ride_id) VALUES (NEW.id) ON CONFLICT (ride_id) DO NOTHING;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER analytics_rides_dirty AFTER INSERT OR UPDATE OR DELETE ON rides
+    FOR EACH ROW EXECUTE FUNCTION analytics_mark_ride_dirty();
+CREATE TRIGGER analytics_bookings_ai AFTER INSERT ON bookings
+    FOR EACH ROW EXECUTE FUNCTION analytics_mark_ride_dirty();
+CREATE TRIGGER analytics_bookings_au AFTER UPDATE OF status ON bookings
+    FOR EACH ROW EXECUTE FUNCTION analytics_mark_ride_dirty();
+
+CREATE TABLE user_action_counters (
+    user_id BIGINT NOT NULL,
+    action TEXT NOT NULL,
+    bucket_start BIGINT NOT NULL,            -- unix seconds
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, action, bucket_start)
+);
+
+-- filled from settings by init_db at every start (co2_service.sync_emission_factors)
+CREATE TABLE vehicle_emission_factors (
+    vehicle_type TEXT PRIMARY KEY,           -- as in VEHICLE_TYPE_FACTORS; '' = default
+    kg_per_km DOUBLE PRECISION NOT NULL
+);
+
+-- -------------------------------------------------
+-- Version record checked by init_db
+-- -------------------------------------------------
+INSERT INTO schema_migrations (version, name, applied_at)
+SELECT v, n, to_char(now() AT TIME ZONE 'UTC', 'YYYY-MM-DD"T"HH24:MI:SS.US"+00:00"')
+FROM (VALUES
+    (1, 'base_schema'),
+    (2, 'sessions_table'),
+    (3, 'hot_path_indexes'),
+    (4, 'rides_search_index'),
+    (5, 'session_expiry'),
+    (6, 'notification_outbox'),
+    (7, 'notifications_unread_index'),
+    (8, 'driver_rating_stats'),
+    (9, 'user_stats'),
+    (10, 'analytics_rollups'),
+    (11, 'user_action_counters'),
+    (12, 'ride_coordinates'),
+    (13, 'places'),
+    (14, 'utc_depart_times'),
+    (15, 'place_key_rules'),
+    (16, 'vehicle_emission_factors')
+) AS m(v, n);
+
+COMMIT;
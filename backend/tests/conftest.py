@@ -0,0 +1,37 @@
+"""
+Shared setup: every test module runs against one throwaway SQLite
+database, configured before lib.settings is first imported.
+"""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+os.environ["DB_PATH"] = str(Path(tempfile.mkdtemp()) / "test.db")
+os.environ["DB_TYPE"] = "sqlite"
+os.environ["DB_REPLICA_MODE"] = "off"
+os.environ["RATE_LIMIT_ENABLED"] = "false"
+os.environ["NOTIFICATION_DELIVERY_MODE"] = "sync"
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+
+    import main
+
+    with TestClient(main.app) as c:
+        yield c
+
+
+def login(client, name: str) -> dict:
+    """Bearer headers for a new campus user."""
+    user = client.post(
+        "/auth/login",
+        json={"name": name, "contact": f"{name.lower()}@college.edu", "user_type": "campus"},
+    ).json()
+    return {"Authorization": f"Bearer {user['token']}"}
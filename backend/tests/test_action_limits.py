@@ -0,0 +1,47 @@
+"""
+Sliding-window quotas: a bucket stops counting exactly when retry_after
+said it would, for both the 24 h booking and the 7 d cancellation window.
+"""
+
+import pytest
+
+from lib.db import run_write
+from lib.limits_service import ACTION_LIMITS, BOOKING, CANCELLATION, LimitExceededError, consume
+
+# mid-bucket, so bucket rounding shows up in retry_after
+T0 = 1_800_000_000 + 30
+
+
+@pytest.mark.parametrize("action, user_id", [(BOOKING, 900_001), (CANCELLATION, 900_002)])
+def test_buckets_expire_when_retry_after_says(client, action, user_id):
+    rule = ACTION_LIMITS[action]
+    assert rule.limit >= 2
+    first_bucket = T0 - T0 % rule.bucket_seconds
+    later = T0 + 3600
+
+    def use(now):
+        run_write(consume, user_id, action, now)
+
+    def refused_for(now):
+        with pytest.raises(LimitExceededError) as exc:
+            use(now)
+        return exc.value.retry_after
+
+    use(T0)
+    for _ in range(rule.limit - 1):
+        use(later)
+
+    retry_after = refused_for(later)
+    assert retry_after == first_bucket + rule.window_seconds + rule.bucket_seconds - later
+    assert rule.window_seconds - 3600 < retry_after <= rule.window_seconds - 3600 + rule.bucket_seconds
+
+    # one second early the first bucket still counts
+    assert refused_for(later + retry_after - 1) == 1
+    # on time it has slid out: exactly one use is free again
+    use(later + retry_after)
+    second = refused_for(later + retry_after)
+    # ... until the bucket holding the rest leaves the window too
+    later_bucket = later - later % rule.bucket_seconds
+    assert second == later_bucket + rule.window_seconds + rule.bucket_seconds - (later + retry_after)
+    for _ in range(rule.limit - 1):
+        use(later + retry_after + second)
@@ -0,0 +1,43 @@
+"""
+Concurrent bookings for the last seats of a ride: exactly as many succeed
+as there are seats, the rest get 409, and user_stats stays consistent.
+"""
+
+import threading
+from datetime import datetime, timedelta, timezone
+
+from conftest import login
+from lib.auth_service import verify_profile_stats
+
+SEATS = 3
+RIDERS = 12
+
+
+def test_last_seats_are_not_oversold(client):
+    driver = login(client, "RaceDriver")
+    riders = [login(client, f"RaceRider{i}") for i in range(RIDERS)]
+    depart = (datetime.now(timezone.utc) + timedelta(hours=2)).isoformat()
+    ride = client.post(
+        "/rides/",
+        json={"from_text": "Hostel", "to_text": "Station", "depart_time": depart,
+              "seats_total": SEATS, "distance_km": 6},
+        headers=driver,
+    ).json()
+
+    start = threading.Barrier(RIDERS)
+    codes = []
+
+    def book(headers):
+        start.wait()
+        res = client.post("/bookings/", json={"ride_id": ride["id"], "seats": 1}, headers=headers)
+        codes.append(res.status_code)
+
+    threads = [threading.Thread(target=book, args=(h,)) for h in riders]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sorted(codes) == [200] * SEATS + [409] * (RIDERS - SEATS)
+    assert client.get(f"/rides/{ride['id']}").json()["seats_left"] == 0
+    assert verify_profile_stats() == []
@@ -0,0 +1,66 @@
+"""
+CO2 estimated in SQL (booking lists, user_stats rebuilds) must equal the
+Python estimate that maintains the running totals, to the gram.
+"""
+
+import random
+from datetime import datetime, timedelta, timezone
+
+from conftest import login
+from lib.auth_service import verify_profile_stats
+from lib.co2_service import (
+    EMISSION_FACTORS_JOIN,
+    estimate_co2_saved,
+    estimate_co2_saved_batch,
+    estimate_co2_saved_g,
+    factor_table,
+    ride_co2_saved_g_sql,
+    ride_passengers,
+)
+from lib.db import run_write
+
+
+def test_sql_matches_python(client):
+    rng = random.Random(16)
+    vehicle_types = sorted(factor_table()) + ["unknown"]
+    # dyadic distances make exact half-gram ties likely
+    rows = [
+        (i, rng.choice([rng.uniform(0, 60), 0.25, 0.5, 1.0, 2.5, 8.0]), rng.choice(vehicle_types), st, rng.randint(0, st))
+        for i, st in enumerate(rng.randint(1, 8) for _ in range(5000))
+    ]
+
+    def estimate_in_sql(con):
+        con.execute(
+            "CREATE TEMPORARY TABLE co2_rides (id INTEGER, distance_km REAL, vehicle_type TEXT, "
+            "seats_total INTEGER, seats_left INTEGER)"
+        )
+        con.executemany("INSERT INTO co2_rides VALUES (?, ?, ?, ?, ?)", rows)
+        found = con.execute(
+            f"SELECT {ride_co2_saved_g_sql()} FROM co2_rides r {EMISSION_FACTORS_JOIN} ORDER BY r.id"
+        ).fetchall()
+        con.execute("DROP TABLE co2_rides")
+        return [int(r[0]) for r in found]
+
+    expected = [estimate_co2_saved_g(d, vt, ride_passengers(st, sl)) for _, d, vt, st, sl in rows]
+    assert run_write(estimate_in_sql) == expected
+
+
+def test_batch_matches_scalar():
+    args = ([0.5, 2.5, 13.7, 0.0], ["car", "bike", "unknown", "car"], [2, 3, 1, 4])
+    assert estimate_co2_saved_batch(*args) == [estimate_co2_saved(*a) for a in zip(*args)]
+
+
+def test_booking_list_and_profile_totals(client):
+    driver, rider = login(client, "Co2Driver"), login(client, "Co2Rider")
+    depart = (datetime.now(timezone.utc) + timedelta(hours=3)).isoformat()
+    ride = client.post(
+        "/rides/",
+        json={"from_text": "Hostel", "to_text": "Airport", "depart_time": depart,
+              "seats_total": 4, "distance_km": 0.5, "vehicle_type": "car"},
+        headers=driver,
+    ).json()
+    assert client.post("/bookings/", json={"ride_id": ride["id"], "seats": 1}, headers=rider).status_code == 200
+
+    bookings = client.get("/bookings/me", headers=rider).json()["bookings"]
+    assert [b["co2_saved_kg_est"] for b in bookings] == [estimate_co2_saved(0.5, "car", 2)]
+    assert verify_profile_stats() == []
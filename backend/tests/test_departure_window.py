@@ -0,0 +1,43 @@
+"""
+The departure window of ride search compares at the microsecond precision
+departure times are stored with: depart_after is inclusive, depart_before
+exclusive.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+from conftest import login
+from lib.utils import db_time, db_time_bound
+
+
+def test_bound_orders_like_stored_times():
+    whole = datetime(2026, 10, 18, 12, 0, 0, tzinfo=timezone.utc)
+    later = whole + timedelta(microseconds=500_000)
+    assert db_time(whole) >= db_time_bound(whole) and not db_time(whole) < db_time_bound(whole)
+    assert db_time(whole) < db_time_bound(later) < db_time(later)
+    assert db_time_bound(later) > db_time(whole)
+
+
+def test_search_window_is_exact_below_one_second(client):
+    driver = login(client, "WindowDriver")
+    whole = (datetime.now(timezone.utc) + timedelta(hours=5)).replace(microsecond=0)
+    depart = whole + timedelta(microseconds=500_000)
+    ride = client.post(
+        "/rides/",
+        json={"from_text": "Window Hostel", "to_text": "Window Park", "depart_time": depart.isoformat(),
+              "seats_total": 2, "distance_km": 3},
+        headers=driver,
+    ).json()
+
+    def found(**window):
+        params = {"from_q": "window hostel", "to_q": "window park"}
+        params.update({k: v.isoformat() for k, v in window.items()})
+        res = client.get("/rides/search", params=params)
+        assert res.status_code == 200, res.text
+        return ride["id"] in {r["id"] for r in res.json()["rides"]}
+
+    tick = timedelta(microseconds=200_000)
+    assert found(depart_after=depart) and found(depart_after=depart - tick)
+    assert not found(depart_after=depart + tick)
+    assert found(depart_before=depart + tick)
+    assert not found(depart_before=depart) and not found(depart_before=depart - tick)
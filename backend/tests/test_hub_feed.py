@@ -0,0 +1,45 @@
+"""
+The per-process hub feed: idle (no queries) without subscribers, and on a
+single-writer database its floor follows the last id published.
+"""
+
+import asyncio
+
+from lib.db import run_write
+from lib.notification_service import HubFeed, add_notification
+from lib.pubsub import get_broker, user_channel
+
+
+def _notify(user_id: int, title: str) -> None:
+    run_write(add_notification, user_id, title, "body")
+
+
+def test_idle_without_subscribers(client):
+    feed = HubFeed()
+    _notify(1, "nobody listens")
+    assert feed.poll() == 0
+    assert feed.stats()["idle"] is True
+
+
+def test_subscriber_gets_new_notifications(client):
+    feed = HubFeed()
+
+    async def scenario():
+        sub = get_broker().subscribe(user_channel(1))
+        try:
+            newest = feed.attach()
+            _notify(1, "first")
+            _notify(2, "other user")
+            assert feed.poll() == 2
+            n = await sub.get(timeout=1)
+            assert n["title"] == "first" and n["id"] > newest
+            stats = feed.stats()
+            # sqlite commits ids in order: nothing left to re-read
+            assert stats["floor_id"] == n["id"] + 1 and stats["tracked"] == 0
+            assert feed.poll() == 0
+        finally:
+            sub.close()
+        assert feed.poll() == 0
+        assert feed.stats()["idle"] is True
+
+    asyncio.run(scenario())
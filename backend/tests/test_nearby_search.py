@@ -0,0 +1,70 @@
+"""
+Nearby search ranks every ride in the bounding boxes, however many, and
+its (score, id) cursor pages through that ranking without gaps or repeats.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+from conftest import login
+
+PICKUP = (12.9000, 20.1000)
+DROPOFF = (12.9500, 20.1500)
+SIDE_ROAD = 0.004  # degrees, a few hundred metres off the route
+RIDES = 520
+
+
+def _nearby(client, **params):
+    res = client.get(
+        "/rides/nearby",
+        params={"from_lat": PICKUP[0], "from_lon": PICKUP[1], "to_lat": DROPOFF[0], "to_lon": DROPOFF[1],
+                "radius_km": 2, **params},
+    )
+    assert res.status_code == 200, res.text
+    return res.json()
+
+
+def test_ranks_past_the_first_candidates_and_pages_stably(client):
+    driver = login(client, "NearbyDriver")
+    depart = (datetime.now(timezone.utc) + timedelta(hours=4)).replace(microsecond=0)
+
+    def offer(i, offset):
+        res = client.post(
+            "/rides/",
+            json={"from_text": f"Side road {i}", "to_text": "Far end", "depart_time": depart.isoformat(),
+                  "seats_total": 2, "distance_km": 6,
+                  "from_lat": PICKUP[0] + offset, "from_lon": PICKUP[1],
+                  "to_lat": DROPOFF[0], "to_lon": DROPOFF[1]},
+            headers=driver,
+        )
+        assert res.status_code == 200, res.text
+        return res.json()["id"]
+
+    for i in range(RIDES - 1):
+        offer(i, SIDE_ROAD * (1 + i % 5) / 5)
+    # offered last, yet the only ride without a detour
+    best = offer(RIDES, 0.0)
+
+    window = {"depart_at": depart.isoformat()}
+    first = _nearby(client, limit=1, **window)
+    assert [r["id"] for r in first["rides"]] == [best]
+
+    seen, params = [], {"limit": 37, **window}
+    while True:
+        page = _nearby(client, **params)
+        seen += page["rides"]
+        if page["next_cursor"] is None:
+            break
+        params["cursor"] = page["next_cursor"]
+    ids = [r["id"] for r in seen]
+    assert len(ids) == len(set(ids)) == RIDES
+    keys = [(r["detour_km"], r["id"]) for r in seen]
+    assert keys == sorted(keys)
+
+
+def test_rejects_a_malformed_cursor(client):
+    res = client.get(
+        "/rides/nearby",
+        params={"from_lat": PICKUP[0], "from_lon": PICKUP[1], "to_lat": DROPOFF[0], "to_lon": DROPOFF[1],
+                "cursor": "WzVd"},
+    )
+    assert res.status_code == 400
@@ -0,0 +1,107 @@
+"""
+Ride search by known places must not lose the fuzzy text matches, and
+place names that differ only by abbreviation or a leading "the" resolve
+to one place.
+
+Run from the backend/ directory:
+    python -m pytest -q tests
+"""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from conftest import login
+from lib.db import run_write
+from lib.gazetteer import place_key, rekey_place_aliases
+from lib.place_service import resolve_route, sync_gazetteer
+
+
+@pytest.fixture(scope="module")
+def driver(client):
+    return login(client, "PlaceDriver")
+
+
+def _offer(client, headers, from_text, to_text, hours):
+    depart = (datetime.now(timezone.utc) + timedelta(hours=hours)).isoformat()
+    res = client.post(
+        "/rides/",
+        json={"from_text": from_text, "to_text": to_text, "depart_time": depart, "seats_total": 3, "distance_km": 4},
+        headers=headers,
+    )
+    assert res.status_code == 200, res.text
+    return res.json()["id"]
+
+
+def _search(client, from_q, to_q):
+    res = client.get("/rides/search", params={"from_q": from_q, "to_q": to_q})
+    assert res.status_code == 200, res.text
+    return {r["id"] for r in res.json()["rides"]}
+
+
+@pytest.fixture(scope="module")
+def rides(client, driver):
+    return {
+        "gate_mall": _offer(client, driver, "Main Gate", "Mall", 1),
+        "gate_city_mall": _offer(client, driver, "Main Gate", "City Mall", 2),
+        "campus_gate_city_mall": _offer(client, driver, "Campus Main Gate", "City Mall", 3),
+        "library_stadium": _offer(client, driver, "Library", "Stadium", 4),
+    }
+
+
+def test_known_places_keep_fuzzy_matches(client, rides):
+    assert resolve_route("main gate", "mall") is not None
+    assert _search(client, "main gate", "mall") == {
+        rides["gate_mall"], rides["gate_city_mall"], rides["campus_gate_city_mall"],
+    }
+
+
+def test_known_places_keep_longer_names(client, rides):
+    assert resolve_route("main gate", "city mall") is not None
+    assert _search(client, "main gate", "city mall") == {
+        rides["gate_city_mall"], rides["campus_gate_city_mall"],
+    }
+
+
+def test_place_match_without_text_match(client, driver, rides):
+    ride_id = _offer(client, driver, "Main Gate", "The Mall", 5)
+    # "The Mall" is the Mall place, though "mall" is no text match for it here
+    assert resolve_route("main gate", "the mall") == resolve_route("main gate", "mall")
+    assert ride_id in _search(client, "Main-Gate", "the mall")
+
+
+def test_place_key_rules():
+    assert place_key("Station Rd.") == place_key("station road") == "station road"
+    assert place_key("The Mall") == place_key("mall")
+    assert place_key("St. Mary's Coll") == "street marys college"
+    assert place_key("Arts & Science Bldg") == "arts and science building"
+    assert place_key("the") == "the"
+    # the word being typed stays a prefix
+    assert place_key("stadium st", partial=True) == "stadium st"
+
+
+def test_autocomplete_keeps_abbreviation_prefixes(client, rides):
+    names = [p["name"] for p in client.get("/places/autocomplete", params={"q": "st"}).json()["places"]]
+    assert "Stadium" in names
+
+
+def test_rekey_merges_places_with_the_same_key(client, driver, rides):
+    old_style = run_write(
+        lambda con: con.execute(
+            "INSERT INTO places (name, created_at) VALUES ('Station Rd', '2026-01-01T00:00:00+00:00') RETURNING id"
+        ).fetchone()[0]
+    )
+    new_style = _offer(client, driver, "Station Road", "Library", 6)
+
+    def legacy_alias(con):
+        # a key stored before abbreviations were spelled out
+        con.execute("INSERT INTO place_aliases (alias, place_id) VALUES ('station rd', ?)", (old_style,))
+        con.execute("UPDATE rides SET from_place_id=? WHERE id=?", (old_style, new_style))
+
+    run_write(legacy_alias)
+    run_write(rekey_place_aliases)
+    sync_gazetteer()
+
+    route = resolve_route("Station Rd", "Library")
+    assert route is not None and route[0] == old_style
+    assert new_style in _search(client, "station road", "library")
@@ -0,0 +1,122 @@
+"""
+Token buckets refill at their configured rate; the middleware answers 429
+when a bucket is empty and 503 when every concurrency slot is taken, both
+with a Retry-After header.
+"""
+
+import asyncio
+
+import pytest
+
+from lib.rate_limit import (
+    BucketRule,
+    InMemoryRateLimitBackend,
+    RateLimitMiddleware,
+    RouteGroup,
+    get_rate_limit_backend,
+    rate_limit_stats,
+    set_rate_limit_backend,
+)
+
+ONE_PER_SECOND = BucketRule(rate_per_second=1.0, burst=2)
+
+
+@pytest.fixture
+def backend():
+    previous = get_rate_limit_backend()
+    fresh = InMemoryRateLimitBackend()
+    set_rate_limit_backend(fresh)
+    yield fresh
+    set_rate_limit_backend(previous)
+
+
+def test_bucket_refills_at_its_rate():
+    backend = InMemoryRateLimitBackend()
+    key = [("k", ONE_PER_SECOND)]
+    assert backend.take(key, 100.0) == 0.0
+    assert backend.take(key, 100.0) == 0.0
+    assert backend.take(key, 100.0) == pytest.approx(1.0)
+    # a refused request spends nothing; half a second refills half a token
+    assert backend.take(key, 100.5) == pytest.approx(0.5)
+    assert backend.take(key, 101.0) == 0.0
+    # idle time refills up to the burst, no further
+    assert backend.take(key, 200.0) == 0.0
+    assert backend.take(key, 200.0) == 0.0
+    assert backend.take(key, 200.0) > 0.0
+
+
+def test_a_refused_request_spends_from_no_bucket():
+    backend = InMemoryRateLimitBackend()
+    tight, loose = ("tight", BucketRule(1.0, 1)), ("loose", BucketRule(1.0, 5))
+    assert backend.take([tight, loose], 0.0) == 0.0
+    assert backend.take([tight, loose], 0.0) > 0.0
+    assert backend._buckets["loose"][0] == pytest.approx(4.0)
+
+
+async def _request(app, path, client=("10.0.0.1", 1234)):
+    scope = {"type": "http", "path": path, "headers": [], "client": client}
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receive, send)
+    start = sent[0]
+    return start["status"], dict(start["headers"])
+
+
+def _middleware(app, max_concurrent=0):
+    group = RouteGroup("api", ("/",), per_token=None, per_ip=ONE_PER_SECOND)
+    return RateLimitMiddleware(app, groups=[group], max_concurrent=max_concurrent, enabled=True)
+
+
+async def _ok(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+def test_empty_bucket_is_429_with_retry_after(backend):
+    limited = _middleware(_ok)
+
+    async def scenario():
+        return [await _request(limited, "/rides/") for _ in range(3)]
+
+    (s1, _), (s2, _), (s3, headers) = asyncio.run(scenario())
+    assert (s1, s2, s3) == (200, 200, 429)
+    assert headers[b"retry-after"] == b"1"
+    assert rate_limit_stats()["rejected_rate_limited"] == 1
+
+
+def test_no_free_slot_is_503_with_retry_after(backend):
+    async def scenario():
+        entered, release = asyncio.Event(), asyncio.Event()
+
+        async def slow(scope, receive, send):
+            entered.set()
+            await release.wait()
+            await _ok(scope, receive, send)
+
+        limited = _middleware(slow, max_concurrent=1)
+        first = asyncio.create_task(_request(limited, "/rides/", ("10.0.0.2", 1)))
+        await entered.wait()
+        second = await _request(limited, "/rides/", ("10.0.0.3", 1))
+        release.set()
+        return await first, second, limited.stats()
+
+    (s1, _), (s2, headers), stats = asyncio.run(scenario())
+    assert (s1, s2) == (200, 503)
+    assert headers[b"retry-after"] == b"1"
+    assert stats["rejected_overloaded"] == 1 and stats["in_flight"] == 0
+
+
+def test_stats_follow_the_newest_middleware():
+    old = _middleware(_ok)
+    new = _middleware(_ok)
+    new.rejected_rate = 7
+    assert rate_limit_stats()["rejected_rate_limited"] == 7
+    del new
+    assert rate_limit_stats()["enabled"] is False
+    assert old.enabled
@@ -0,0 +1,50 @@
+"""
+Group commit in the writer thread: a job that raises is rolled back alone
+(its SAVEPOINT), and the jobs committed with it in the same transaction
+keep their writes.
+"""
+
+import threading
+
+import pytest
+
+from lib.db import WriteExecutor
+from lib.drivers import get_driver
+
+
+def test_failing_job_does_not_roll_back_its_group(client):
+    writer = WriteExecutor(get_driver(), batch_size=8)
+    running, release = threading.Event(), threading.Event()
+
+    def hold(con):
+        con.execute("CREATE TABLE IF NOT EXISTS write_group_probe (v TEXT)")
+        running.set()
+        release.wait(5)
+
+    def insert(con, v):
+        con.execute("INSERT INTO write_group_probe (v) VALUES (?)", (v,))
+        return v
+
+    def insert_then_fail(con, v):
+        insert(con, v)
+        raise ValueError("rejected")
+
+    try:
+        # the writer is busy with `hold`, so the next three queue up as one group
+        first = writer.submit(hold)
+        assert running.wait(5)
+        group = [writer.submit(insert, "a"), writer.submit(insert_then_fail, "b"), writer.submit(insert, "c")]
+        release.set()
+        first.result(5)
+
+        assert group[0].result(5) == "a"
+        with pytest.raises(ValueError):
+            group[1].result(5)
+        assert group[2].result(5) == "c"
+
+        rows = writer.run(lambda con: [r[0] for r in con.execute("SELECT v FROM write_group_probe ORDER BY v")])
+        assert rows == ["a", "c"]
+        stats = writer.stats()
+        assert stats["transactions"] == 3 and stats["failed_jobs"] == 1
+    finally:
+        writer.close()
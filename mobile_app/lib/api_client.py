@@ -41,8 +41,10 @@ class ApiClient:
         return r.json()
 
     # ---------- RIDES ----------
-    def search_rides(self, from_q: str, to_q: str) -> Dict[str, Any]:
+    def search_rides(self, from_q: str, to_q: str, cursor: Optional[str] = None) -> Dict[str, Any]:
         params = {"from_q": from_q, "to_q": to_q}
+        if cursor:
+            params["cursor"] = cursor
         r = requests.get(self._url("/rides/search"), params=params, timeout=self.timeout)
         if r.status_code >= 400:
             raise ValueError(f"{r.status_code} {r.text}")
@@ -80,8 +82,24 @@ class ApiClient:
         return r.json()
 
     # ---------- NOTIFICATIONS ----------
-    def my_notifications(self, token: str) -> Dict[str, Any]:
-        r = requests.get(self._url("/notifications/me"), headers=self._headers(token), timeout=self.timeout)
+    def my_notifications(self, token: str, cursor: Optional[str] = None, unread_only: bool = False) -> Dict[str, Any]:
+        params: Dict[str, Any] = {"unread_only": unread_only}
+        if cursor:
+            params["cursor"] = cursor
+        r = requests.get(self._url("/notifications/me"), params=params, headers=self._headers(token), timeout=self.timeout)
+        if r.status_code >= 400:
+            raise ValueError(f"{r.status_code} {r.text}")
+        return r.json()
+
+    def unread_count(self, token: str) -> Dict[str, Any]:
+        r = requests.get(self._url("/notifications/me/unread_count"), headers=self._headers(token), timeout=self.timeout)
+        if r.status_code >= 400:
+            raise ValueError(f"{r.status_code} {r.text}")
+        return r.json()
+
+    def mark_all_notifications_read(self, token: str, up_to_id: Optional[int] = None) -> Dict[str, Any]:
+        params = {"up_to_id": up_to_id} if up_to_id is not None else None
+        r = requests.post(self._url("/notifications/me/read_all"), params=params, headers=self._headers(token), timeout=self.timeout)
         if r.status_code >= 400:
             raise ValueError(f"{r.status_code} {r.text}")
         return r.json()
@@ -104,3 +122,17 @@ class ApiClient:
         if r.status_code >= 400:
             raise ValueError(f"{r.status_code} {r.text}")
         return r.json()
+
+    # ---------- ANALYTICS ----------
+    def campus_totals(self, start: Optional[str] = None, end: Optional[str] = None) -> Dict[str, Any]:
+        params = {k: v for k, v in (("start", start), ("end", end)) if v}
+        r = requests.get(self._url("/analytics/totals"), params=params, timeout=self.timeout)
+        if r.status_code >= 400:
+            raise ValueError(f"{r.status_code} {r.text}")
+        return r.json()
+
+    def leaderboard(self, metric: str = "co2_saved_kg", limit: int = 10) -> Dict[str, Any]:
+        r = requests.get(self._url("/analytics/leaderboard"), params={"metric": metric, "limit": limit}, timeout=self.timeout)
+        if r.status_code >= 400:
+            raise ValueError(f"{r.status_code} {r.text}")
+        return r.json()
@@ -670,6 +670,8 @@ def main(page: ft.Page):
 
         results = ft.Column(spacing=10)
         loading = ft.ProgressRing(visible=True)
+        paging = {"next_cursor": None, "newest_id": None}
+        load_more_btn = ft.TextButton("Load older", visible=False, on_click=lambda e: load(paging["next_cursor"]))
 
         def mark_read(nid: int):
             try:
@@ -679,13 +681,26 @@ def main(page: ft.Page):
             except Exception as ex:
                 snack(f"Mark read failed: {ex}", ok=False)
 
-        def load():
+        def mark_all_read(_):
             try:
-                res = api.my_notifications(state["token"])
-                notifs = res.get("notifications", [])
+                api.mark_all_notifications_read(state["token"], up_to_id=paging["newest_id"])
+                snack("All marked as read ✅", ok=True)
+                show_notifications()
+            except Exception as ex:
+                snack(f"Mark all read failed: {ex}", ok=False)
 
-                results.controls.clear()
-                if not notifs:
+        def load(cursor=None):
+            try:
+                res = api.my_notifications(state["token"], cursor=cursor)
+                notifs = res.get("notifications", [])
+                paging["next_cursor"] = res.get("next_cursor")
+                load_more_btn.visible = bool(paging["next_cursor"])
+
+                if cursor is None:
+                    results.controls.clear()
+                    if notifs:
+                        paging["newest_id"] = int(notifs[0].get("id"))
+                if not notifs and cursor is None:
                     results.controls.append(ft.Text("No notifications.", color="#6B6B6B"))
                     return
 
@@ -735,9 +750,16 @@ def main(page: ft.Page):
                 ft.Container(
                     content=ft.Column(
                         [
-                            ft.Text("Your updates 🔔", size=18, weight=ft.FontWeight.BOLD),
+                            ft.Row(
+                                [
+                                    ft.Text("Your updates 🔔", size=18, weight=ft.FontWeight.BOLD),
+                                    ft.TextButton("Mark all read", on_click=mark_all_read),
+                                ],
+                                alignment=ft.MainAxisAlignment.SPACE_BETWEEN,
+                            ),
                             ft.Row([loading], alignment=ft.MainAxisAlignment.CENTER),
                             results,
+                            load_more_btn,
                             ft.TextButton("Back", on_click=lambda e: show_home()),
                         ],
                         spacing=10,